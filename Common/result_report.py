@@ -0,0 +1,194 @@
+import csv
+import logging
+import os
+import sqlite3
+import sys
+from Common.result_sink import RESULT_COLUMNS
+from Common.stats import ChannelStats
+from Common.tolerance import parse_range
+
+
+def _column_names(header, width):
+    """
+    按位置补齐列名：旧结果文件的表头只有RESULT_COLUMNS的6列，之后追加的行在第7列带有run_id
+    :param header: 文件中的表头
+    :param width: 行的列数
+    :return: 列名列表
+    """
+    default = RESULT_COLUMNS + ['run_id']
+    names = list(header or ())
+    names += [None] * (width - len(names))
+    return [name if name is not None or index >= len(default) else default[index]
+            for index, name in enumerate(names)]
+
+
+def iter_results(path, table='results'):
+    """
+    逐行读取结果文件（.xlsx/.csv/.db），不一次性载入内存，跳过旧文件中的空白分割行。
+    xlsx表头缺少的列按位置取RESULT_COLUMNS和run_id的列名
+    :param path: 结果文件路径
+    :param table: SQLite表名
+    :return: 生成器，每行为 {列名: 值}
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.xlsx':
+        import openpyxl
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            names = _column_names(header, 0)
+            for row in rows:
+                if len(row) > len(names):
+                    names = _column_names(header, len(row))
+                yield dict(zip(names, row))
+        finally:
+            workbook.close()
+    elif extension == '.csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+    elif extension in ('.db', '.sqlite'):
+        conn = sqlite3.connect(path)
+        try:
+            cursor = conn.execute(f'SELECT * FROM "{table}"')
+            header = [column[0] for column in cursor.description]
+            for row in cursor:
+                yield dict(zip(header, row))
+        finally:
+            conn.close()
+    else:
+        raise ValueError(f"不支持的结果文件类型: {extension}")
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PointSummary:
+    def __init__(self):
+        """
+        一个汇总单元（一个通道，或一个通道的一个测试点）的累计值，占用内存与结果行数无关
+        """
+        self.total = 0
+        self.passed = 0
+        # 实测值与范围中心的误差
+        self.error = ChannelStats(1)
+        self.worst = None
+        self.worst_error = -1.0
+        # 首批次与最近一个批次的实测值，用于计算批次间漂移；没有run_id的行（旧结果文件）不参与漂移计算
+        self.first_run = self.last_run = None
+        self.unbatched = 0
+        self.first = ChannelStats(1)
+        self.last = ChannelStats(1)
+
+    def update(self, row, measurement, error):
+        self.total += 1
+        if row.get("判定结果") == "合格":
+            self.passed += 1
+        if error is None:
+            return
+        self.error.update(error)
+        if abs(error) > self.worst_error:
+            self.worst_error = abs(error)
+            self.worst = row
+        run_id = row.get("run_id")
+        if run_id in (None, ""):
+            self.unbatched += 1
+            return
+        if self.first_run is None:
+            self.first_run = run_id
+        if run_id == self.first_run:
+            self.first.update(measurement)
+        else:
+            if run_id != self.last_run:
+                self.last_run = run_id
+                self.last = ChannelStats(1)
+            self.last.update(measurement)
+
+    @property
+    def pass_rate(self):
+        return self.passed / self.total if self.total else None
+
+    @property
+    def drift(self):
+        """最近一个批次与首批次实测均值之差，只有一个批次（或所有行都没有run_id）时为None"""
+        if not self.last.count[0] or not self.first.count[0]:
+            return None
+        return self.last.mean[0] - self.first.mean[0]
+
+
+def summarize(rows):
+    """
+    一次遍历结果行，按通道、按(通道, 输入值)累计
+    :param rows: iter_results的结果
+    :return: ({通道: PointSummary}, {(通道, 输入值): PointSummary})
+    """
+    channels, points = {}, {}
+    for row in rows:
+        channel = row.get("AI口")
+        if not channel:
+            continue
+        measurement = _to_float(row.get("实测值"))
+        error = None
+        if measurement is not None and row.get("范围") not in (None, ""):
+            try:
+                low, high = parse_range(row["范围"])
+                error = measurement - (low + high) / 2
+            except ValueError:
+                pass
+        for key, summaries in ((channel, channels), ((channel, _to_float(row.get("输入值"))), points)):
+            if key not in summaries:
+                summaries[key] = PointSummary()
+            summaries[key].update(row, measurement, error)
+    unbatched = sum(summary.unbatched for summary in channels.values())
+    if unbatched:
+        logging.warning(f"{unbatched}行结果没有run_id，不参与批次间漂移计算")
+    return channels, points
+
+
+def _error_columns(summary):
+    error = summary.error.summary(0)
+    return [error['mean'], error['std'] if error['count'] else None, summary.worst_error if summary.worst else None]
+
+
+def generate_report(result_path, report_path, table='results'):
+    """
+    由结果文件生成汇总报告（openpyxl只写模式），结果文件只遍历一次
+    :param result_path: 结果文件（.xlsx/.csv/.db）
+    :param report_path: 报告文件（.xlsx）
+    :param table: 结果为SQLite时的表名
+    :return: ({通道: PointSummary}, {(通道, 输入值): PointSummary})
+    """
+    import openpyxl
+    channels, points = summarize(iter_results(result_path, table))
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("通道汇总")
+    sheet.append(["通道", "测试点数", "合格数", "合格率", "平均误差", "误差标准差", "最大误差",
+                  "最差点输入值", "最差点实测值", "最差点范围", "最差点批次"])
+    for channel in sorted(channels):
+        summary = channels[channel]
+        worst = summary.worst or {}
+        sheet.append([channel, summary.total, summary.passed, summary.pass_rate] + _error_columns(summary) +
+                     [worst.get("输入值"), worst.get("实测值"), worst.get("范围"), worst.get("run_id")])
+    sheet = workbook.create_sheet("测试点汇总")
+    sheet.append(["通道", "输入值", "测试点数", "合格率", "平均误差", "误差标准差", "最大误差",
+                  "首批次", "首批次均值", "最近批次", "最近批次均值", "漂移", "无批次号行数"])
+    for channel, input_data in sorted(points, key=lambda key: (key[0], key[1] is None, key[1] or 0)):
+        summary = points[(channel, input_data)]
+        sheet.append([channel, input_data, summary.total, summary.pass_rate] + _error_columns(summary) +
+                     [summary.first_run, summary.first.summary(0)['mean'],
+                      summary.last_run, summary.last.summary(0)['mean'], summary.drift, summary.unbatched])
+    workbook.save(report_path)
+    logging.info(f"汇总报告已保存到{report_path}：{len(channels)}个通道，{len(points)}个测试点")
+    return channels, points
+
+
+if __name__ == "__main__":
+    # python -m Common.result_report <结果文件> <报告文件>
+    if len(sys.argv) != 3:
+        print("用法: <结果文件> <报告文件>")
+    else:
+        generate_report(sys.argv[1], sys.argv[2])
@@ -0,0 +1,241 @@
+import atexit
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# 测试结果的默认列，与excel_append_ai_measurement写入的列一致
+RESULT_COLUMNS = ["时间", "AI口", "输入值", "实测值", "范围", "判定结果"]
+# xlsx结果的暂存文件后缀
+STAGING_SUFFIX = '.partial.jsonl'
+# 未指定sink的excel_append_ai_measurement(write_to_file=True)写入的文件
+DEFAULT_RESULT_PATH = "ai_i_measurements.xlsx"
+
+
+def new_run_id():
+    """
+    :return: 以开始时间命名的批次号，如 20250101-120000
+    """
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+class ResultSink:
+    def __init__(self, path, columns=None, batch_size=100, run_id=None):
+        """
+        测试结果缓冲写入：行先保存在内存中，攒够batch_size行或关闭时批量写入，
+        每行附带run_id列以区分不同批次的测试
+        :param path: 结果文件路径
+        :param columns: 列名，默认为RESULT_COLUMNS
+        :param batch_size: 每攒够多少行写入一次
+        :param run_id: 批次号，为空时按开始时间生成
+        """
+        self.path = path
+        self.columns = list(columns or RESULT_COLUMNS) + ['run_id']
+        self.batch_size = batch_size
+        self.run_id = run_id or new_run_id()
+        self.rows = []
+        self.written = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, row):
+        """
+        追加一行
+        :param row: {列名: 值}，缺少的列为空
+        :return:
+        """
+        if self.closed:
+            raise ValueError(f"{self.path} 已关闭")
+        values = dict(row, run_id=self.run_id)
+        self.rows.append([values.get(column, "") for column in self.columns])
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """将缓冲的行写入文件"""
+        if not self.rows:
+            return
+        self._write_rows(self.rows)
+        self.written += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        """写入剩余的行并关闭文件"""
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._close()
+            self.closed = True
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class CsvResultSink(ResultSink):
+    def __init__(self, path, columns=None, batch_size=100, run_id=None):
+        """
+        追加写入CSV文件（utf-8-sig，Excel可直接打开），新文件先写表头
+        """
+        super().__init__(path, columns, batch_size, run_id)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8-sig' if new_file else 'utf-8')
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(self.columns)
+
+    def _write_rows(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class SqliteResultSink(ResultSink):
+    def __init__(self, path, columns=None, batch_size=100, run_id=None, table='results'):
+        """
+        写入SQLite数据库，每次flush为一个事务
+        :param table: 表名
+        """
+        super().__init__(path, columns, batch_size, run_id)
+        self.table = table
+        self._conn = sqlite3.connect(path)
+        column_sql = ', '.join(f'"{column}"' for column in self.columns)
+        self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({column_sql})')
+        self._insert_sql = f'INSERT INTO "{table}" ({column_sql}) VALUES ({", ".join("?" * len(self.columns))})'
+
+    def _write_rows(self, rows):
+        with self._conn:
+            self._conn.executemany(self._insert_sql, rows)
+
+    def _close(self):
+        self._conn.close()
+
+
+class XlsxResultSink(ResultSink):
+    def __init__(self, path, columns=None, batch_size=100, run_id=None):
+        """
+        写入xlsx：测试过程中每次flush只把行追加到旁边的暂存文件（path + STAGING_SUFFIX，JSON Lines），
+        关闭时以openpyxl只写模式一次生成xlsx，整个会话只读写一次工作簿。
+        异常退出时暂存文件保留在磁盘上，下次打开同一路径时合并进工作簿
+        """
+        super().__init__(path, columns, batch_size, run_id)
+        self.staging_path = path + STAGING_SUFFIX
+        if os.path.exists(self.staging_path):
+            logging.warning(f"{self.staging_path} 中有上次异常退出时未写入的结果，关闭时一并写入{path}")
+        self._staging = open(self.staging_path, 'a', encoding='utf-8')
+
+    def _write_rows(self, rows):
+        for row in rows:
+            self._staging.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+        self._staging.flush()
+        os.fsync(self._staging.fileno())
+
+    def _staged_rows(self):
+        with open(self.staging_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # 异常退出时最后一行可能不完整
+                    continue
+
+    def _close(self):
+        import openpyxl
+        self._staging.close()
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        new_sheet = None
+        if os.path.exists(self.path):
+            # 已有文件只在关闭时以只读模式逐行复制一次
+            existing = openpyxl.load_workbook(self.path, read_only=True)
+            try:
+                rows = existing.active.iter_rows(values_only=True)
+                header = list(next(rows, None) or [])
+                while header and header[-1] is None:
+                    header.pop()
+                if not header or header == self.columns[:len(header)]:
+                    # 旧结果文件没有run_id列时补齐表头
+                    sheet.append(self.columns)
+                else:
+                    logging.warning(f"{self.path} 的表头{header}与{self.columns}不一致，结果写入新的工作表")
+                    sheet.append(header)
+                    new_sheet = workbook.create_sheet(f"run_{self.run_id}")
+                    new_sheet.append(self.columns)
+                for row in rows:
+                    sheet.append(row)
+            finally:
+                existing.close()
+        else:
+            sheet.append(self.columns)
+        target = new_sheet or sheet
+        for row in self._staged_rows():
+            target.append(row)
+        # 先写临时文件再替换，保存过程中异常不会损坏已有的结果文件
+        temporary_path = self.path + '.tmp.xlsx'
+        workbook.save(temporary_path)
+        os.replace(temporary_path, self.path)
+        os.remove(self.staging_path)
+
+
+SINK_BACKENDS = {'.csv': CsvResultSink, '.db': SqliteResultSink, '.sqlite': SqliteResultSink,
+                 '.xlsx': XlsxResultSink}
+
+
+def open_sink(path, columns=None, batch_size=100, run_id=None):
+    """
+    按文件扩展名选择结果写入方式：.xlsx / .csv / .db(.sqlite)
+    :param path: 结果文件路径
+    :param columns: 列名，默认为RESULT_COLUMNS
+    :param batch_size: 每攒够多少行写入一次
+    :param run_id: 批次号，为空时按开始时间生成
+    :return: ResultSink
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINK_BACKENDS:
+        raise ValueError(f"不支持的结果文件类型: {extension}，可选 {list(SINK_BACKENDS)}")
+    sink = SINK_BACKENDS[extension](path, columns, batch_size, run_id)
+    logging.info(f"测试结果写入{path}，批次号{sink.run_id}")
+    return sink
+
+
+_default_sink = None
+_default_sink_lock = threading.Lock()
+
+
+def default_sink():
+    """
+    共享的默认结果sink（DEFAULT_RESULT_PATH），不存在或已关闭时新建，进程退出时关闭；
+    每行立即写入暂存文件
+    :return: ResultSink
+    """
+    global _default_sink
+    with _default_sink_lock:
+        if _default_sink is None or _default_sink.closed:
+            _default_sink = open_sink(DEFAULT_RESULT_PATH, batch_size=1)
+        return _default_sink
+
+
+def close_default_sink():
+    """关闭共享的默认结果sink，生成结果文件"""
+    global _default_sink
+    with _default_sink_lock:
+        if _default_sink is not None:
+            _default_sink.close()
+            _default_sink = None
+
+
+atexit.register(close_default_sink)
@@ -0,0 +1,106 @@
+import threading
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class RingBuffer:
+    def __init__(self, capacity, width):
+        """
+        预分配的定长环形缓冲区，每条记录为 时间戳 + width个浮点值，写满后覆盖最旧的记录
+        :param capacity: 最多保存的记录数
+        :param width: 每条记录的值个数（如16个AI通道）
+        """
+        self.capacity = capacity
+        self.width = width
+        if np is not None:
+            self._timestamps = np.zeros(capacity, dtype=np.float64)
+            self._values = np.zeros((capacity, width), dtype=np.float64)
+        else:
+            self._timestamps = array('d', bytes(8 * capacity))
+            self._values = array('d', bytes(8 * capacity * width))
+        # 累计写入的记录数，用于定位写入位置和增量读取
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._written, self.capacity)
+
+    @property
+    def written(self):
+        """累计写入的记录数（不会因覆盖而减少）"""
+        return self._written
+
+    def append(self, timestamp, values):
+        """
+        写入一条记录（写入预分配的存储，不新建缓冲区）
+        :param timestamp: 时间戳（time.monotonic()）
+        :param values: width个值
+        :return:
+        """
+        with self._lock:
+            index = self._written % self.capacity
+            self._timestamps[index] = timestamp
+            if np is not None:
+                self._values[index] = values
+            else:
+                base = index * self.width
+                for offset in range(self.width):
+                    self._values[base + offset] = values[offset]
+            self._written += 1
+
+    def _rows(self, start, stop):
+        """
+        复制第start到stop条（按累计序号）记录
+        :return: (时间戳列表/数组, 值列表/二维数组)，从旧到新
+        """
+        indexes = [sequence % self.capacity for sequence in range(start, stop)]
+        if np is not None:
+            return self._timestamps[indexes], self._values[indexes]
+        timestamps = [self._timestamps[index] for index in indexes]
+        values = [self._values[index * self.width:(index + 1) * self.width].tolist() for index in indexes]
+        return timestamps, values
+
+    def latest(self, n):
+        """
+        最近n条记录
+        :param n:
+        :return: (时间戳, 值)，从旧到新
+        """
+        with self._lock:
+            n = min(n, len(self))
+            return self._rows(self._written - n, self._written)
+
+    def snapshot(self):
+        """
+        当前缓冲区中的全部记录
+        :return: (时间戳, 值)，从旧到新
+        """
+        return self.latest(self.capacity)
+
+    def __iter__(self):
+        timestamps, values = self.snapshot()
+        return iter(zip(timestamps, values))
+
+    def follow(self, poll_interval=0.05, stop_event=None):
+        """
+        生成器：持续产出新写入的记录；消费过慢时跳过已被覆盖的记录
+        :param poll_interval: 无新记录时的等待间隔（秒）
+        :param stop_event: threading.Event，置位后结束
+        :return: (时间戳, 值)
+        """
+        sequence = self._written
+        while stop_event is None or not stop_event.is_set():
+            with self._lock:
+                start = max(sequence, self._written - self.capacity)
+                stop = self._written
+                rows = self._rows(start, stop) if stop > start else None
+            if rows is None:
+                time.sleep(poll_interval)
+                continue
+            sequence = stop
+            yield from zip(*rows)
@@ -0,0 +1,123 @@
+import time
+from collections import deque
+
+
+class SettleResult:
+    def __init__(self, value, settled, elapsed, samples):
+        """
+        等待稳定的结果
+        :param value: 最后一次读数（单值或各通道值列表）
+        :param settled: 是否在超时前达到稳定
+        :param elapsed: 等待耗时（秒）
+        :param samples: 读取次数
+        """
+        self.value = value
+        self.settled = settled
+        self.elapsed = elapsed
+        self.samples = samples
+
+    def __repr__(self):
+        return f"SettleResult(value={self.value}, settled={self.settled}, elapsed={self.elapsed:.2f}s, " \
+               f"samples={self.samples})"
+
+
+def _as_vector(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def _is_stable(window, tolerance, slope, target=None, accuracy=None, origin=None):
+    """
+    判断滑动窗口内每个通道是否都满足波动范围、斜率和目标值条件
+    :param window: [(时间, [各通道值]), ...]
+    :param tolerance: 各通道窗口内最大值与最小值之差的上限列表，None为不检查
+    :param slope: 线性拟合斜率绝对值的上限（单位/秒），None为不检查
+    :param target: 各通道目标值列表，None为不检查
+    :param accuracy: 各通道与目标值之差的上限列表，None时只检查读数是否比origin更接近target
+    :param origin: 各通道上一个设定点对应的值列表
+    :return:
+    """
+    times = [t for t, _ in window]
+    mean_t = sum(times) / len(times)
+    var_t = sum((t - mean_t) ** 2 for t in times)
+    for index, channel in enumerate(zip(*(values for _, values in window))):
+        if target is not None and accuracy is not None and any(abs(v - target[index]) > accuracy[index]
+                                                               for v in channel):
+            return False
+        if origin is not None and _not_departed(channel, target[index], origin[index],
+                                                tolerance[index] if tolerance is not None else 0):
+            return False
+        if tolerance is not None and max(channel) - min(channel) > tolerance[index]:
+            return False
+        if slope is not None and var_t > 0:
+            mean_v = sum(channel) / len(channel)
+            fitted = sum((t - mean_t) * (v - mean_v) for t, v in zip(times, channel)) / var_t
+            if abs(fitted) > slope:
+                return False
+    return True
+
+
+def _not_departed(channel, target, origin, tolerance):
+    """
+    读数是否还停留在上一个设定点：目标值与上一个值相差超过波动范围时，窗口内读数都需比上一个值更接近目标值
+    """
+    if target is None or origin is None or abs(target - origin) <= tolerance:
+        return False
+    return any(abs(v - target) >= abs(v - origin) for v in channel)
+
+
+def _align(value, count):
+    """单值扩展为count个通道的列表"""
+    if value is None or isinstance(value, (list, tuple)):
+        return value
+    return [value] * count
+
+
+def wait_until_stable(read, tolerance=None, slope=None, window=5, interval=0.2, timeout=10.0, min_time=0.0,
+                      target=None, accuracy=None, origin=None):
+    """
+    轮询读数，滑动窗口满足波动范围或斜率条件（以及目标值条件）时立即返回，取代固定时长的sleep
+    :param read: 无参读数函数，返回单值或各通道值列表，读取失败返回None
+    :param tolerance: 窗口内最大值与最小值之差的上限（单值或与读数对齐的列表）
+    :param slope: 窗口内线性拟合斜率绝对值的上限（单位/秒）
+    :param window: 滑动窗口的样本数
+    :param interval: 两次读取的间隔（秒）
+    :param timeout: 最长等待时间（秒），超时返回最后一次读数
+    :param min_time: 最短等待时间（秒），此前的读数不计入滑动窗口，用于跳过输出刚切换时的过冲和输入滤波的滞后
+    :param target: 目标值（单值或与读数对齐的列表），指定accuracy时窗口内所有读数都需在目标值±accuracy以内
+    :param accuracy: 与目标值之差的上限（单值或与读数对齐的列表）
+    :param origin: 上一个设定点对应的值（单值或与读数对齐的列表），指定时窗口内读数都需比origin更接近target，
+                   避免窗口被上一个设定点仍然稳定的读数填满而提前返回
+    :return: SettleResult
+    """
+    if tolerance is None and slope is None and target is None:
+        raise ValueError("tolerance、slope和target至少需要指定一个")
+    if target is not None:
+        if accuracy is None and origin is None:
+            raise ValueError("指定target时需要同时指定accuracy或origin")
+        target = _as_vector(target)
+        accuracy = _align(accuracy, len(target))
+        origin = _align(origin, len(target))
+    elif origin is not None:
+        raise ValueError("指定origin时需要同时指定target")
+    tolerance_vector = None
+    start = time.monotonic()
+    samples = deque(maxlen=window)
+    count = 0
+    value = None
+    while True:
+        reading = read()
+        elapsed = time.monotonic() - start
+        count += 1
+        if reading is not None:
+            value = reading
+            if elapsed >= min_time:
+                samples.append((elapsed, _as_vector(reading)))
+                if tolerance_vector is None:
+                    tolerance_vector = _align(tolerance, len(samples[-1][1]))
+        if len(samples) == window and _is_stable(samples, tolerance_vector, slope, target, accuracy, origin):
+            return SettleResult(value, True, elapsed, count)
+        if elapsed >= timeout:
+            return SettleResult(value, False, elapsed, count)
+        time.sleep(min(interval, max(timeout - elapsed, 0)))
@@ -0,0 +1,100 @@
+import math
+import time
+
+
+class ChannelStats:
+    def __init__(self, channels):
+        """
+        多通道在线统计（Welford算法）：逐次累加样本，内存只与通道数有关，与样本数无关
+        :param channels: 通道数
+        """
+        self.channels = channels
+        self.count = [0] * channels
+        self.mean = [0.0] * channels
+        self._m2 = [0.0] * channels
+        self.min = [math.inf] * channels
+        self.max = [-math.inf] * channels
+
+    def update(self, values):
+        """
+        累加一次读数
+        :param values: 各通道值（单通道时可直接传数值），None表示该通道本次读取失败
+        :return:
+        """
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        for channel, value in enumerate(values):
+            if value is None:
+                continue
+            self.count[channel] += 1
+            delta = value - self.mean[channel]
+            self.mean[channel] += delta / self.count[channel]
+            self._m2[channel] += delta * (value - self.mean[channel])
+            if value < self.min[channel]:
+                self.min[channel] = value
+            if value > self.max[channel]:
+                self.max[channel] = value
+
+    def std(self, channel):
+        """
+        样本标准差
+        :param channel: 通道下标（从0开始）
+        :return:
+        """
+        if self.count[channel] < 2:
+            return 0.0
+        return math.sqrt(self._m2[channel] / (self.count[channel] - 1))
+
+    def confidence_bounds(self, channel, z=1.96):
+        """
+        均值的置信区间
+        :param channel: 通道下标（从0开始）
+        :param z: 正态分位数，1.96对应95%置信度
+        :return: (下界, 上界)
+        """
+        if not self.count[channel]:
+            return None
+        half_width = z * self.std(channel) / math.sqrt(self.count[channel])
+        return self.mean[channel] - half_width, self.mean[channel] + half_width
+
+    def summary(self, channel):
+        """
+        :param channel: 通道下标（从0开始）
+        :return: {'count', 'mean', 'std', 'min', 'max'}
+        """
+        return {
+            'count': self.count[channel],
+            'mean': self.mean[channel] if self.count[channel] else None,
+            'std': self.std(channel),
+            'min': self.min[channel] if self.count[channel] else None,
+            'max': self.max[channel] if self.count[channel] else None,
+        }
+
+
+def collect_stats(read, channels=1, samples=None, duration=None, interval=0.0):
+    """
+    对同一测试点多次读数并累加统计
+    :param read: 无参读数函数，返回单值或各通道值列表，读取失败返回None
+    :param channels: 通道数
+    :param samples: 读取次数
+    :param duration: 读取时长（秒），与samples同时指定时先满足者结束
+    :param interval: 两次读取的间隔（秒）
+    :return: ChannelStats
+    """
+    if samples is None and duration is None:
+        raise ValueError("samples和duration至少需要指定一个")
+    stats = ChannelStats(channels)
+    start = time.monotonic()
+    taken = 0
+    while True:
+        values = read()
+        taken += 1
+        if values is not None:
+            stats.update(values)
+        if samples is not None and taken >= samples:
+            break
+        if duration is not None and time.monotonic() - start >= duration:
+            break
+        if interval:
+            time.sleep(interval)
+    return stats
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+
+def plan_hash(plan):
+    """
+    :param plan: 测试计划（可JSON序列化的参数字典）
+    :return: 计划的摘要，参数相同的测试计划摘要相同
+    """
+    text = json.dumps(plan, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+class SweepJournal:
+    def __init__(self, path, plan):
+        """
+        扫描测试的完成记录：每完成一个测试点追加一行JSON并fsync，中断后用相同的计划重新运行时跳过已完成的测试点
+        :param path: 记录文件路径（JSON Lines），为空时只记录在内存中
+        :param plan: 测试计划，计划改变后之前的记录不再生效
+        """
+        self.path = path
+        self.plan = plan_hash(plan)
+        # (测试类型, 通道号, 测试点下标) -> 记录
+        self.completed = {}
+        self._file = None
+        if path:
+            partial_line = self._load()
+            self._file = open(path, 'a', encoding='utf-8')
+            if partial_line:
+                # 上次写到一半的行单独成行，避免与新记录拼在一起
+                self._file.write('\n')
+        if self.completed:
+            logging.info(f"断点续测：{path} 中已完成{len(self.completed)}个测试点")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _load(self):
+        """
+        读取已有记录
+        :return: 文件最后一行是否不完整（没有换行符）
+        """
+        if not os.path.exists(self.path):
+            return False
+        line = '\n'
+        with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 异常中断时最后一行可能不完整
+                    continue
+                if entry.get('plan') == self.plan:
+                    self.completed[tuple(entry['key'])] = entry
+        return not line.endswith('\n')
+
+    def done(self, mode, channel, index):
+        """
+        :param mode: 测试类型，如'ai_current'
+        :param channel: 通道号
+        :param index: 测试点下标
+        :return: 该测试点是否已完成
+        """
+        return (mode, channel, index) in self.completed
+
+    def entry(self, mode, channel, index):
+        """
+        :return: 已完成测试点的记录 {输入值、实测值、判定结果等字段, 'time': 完成时间}，未完成时为None
+        """
+        return self.completed.get((mode, channel, index))
+
+    def channel_done(self, mode, channel, points):
+        """
+        :param points: 该通道的测试点数
+        :return: 该通道的所有测试点是否都已完成
+        """
+        return all(self.done(mode, channel, index) for index in range(points))
+
+    def record(self, mode, channel, index, **fields):
+        """
+        记录一个已完成的测试点，写入后立即fsync
+        :param mode: 测试类型
+        :param channel: 通道号
+        :param index: 测试点下标
+        :param fields: 输入值、实测值、判定结果等
+        :return:
+        """
+        entry = dict(fields, plan=self.plan, key=[mode, channel, index], time=time.time())
+        self.completed[(mode, channel, index)] = entry
+        if self._file is None:
+            return
+        self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,113 @@
+import math
+import re
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=None)
+def parse_range(range_str):
+    """
+    解析范围字符串，去掉其中的空格和制表符
+    :param range_str: 如 "-35.4000~-34.600"，或单个数字（上下限相同）
+    :return: (下限, 上限)
+    """
+    text = _WHITESPACE.sub('', str(range_str))
+    try:
+        if '~' not in text:
+            value = float(text)
+            return value, value
+        low, high = text.split('~')
+        return float(low), float(high)
+    except ValueError:
+        raise ValueError(f"范围格式错误，应类似'-35.4000~-34.600'，实际为{range_str!r}")
+
+
+class ToleranceTable:
+    def __init__(self, expected):
+        """
+        预先解析一组测试点的预期范围，得到与测试点（及通道）对齐的上下限数组
+        :param expected: 每个测试点一项：范围字符串（所有通道相同），或每个通道一个范围字符串的列表
+        """
+        self.expected = list(expected)
+        ranges = [[parse_range(item) for item in entry] if isinstance(entry, (list, tuple)) else parse_range(entry)
+                  for entry in self.expected]
+        lows = [[r[0] for r in entry] if isinstance(entry, list) else entry[0] for entry in ranges]
+        highs = [[r[1] for r in entry] if isinstance(entry, list) else entry[1] for entry in ranges]
+        if np is not None:
+            lows = [np.asarray(low, dtype=np.float64) for low in lows]
+            highs = [np.asarray(high, dtype=np.float64) for high in highs]
+        self.lo = lows
+        self.hi = highs
+
+    def __len__(self):
+        return len(self.expected)
+
+    def judge(self, index, values, upper=None):
+        """
+        一次判定一个测试点所有通道的读数
+        :param index: 测试点下标
+        :param values: 各通道读数（单值或列表），读取失败的通道为None/NaN，判定为不合格
+        :param upper: 按区间判定时各通道区间的上界，此时values为各通道区间的下界
+        :return: (是否合格, 距最近边界的距离)，在范围内距离为正、超出范围为负；
+                 numpy可用时为数组，否则为列表（单值输入时为单值）
+        """
+        return judge_block(values, self.lo[index], self.hi[index], upper)
+
+
+def judge_block(values, low, high, upper=None):
+    """
+    向量化判定：low <= 值 <= high
+    :param values: 各通道读数，或区间判定时各通道区间的下界
+    :param low: 下限（单值或与通道对齐的数组）
+    :param high: 上限（单值或与通道对齐的数组）
+    :param upper: 区间判定时各通道区间的上界，为空时与values相同
+    :return: (是否合格, 距最近边界的距离)
+    """
+    if np is not None:
+        lower_values = np.asarray(_none_to_nan(values), dtype=np.float64)
+        upper_values = lower_values if upper is None else np.asarray(_none_to_nan(upper), dtype=np.float64)
+        distance = np.minimum(lower_values - low, high - upper_values)
+        # NaN与任何值比较都为False，读取失败的通道判定为不合格
+        return distance >= 0, distance
+    scalar = not isinstance(values, (list, tuple))
+    lower_values = [values] if scalar else _none_to_nan(values)
+    upper_values = lower_values if upper is None else ([upper] if scalar else _none_to_nan(upper))
+    lows = low if isinstance(low, (list, tuple)) else [low] * len(lower_values)
+    highs = high if isinstance(high, (list, tuple)) else [high] * len(lower_values)
+    distance = [min(v - lo, hi - u) if not (math.isnan(v) or math.isnan(u)) else math.nan
+                for v, u, lo, hi in zip(_none_to_nan(lower_values), _none_to_nan(upper_values), lows, highs)]
+    passed = [d >= 0 for d in distance]
+    if scalar:
+        return passed[0], distance[0]
+    return passed, distance
+
+
+def _none_to_nan(values):
+    if isinstance(values, (list, tuple)):
+        return [math.nan if value is None else value for value in values]
+    return math.nan if values is None else values
+
+
+def compile_expected(data):
+    """
+    为YAML测试数据中的每个expected生成对应的expected_ranges（每组一个ToleranceTable），
+    原有的expected保持不变
+    :param data: yaml.safe_load的结果
+    :return: data
+    """
+    if isinstance(data, dict):
+        for key, value in list(data.items()):
+            if key == 'expected' and isinstance(value, list) and value:
+                if all(isinstance(entry, list) for entry in value):
+                    data['expected_ranges'] = [ToleranceTable(entry) for entry in value]
+                else:
+                    data['expected_ranges'] = ToleranceTable(value)
+            else:
+                compile_expected(value)
+    return data
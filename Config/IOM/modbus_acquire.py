@@ -0,0 +1,124 @@
+import contextlib
+import logging
+import struct
+import threading
+import time
+from Common.ring_buffer import RingBuffer
+from Config.IOM.modbus_connet import ModbusRtuOrTcp
+from Config.IOM.modbus_schema import AI_MEASUREMENT
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class AiAcquisition(threading.Thread):
+    def __init__(self, modbus_client: ModbusRtuOrTcp, rate_hz=10, capacity=10000, slave=1,
+                 address=AI_MEASUREMENT.base, channels=AI_MEASUREMENT.count):
+        """
+        后台持续采集AI测量块（0x3700开始的16个通道），写入环形缓冲区。
+        总线跟不上设定速率时不再等待，按总线实际能达到的速率采集
+        :param modbus_client: ModbusRtuOrTcp 实例，与其他操作共用时由连接锁保证事务串行
+        :param rate_hz: 目标采集速率（次/秒）
+        :param capacity: 环形缓冲区容量（条）
+        :param slave: 从站地址
+        :param address: 测量块起始地址
+        :param channels: 通道数，每个通道2个寄存器
+        """
+        super().__init__(name='ai-acquisition', daemon=True)
+        self.modbus_client = modbus_client
+        self.period = 1 / rate_hz
+        self.slave = slave
+        self.address = address
+        self.channels = channels
+        self.buffer = RingBuffer(capacity, channels)
+        # 预分配的解码缓冲区：每个样本的寄存器写入同一块内存，按大端浮点数视图直接写入环形缓冲区的槽位，
+        # 采集循环中不再为每个样本新建数组（解码结果与decode_float_registers一致）
+        if np is not None:
+            self._words = np.zeros(channels * 2, dtype='>u2')
+            self._floats = self._words.view('>f4')
+        else:
+            self._words = bytearray(4 * channels)
+            self._word_codec = struct.Struct(f'>{channels * 2}H')
+            self._float_codec = struct.Struct(f'>{channels}f')
+        self.errors = 0
+        self._stop_event = threading.Event()
+        self._started_at = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def achieved_rate(self):
+        """实际采集速率（次/秒）"""
+        if not self._started_at or not self.buffer.written:
+            return 0.0
+        return self.buffer.written / (time.monotonic() - self._started_at)
+
+    def _decode(self, registers):
+        """
+        将一次读取的寄存器解码到预分配的缓冲区
+        :param registers: channels*2个寄存器
+        :return: channels个浮点值（numpy可用时为缓冲区的视图，下一次解码会覆盖）
+        """
+        if np is not None:
+            self._words[:] = registers
+            return self._floats
+        self._word_codec.pack_into(self._words, 0, *registers)
+        return self._float_codec.unpack_from(self._words)
+
+    def run(self):
+        # 寄存器中可能出现signaling NaN，写入缓冲区转换为float64时不告警
+        with np.errstate(invalid='ignore') if np is not None else contextlib.nullcontext():
+            self._run()
+
+    def _run(self):
+        self._started_at = time.monotonic()
+        next_time = self._started_at
+        while not self._stop_event.is_set():
+            registers = self.modbus_client.read_measurement(address=self.address, count=self.channels * 2,
+                                                            slave=self.slave)
+            timestamp = time.monotonic()
+            if isinstance(registers, list):
+                self.buffer.append(timestamp, self._decode(registers))
+            else:
+                self.errors += 1
+                logging.warning(f"AI采集读取失败: {registers}")
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                # 总线跟不上设定速率，从当前时刻重新计时，不追赶积压的周期
+                next_time = time.monotonic()
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def snapshot(self):
+        """
+        :return: (时间戳, 值)，从旧到新
+        """
+        return self.buffer.snapshot()
+
+    def latest(self, n=1):
+        """
+        :param n: 最近n条
+        :return: (时间戳, 值)，从旧到新
+        """
+        return self.buffer.latest(n)
+
+    def samples(self, poll_interval=0.05):
+        """
+        生成器：持续产出新的采样 (时间戳, 16个通道的值)，采集停止后结束
+        :param poll_interval:
+        :return:
+        """
+        return self.buffer.follow(poll_interval, self._stop_event)
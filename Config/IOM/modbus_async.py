@@ -0,0 +1,205 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient
+from Common.modbus_config import modbus_config
+from Config.IOM.modbus_batch import DEFAULT_MAX_GAP, plan_reads, split_reads
+from Config.IOM.modbus_connet import endpoint_key
+
+
+class AsyncModbusRtuOrTcp:
+    def __init__(self, conn_mode=None, port=None, ip=None, tcp_port=None):
+        """
+        ModbusRtuOrTcp 的异步版本，基于pymodbus异步客户端，同一事件循环中可以同时驱动多个IOM端点。
+        CL3021源仍使用同步的source_control接口，本模块没有接入AsyncCl3021SourCon
+        :param conn_mode: rtu/tcp，为空时使用config.json中的conn_mode
+        :param port: 串口号，为空时使用config.json中的配置
+        :param ip: tcp地址，为空时使用config.json中的配置
+        :param tcp_port: tcp端口，为空时使用config.json中的配置
+        """
+        self.conn_mode = conn_mode or modbus_config['conn_mode']
+        self.endpoint = endpoint_key(self.conn_mode, port, ip, tcp_port)
+        self.client = None
+        # 同一端点上的事务串行，不同端点之间并发
+        self.lock = asyncio.Lock()
+        if self.conn_mode == 'rtu':
+            self.client = AsyncModbusSerialClient(port=port or modbus_config['rtu']['port'],
+                                                  baudrate=modbus_config['rtu']['baudrate'],
+                                                  parity=modbus_config['rtu']['parity'],
+                                                  timeout=0.5)
+        elif self.conn_mode == 'tcp':
+            self.client = AsyncModbusTcpClient(host=ip or modbus_config['tcp']['ip'],
+                                               port=tcp_port or modbus_config['tcp']['port'])
+        else:
+            logging.error('client not exits')
+
+    async def connect(self):
+        """
+        建立连接
+        :return: 是否连接成功
+        """
+        try:
+            await self.client.connect()
+        except Exception as e:
+            logging.error(f"modbus {self.endpoint} async connect fail: {str(e)}")
+            self.client.close()
+        return self.is_healthy()
+
+    def is_healthy(self):
+        try:
+            return bool(self.client and self.client.connected)
+        except Exception:
+            return False
+
+    async def ensure_connected(self):
+        if self.is_healthy():
+            return True
+        logging.warning(f'modbus {self.endpoint} 连接已断开，尝试重连')
+        return await self.connect()
+
+    def close(self):
+        if self.client:
+            self.client.close()
+
+    async def write_registers(self, address, values, slave):
+        """
+        写入多个寄存器
+        :param address:
+        :param values:
+        :param slave:
+        :return:
+        """
+        async with self.lock:
+            await self.ensure_connected()
+            try:
+                return await self.client.write_registers(address=address, values=values, device_id=slave)
+            except Exception as e:
+                self.close()
+                return e
+
+    async def write_register(self, address, value, slave):
+        """
+        写入单个寄存器
+        :param address:
+        :param value:
+        :param slave:
+        :return:
+        """
+        async with self.lock:
+            await self.ensure_connected()
+            try:
+                return await self.client.write_register(address=address, value=value, device_id=slave)
+            except Exception as e:
+                self.close()
+                return e
+
+    async def read_measurement(self, address, count, slave):
+        """
+        读取测量数据，即读取保持寄存器数据
+        :param address:
+        :param count:
+        :param slave:
+        :return:
+        """
+        async with self.lock:
+            await self.ensure_connected()
+            try:
+                resp = await self.client.read_holding_registers(address=address, count=count, device_id=slave)
+                logging.info('read_measurement ret is:{}'.format(resp))
+                if resp.isError():
+                    return "resp is error"
+                return resp.registers
+            except Exception as e:
+                self.close()
+                return e
+
+    async def read_ranges(self, ranges, slave, max_gap=DEFAULT_MAX_GAP):
+        """
+        一次读取多个(地址, 数量)区间，见 ModbusRtuOrTcp.read_ranges
+        :param ranges: [(起始地址, 寄存器数量), ...]
+        :param slave:
+        :param max_gap: 允许跨越的最大空隙（寄存器数）
+        :return: 与ranges一一对应的寄存器列表，读取失败的区间为None
+        """
+        blocks = plan_reads(ranges, max_gap=max_gap)
+        block_registers = []
+        for address, count in blocks:
+            registers = await self.read_measurement(address=address, count=count, slave=slave)
+            block_registers.append(registers if isinstance(registers, list) else None)
+        return split_reads(ranges, blocks, block_registers)
+
+
+class AsyncLoopRunner:
+    def __init__(self):
+        """
+        在后台线程中运行一个事件循环，供同步代码提交协程
+        """
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='modbus-async-loop', daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout=None):
+        """
+        提交协程并阻塞等待结果
+        :param coro: 协程
+        :param timeout: 超时时间（秒），None为一直等待，超时后取消协程
+        :return:
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def gather(self, *coros, timeout=None):
+        """
+        并发执行多个协程（如多个板子的读写），总耗时取决于最慢的设备
+        :param coros: 协程
+        :param timeout: 超时时间（秒）
+        :return: 与coros一一对应的结果，异常作为结果返回
+        """
+        async def _gather():
+            return await asyncio.gather(*coros, return_exceptions=True)
+        return self.run(_gather(), timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class SyncModbusFacade:
+    def __init__(self, async_client: AsyncModbusRtuOrTcp, runner: AsyncLoopRunner):
+        """
+        异步客户端的同步外观，接口与ModbusRtuOrTcp相同，现有的set/get函数可直接使用
+        :param async_client: AsyncModbusRtuOrTcp 实例
+        :param runner: AsyncLoopRunner 实例
+        """
+        self.async_client = async_client
+        self.runner = runner
+        self.endpoint = async_client.endpoint
+        self.lock = threading.RLock()
+        self.runner.run(async_client.connect())
+
+    def is_healthy(self):
+        return self.async_client.is_healthy()
+
+    def ensure_connected(self):
+        return self.runner.run(self.async_client.ensure_connected())
+
+    def close(self):
+        self.runner.loop.call_soon_threadsafe(self.async_client.close)
+
+    def write_registers(self, address, values, slave):
+        return self.runner.run(self.async_client.write_registers(address, values, slave))
+
+    def write_register(self, address, value, slave):
+        return self.runner.run(self.async_client.write_register(address, value, slave))
+
+    def read_measurement(self, address, count, slave):
+        return self.runner.run(self.async_client.read_measurement(address, count, slave))
+
+    def read_ranges(self, ranges, slave, max_gap=DEFAULT_MAX_GAP):
+        return self.runner.run(self.async_client.read_ranges(ranges, slave, max_gap))
@@ -0,0 +1,179 @@
+from bisect import bisect_right
+from Config.IOM.modbus_schema import field_start
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# FC16（写多个寄存器）单帧最多写入123个寄存器
+MAX_WRITE_REGISTERS = 123
+# FC03（读保持寄存器）单帧最多读取125个寄存器
+MAX_READ_REGISTERS = 125
+# 多一次往返的固定开销：RTU请求8字节 + 响应头尾5字节 + 两次3.5字符帧间静默，约20字符，
+# 折合约10个寄存器（每个寄存器2字节），间隔不超过该值时多读空隙比多发一帧更快
+DEFAULT_MAX_GAP = 10
+
+
+class RegisterWriteBatch:
+    def __init__(self, max_registers=MAX_WRITE_REGISTERS):
+        """
+        寄存器批量写入：收集多组(地址, 值列表)，合并相邻和重叠的写入，
+        按FC16单帧寄存器上限切分成最少的帧后按地址顺序发送；只在字段边界切分，32位字段不会被拆到两帧中
+        :param max_registers: 单帧最多写入的寄存器数量
+        """
+        self.max_registers = max_registers
+        # 地址 -> 值，同一地址后写入的值覆盖先写入的值
+        self._registers = {}
+
+    def __len__(self):
+        return len(self._registers)
+
+    def add(self, address, values):
+        """
+        添加一组写入
+        :param address: 起始地址
+        :param values: 寄存器值列表（每个值为16位无符号整数）
+        :return: self，便于链式调用
+        """
+        for offset, value in enumerate(values):
+            self._registers[address + offset] = value
+        return self
+
+    def frames(self):
+        """
+        合并相邻和重叠的写入，生成最少的FC16帧
+        :return: [(起始地址, 值列表), ...]，按地址升序
+        """
+        frames = []
+        start, values = None, []
+        for address in sorted(self._registers):
+            if start is not None and address == start + len(values) and len(values) < self.max_registers:
+                values.append(self._registers[address])
+                continue
+            if start is not None and address == start + len(values):
+                # 单帧已满：回退到最后一个字段起始地址切分，被切开的字段整体放入下一帧
+                cut = field_start(address) - start
+                if cut <= 0:
+                    cut = len(values)
+                frames.append((start, values[:cut]))
+                start, values = start + cut, values[cut:] + [self._registers[address]]
+                continue
+            if start is not None:
+                frames.append((start, values))
+            start, values = address, [self._registers[address]]
+        if start is not None:
+            frames.append((start, values))
+        return frames
+
+    def flush(self, modbus_client, slave=1):
+        """
+        按顺序发送所有帧并清空批次
+        :param modbus_client: ModbusRtuOrTcp 实例
+        :param slave: 从站地址
+        :return: [(起始地址, 值列表, 写入结果), ...]
+        """
+        results = []
+        for address, values in self.frames():
+            response = modbus_client.write_registers(address, values, slave=slave)
+            results.append((address, values, response))
+        self._registers.clear()
+        return results
+
+
+def plan_reads(ranges, max_gap=DEFAULT_MAX_GAP, max_registers=MAX_READ_REGISTERS):
+    """
+    读取规划：将多个(地址, 数量)合并为最少的FC03块读取，
+    间隔不超过max_gap的相邻区间连同空隙一起读取，单块不超过max_registers
+    :param ranges: [(起始地址, 寄存器数量), ...]，可重叠、可乱序
+    :param max_gap: 允许跨越的最大空隙（寄存器数）
+    :param max_registers: 单帧最多读取的寄存器数量
+    :return: [(起始地址, 寄存器数量), ...]，按地址升序
+    """
+    blocks = []
+    for start, end in sorted((address, address + count) for address, count in ranges if count > 0):
+        if blocks:
+            block_start, block_end = blocks[-1]
+            # 与上一块重叠的部分已经读取过
+            start = max(start, block_end)
+            if start >= end:
+                continue
+            # 空隙足够小时并入上一块，上一块装满后剩余部分另起一块
+            if start - block_end <= max_gap and start < block_start + max_registers:
+                block_end = min(end, block_start + max_registers)
+                blocks[-1] = (block_start, block_end)
+                start = block_end
+                if start >= end:
+                    continue
+        # 超过单帧上限的区间拆分为多块
+        while end - start > max_registers:
+            blocks.append((start, start + max_registers))
+            start += max_registers
+        blocks.append((start, end))
+    return [(start, end - start) for start, end in blocks]
+
+
+def split_reads(ranges, blocks, block_registers):
+    """
+    将块读取结果拆回每个请求区间
+    :param ranges: 原始请求 [(起始地址, 寄存器数量), ...]
+    :param blocks: plan_reads 生成的块 [(起始地址, 寄存器数量), ...]
+    :param block_registers: 每块读取到的寄存器列表，读取失败的块为None
+    :return: 与ranges一一对应的寄存器列表，涉及的块读取失败时为None
+    """
+    starts = [start for start, _ in blocks]
+    views = []
+    for address, count in ranges:
+        index = bisect_right(starts, address) - 1
+        block_start, block_count = blocks[index]
+        registers = block_registers[index]
+        if registers is not None and address + count <= block_start + block_count:
+            views.append(registers[address - block_start:address - block_start + count])
+            continue
+        # 区间被拆分到多个连续块中（超过单帧上限）
+        values = []
+        while count > 0 and index < len(blocks):
+            block_start, block_count = blocks[index]
+            registers = block_registers[index]
+            if registers is None or address < block_start:
+                values = None
+                break
+            take = min(count, block_start + block_count - address)
+            values.extend(registers[address - block_start:address - block_start + take])
+            address, count, index = address + take, count - take, index + 1
+        views.append(values if count == 0 else None)
+    return views
+
+
+def compare_registers(address, expected, actual):
+    """
+    一次比较整块寄存器的预期值和实际值
+    :param address: 起始地址
+    :param expected: 预期值列表
+    :param actual: 读回的值列表，读取失败时为None
+    :return: 不一致的寄存器 [(地址, 预期值, 实际值), ...]
+    """
+    if actual is None:
+        return [(address + offset, value, None) for offset, value in enumerate(expected)]
+    if np is not None:
+        expected_array = np.asarray(expected, dtype=np.int64)
+        actual_array = np.asarray(actual, dtype=np.int64)
+        offsets = np.flatnonzero(expected_array != actual_array)
+        return [(address + int(offset), int(expected_array[offset]), int(actual_array[offset])) for offset in offsets]
+    return [(address + offset, value, actual_value)
+            for offset, (value, actual_value) in enumerate(zip(expected, actual)) if value != actual_value]
+
+
+def verify_frames(modbus_client, frames, slave=1):
+    """
+    写入后回读校验：所有帧合并为最少的块读取，每块只多一次往返
+    :param modbus_client: ModbusRtuOrTcp 实例
+    :param frames: RegisterWriteBatch.frames() 的结果 [(起始地址, 值列表), ...]
+    :param slave: 从站地址
+    :return: 不一致的寄存器 [(地址, 预期值, 实际值), ...]
+    """
+    views = modbus_client.read_ranges([(address, len(values)) for address, values in frames], slave=slave)
+    mismatches = []
+    for (address, values), actual in zip(frames, views):
+        mismatches.extend(compare_registers(address, values, actual))
+    return mismatches
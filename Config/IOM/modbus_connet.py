@@ -1,41 +1,228 @@
+import atexit
 import logging
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from pymodbus.client import ModbusSerialClient, ModbusTcpClient
+from pymodbus.exceptions import ModbusIOException, ConnectionException
 from Common.modbus_config import modbus_config
+from Config.IOM.modbus_batch import DEFAULT_MAX_GAP, plan_reads, split_reads
+from Config.IOM.modbus_timing import RtuTiming, RttEstimator
+from Config.IOM.modbus_shadow import RegisterShadow, SkippedWriteResponse
 import socket
 import serial
 import struct
-import crcmod
+
+
+# 关闭串口后等待Windows释放串口资源再重新打开（秒）
+PORT_RELEASE_DELAY = 0.5
+# 只有这些异常说明连接或串口本身不可用，需要关闭后重连；无响应等其他异常保持连接
+CONNECTION_ERRORS = (ConnectionException, serial.SerialException, OSError)
+
+
+def endpoint_key(conn_mode=None, port=None, ip=None, tcp_port=None):
+    """
+    生成端点标识：rtu为串口号（如COM11），tcp为ip:port
+    :return:
+    """
+    conn_mode = conn_mode or modbus_config['conn_mode']
+    if conn_mode == 'rtu':
+        return port or modbus_config['rtu']['port']
+    return f"{ip or modbus_config['tcp']['ip']}:{tcp_port or modbus_config['tcp']['port']}"
 
 
 class ModbusRtuOrTcp:
-    def __init__(self, conn_mode='rtu'):
+    def __init__(self, conn_mode=None, port=None, ip=None, tcp_port=None, shadow=False):
         """
         通过ModbusSerialClient对连接板子，可以通过串口与板子通信
-        :param conn_mode:
+        :param conn_mode: rtu/tcp，为空时使用config.json中的conn_mode
+        :param port: 串口号，为空时使用config.json中的配置
+        :param ip: tcp地址，为空时使用config.json中的配置
+        :param tcp_port: tcp端口，为空时使用config.json中的配置
+        :param shadow: 是否启用寄存器影子缓存，启用后跳过值未变化的写入
         """
-        if modbus_config['conn_mode'] == 'rtu':
-            self.client = ModbusSerialClient(port=modbus_config['rtu']['port'],
+        self.conn_mode = conn_mode or modbus_config['conn_mode']
+        self.client = None
+        self.shadow = RegisterShadow() if shadow else None
+        self.endpoint = endpoint_key(self.conn_mode, port, ip, tcp_port)
+        # 同一条总线上的事务必须串行，多线程共享连接时加锁
+        self.lock = threading.RLock()
+        self.timing = None
+        # 'read'/'write' -> RttEstimator：写入需要设备保存参数，响应时间与读取不同，分开统计
+        self.rtt = None
+        if self.conn_mode == 'rtu':
+            # 帧间隔和超时由波特率、校验位推算，响应超时再根据实测的往返时间自适应
+            self.timing = RtuTiming(modbus_config['rtu']['baudrate'], modbus_config['rtu']['parity'])
+            self.rtt = {'read': RttEstimator(), 'write': RttEstimator()}
+            self.client = ModbusSerialClient(port=port or modbus_config['rtu']['port'],
                                              baudrate=modbus_config['rtu']['baudrate'],
-                                             parity=modbus_config['rtu']['parity'])
-            self.client.inter_byte_timeout = 0.02
-            self.client.timeout = 0.5
-        elif modbus_config['conn_mode'] == 'tcp':
-            self.client = ModbusTcpClient(host=modbus_config['tcp']['ip'], port=modbus_config['tcp']['port'])
+                                             parity=modbus_config['rtu']['parity'],
+                                             timeout=self.rtt['read'].timeout())
+            # USB转485存在毫秒级的转发延迟，字符间隔不低于5ms，避免把一帧截断
+            self.client.inter_byte_timeout = max(self.timing.t35, 0.005)
+        elif self.conn_mode == 'tcp':
+            self.client = ModbusTcpClient(host=ip or modbus_config['tcp']['ip'],
+                                          port=tcp_port or modbus_config['tcp']['port'])
         else:
             logging.error('client not exits')
+            return
+        self.connect()
+
+    def connect(self):
+        """
+        建立连接，失败时关闭客户端，等待下次使用时重连
+        :return: 是否连接成功
+        """
+        # 重连后设备可能已重启，缓存的寄存器值不再可信
+        self.flush_shadow()
         try:
             self.client.connect()
         except Exception as e:
-            logging.error(f"modbus rtu connect fail: {str(e)}")
-            if hasattr(self, 'client') and self.client:
+            logging.error(f"modbus {self.conn_mode} connect fail: {str(e)}")
+            if self.client:
                 self.client.close()
         else:
-            logging.info('modbus rtu connect no error')
+            logging.info(f'modbus {self.conn_mode} connect no error')
         finally:
-            logging.info('modbus rtu connect execute completed')
+            logging.info(f'modbus {self.conn_mode} connect execute completed')
+        return self.is_healthy()
+
+    def is_healthy(self):
+        """
+        检查连接是否可用（串口已打开或tcp socket已建立）
+        :return:
+        """
+        try:
+            return bool(self.client and self.client.is_socket_open())
+        except Exception:
+            return False
+
+    def ensure_connected(self):
+        """
+        连接断开时自动重连
+        :return: 是否连接可用
+        """
+        if self.is_healthy():
+            return True
+        logging.warning(f'modbus {self.endpoint} 连接已断开，尝试重连')
+        if self.client:
+            self.client.close()
+            if self.conn_mode == 'rtu':
+                time.sleep(PORT_RELEASE_DELAY)
+            return self.connect()
+        return False
 
     def close(self):
-        self.client.close()
+        if self.client:
+            self.client.close()
+
+    def enable_shadow(self):
+        """
+        启用寄存器影子缓存
+        :return:
+        """
+        if self.shadow is None:
+            self.shadow = RegisterShadow()
+
+    def flush_shadow(self):
+        """
+        清空影子缓存（设备重启、重连或手动修改配置后调用）
+        :return:
+        """
+        if self.shadow is not None:
+            self.shadow.invalidate()
+
+    def _write_through(self, address, values, slave, write):
+        """
+        经过影子缓存写入：只写入与缓存不一致的最小区间，全部一致时跳过
+        :param address: 起始地址
+        :param values: 寄存器值列表
+        :param slave:
+        :param write: 执行写入的函数，参数为(起始地址, 值列表)
+        :return: 写入结果
+        """
+        with self.lock:
+            if self.shadow is None:
+                return write(address, values)
+            span = self.shadow.changed_span(slave, address, values)
+            if span is None:
+                return SkippedWriteResponse(address, len(values))
+            first, last = span
+            try:
+                resp = write(address + first, list(values[first:last]))
+            except Exception:
+                self.shadow.invalidate(slave, address, len(values))
+                raise
+            if resp.isError():
+                self.shadow.invalidate(slave, address, len(values))
+            else:
+                self.shadow.update(slave, address, values)
+            return resp
+
+    def _apply_timeout(self, timeout):
+        """
+        修改响应超时，串口已打开时同时修改pyserial的读超时
+        :param timeout: 秒
+        :return:
+        """
+        comm_params = getattr(self.client, 'comm_params', None)
+        if comm_params is not None:
+            comm_params.timeout_connect = timeout
+        serial_port = getattr(self.client, 'socket', None)
+        if serial_port is not None and hasattr(serial_port, 'timeout'):
+            serial_port.timeout = timeout
+
+    def _discard_input(self):
+        """丢弃串口接收缓冲区中的残留字节"""
+        serial_port = getattr(self.client, 'socket', None)
+        if serial_port is not None and hasattr(serial_port, 'reset_input_buffer'):
+            try:
+                serial_port.reset_input_buffer()
+            except Exception as e:
+                logging.warning(f"清空串口接收缓冲区失败: {str(e)}")
+
+    def _execute(self, request, request_bytes, response_bytes, kind='read'):
+        """
+        在总线锁内执行一次事务；RTU模式下按本次帧长设置超时，并记录设备响应时间用于自适应超时，
+        无响应时超时时间加倍
+        :param request: 执行事务的函数
+        :param request_bytes: 请求帧字节数
+        :param response_bytes: 正常响应帧字节数
+        :param kind: 'read'/'write'，使用对应的响应时间统计
+        :return: 事务结果
+        """
+        with self.lock:
+            self.ensure_connected()
+            rtt = self.rtt[kind] if self.rtt else None
+            wire_time = 0
+            if self.timing:
+                wire_time = self.timing.wire_time(request_bytes, response_bytes)
+                self._apply_timeout(wire_time + rtt.timeout())
+            start = time.perf_counter()
+            try:
+                resp = request()
+            except Exception as e:
+                if rtt:
+                    rtt.backoff()
+                # 设备可能已重启（串口不会因此断开），缓存的寄存器值不再可信
+                self.flush_shadow()
+                if isinstance(e, CONNECTION_ERRORS):
+                    # 连接或串口异常：关闭连接，下次调用时由ensure_connected重连
+                    self.close()
+                else:
+                    # 从站无响应或响应不完整：保持串口打开，丢弃残留的字节，避免与下一帧拼在一起
+                    self._discard_input()
+                raise
+            if isinstance(resp, ModbusIOException):
+                # 没有收到响应
+                self.flush_shadow()
+                self._discard_input()
+                if rtt:
+                    rtt.backoff()
+            elif rtt and (not resp.isError() or hasattr(resp, 'exception_code')):
+                # 设备返回的异常响应也是一次完整的往返
+                rtt.add(max(time.perf_counter() - start - wire_time, 0))
+            return resp
 
     def write_registers(self, address, values, slave):
         """
@@ -45,9 +232,12 @@ class ModbusRtuOrTcp:
         :param slave:
         :return:
         """
+        def write(write_address, write_values):
+            return self._execute(lambda: self.client.write_registers(address=write_address, values=write_values,
+                                                                     device_id=slave),
+                                 request_bytes=9 + 2 * len(write_values), response_bytes=8, kind='write')
         try:
-            resp = self.client.write_registers(address=address, values=values, device_id=slave)
-            return resp
+            return self._write_through(address, values, slave, write)
         except Exception as e:
             return e
 
@@ -59,9 +249,12 @@ class ModbusRtuOrTcp:
         :param slave:
         :return:
         """
+        def write(write_address, write_values):
+            return self._execute(lambda: self.client.write_register(address=write_address, value=write_values[0],
+                                                                    device_id=slave),
+                                 request_bytes=8, response_bytes=8, kind='write')
         try:
-            resp = self.client.write_register(address=address, value=value, device_id=slave)
-            return resp
+            return self._write_through(address, [value], slave, write)
         except Exception as e:
             return e
 
@@ -74,68 +267,242 @@ class ModbusRtuOrTcp:
         :return:
         """
         try:
-            resp = self.client.read_holding_registers(address=address, count=count, device_id=slave)
+            resp = self._execute(lambda: self.client.read_holding_registers(address=address, count=count,
+                                                                            device_id=slave),
+                                 request_bytes=8, response_bytes=5 + 2 * count)
             logging.info('read_measurement ret is:{}'.format(resp))
             if resp.isError():
                 return "resp is error"
             measurement = resp.registers
+            if self.shadow is not None:
+                self.shadow.update(slave, address, measurement)
             return measurement
         except Exception as e:
             return e
 
+    def read_ranges(self, ranges, slave, max_gap=DEFAULT_MAX_GAP):
+        """
+        一次读取多个(地址, 数量)区间：合并为最少的块读取后再拆回每个区间
+        :param ranges: [(起始地址, 寄存器数量), ...]
+        :param slave:
+        :param max_gap: 允许跨越的最大空隙（寄存器数），空隙较小时连同空隙一起读比多发一帧更快
+        :return: 与ranges一一对应的寄存器列表，读取失败的区间为None
+        """
+        blocks = plan_reads(ranges, max_gap=max_gap)
+        block_registers = []
+        with self.lock:
+            for address, count in blocks:
+                registers = self.read_measurement(address=address, count=count, slave=slave)
+                block_registers.append(registers if isinstance(registers, list) else None)
+        return split_reads(ranges, blocks, block_registers)
+
+
+class ModbusConnManager:
+    def __init__(self):
+        """
+        Modbus长连接管理：每个端点（串口号或ip:port）只保留一个连接，
+        取用时检查连接状态并自动重连，避免每次set/get都重新打开串口或握手
+        """
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn_mode=None, port=None, ip=None, tcp_port=None, shadow=False) -> ModbusRtuOrTcp:
+        """
+        获取端点对应的连接，不存在则创建，已断开则重连
+        :param conn_mode: rtu/tcp，为空时使用config.json中的conn_mode
+        :param port: 串口号
+        :param ip: tcp地址
+        :param tcp_port: tcp端口
+        :param shadow: 是否启用寄存器影子缓存
+        :return:
+        """
+        key = endpoint_key(conn_mode, port, ip, tcp_port)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = ModbusRtuOrTcp(conn_mode=conn_mode, port=port, ip=ip, tcp_port=tcp_port, shadow=shadow)
+                self._clients[key] = client
+                return client
+        if shadow:
+            client.enable_shadow()
+        client.ensure_connected()
+        return client
+
+    def close(self, key):
+        """
+        关闭并移除指定端点的连接
+        :param key: 串口号或ip:port
+        :return:
+        """
+        with self._lock:
+            client = self._clients.pop(key, None)
+        if client:
+            client.close()
+
+    def close_all(self):
+        """
+        关闭所有连接（会话结束时调用）
+        :return:
+        """
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logging.error(f"关闭 Modbus 客户端 {client.endpoint} 时出错: {str(e)}")
+
+
+conn_manager = ModbusConnManager()
+atexit.register(conn_manager.close_all)
+
 
 class ModbusTcp6A:
-    def __init__(self, timeout=0.5):
-        self.ip = modbus_config['tcp']['ip']
-        self.port = modbus_config['tcp']['port']
+    def __init__(self, timeout=0.5, ip=None, port=None, max_in_flight=4):
+        """
+        0x6A/0x03 的Modbus TCP长连接会话：socket保持打开，事务号递增，
+        可同时发出多个请求，后台线程按MBAP长度字段重组报文并按事务号匹配响应
+        :param timeout: 连接和等待响应的超时时间（秒）
+        :param ip: 为空时使用config.json中的配置
+        :param port: 为空时使用config.json中的配置
+        :param max_in_flight: 同时在途的最大请求数
+        """
+        self.ip = ip or modbus_config['tcp']['ip']
+        self.port = port or modbus_config['tcp']['port']
+        self.timeout = timeout
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.settimeout(timeout)
         self.isSucess = None
+        self._tid = 0
+        self._pending = {}  # 事务号 -> Future
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._closed = False
         try:
             self.socket.connect((self.ip, self.port))
-        except TimeoutError:
+        except (TimeoutError, OSError):
             self.isSucess = False
+            self.socket.close()
             raise Exception("modbus tcp connect fail")
         else:
             print("modbus tcp connect success")
             self.isSucess = True
+        self._reader = threading.Thread(target=self._recv_loop, name='modbus-tcp-6a-recv', daemon=True)
+        self._reader.start()
 
-    def read_funcode_03(self, addr: int, count: int = 1, slaveid: int = 1):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._closed = True
+        self.isSucess = False
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
 
-        _read_byarry = bytearray([
-            0x00, 0x01,
-            0x00, 0x00,
-            0x00, 0x06,
-            slaveid,
+    def _recv_loop(self):
+        """
+        接收线程：TCP是字节流，一次recv可能是半个报文或多个报文，按MBAP长度字段切分
+        """
+        buffer = bytearray()
+        while not self._closed:
+            try:
+                chunk = self.socket.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not chunk:
+                break
+            buffer.extend(chunk)
+            # MBAP：事务号(2) 协议号(2) 长度(2) 单元标识(1)，长度字段包含单元标识和PDU
+            while len(buffer) >= 7:
+                frame_length = 6 + (buffer[4] << 8 | buffer[5])
+                if len(buffer) < frame_length:
+                    break
+                frame = bytes(buffer[:frame_length])
+                del buffer[:frame_length]
+                tid = frame[0] << 8 | frame[1]
+                with self._lock:
+                    future = self._pending.pop(tid, None)
+                if future is None:
+                    logging.warning(f"modbus tcp 收到未知事务号 {tid} 的响应: {frame.hex()}")
+                    continue
+                self._in_flight.release()
+                future.set_result(frame)
+        self.isSucess = False
+        # 连接断开，所有未完成的请求失败
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            self._in_flight.release()
+            future.set_exception(Exception("modbus tcp connection closed"))
+
+    def submit(self, pdu, slaveid):
+        """
+        发送一个请求，不等待响应
+        :param pdu: 功能码及数据
+        :param slaveid: 单元标识
+        :return: Future，结果为完整响应报文（含MBAP头）
+        """
+        if not self.isSucess:
+            raise Exception("modbus tcp connect fail")
+        if not self._in_flight.acquire(timeout=self.timeout):
+            raise Exception("modbus tcp too many requests in flight")
+        future = Future()
+        with self._lock:
+            self._tid = self._tid % 0xFFFF + 1
+            tid = future.tid = self._tid
+            self._pending[tid] = future
+            length = len(pdu) + 1
+            request = bytearray([
+                tid >> 8 & 0xff, tid & 0xff,
+                0x00, 0x00,
+                length >> 8 & 0xff, length & 0xff,
+                slaveid
+            ]) + pdu
+            try:
+                self.socket.sendall(request)
+            except OSError:
+                self._pending.pop(tid, None)
+                self._in_flight.release()
+                raise Exception("modbus tcp send fail")
+        return future
+
+    def _result(self, future):
+        try:
+            frame = future.result(self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                expired = self._pending.pop(future.tid, None)
+            if expired is not None:
+                self._in_flight.release()
+            raise Exception("modbus tcp response timeout")
+        if frame[7] & 0x80:
+            raise Exception(f"modbus tcp exception response, code: {frame[8]}")
+        return frame
+
+    def submit_read_funcode_03(self, addr: int, count: int = 1, slaveid: int = 1):
+        pdu = bytearray([
             0x03,
             addr >> 8 & 0xff,
             addr & 0xff,
             count >> 8 & 0xff,
             count & 0xff
         ])
-        print(_read_byarry)
-        if self.isSucess:
-            try:
-                self.socket.send(_read_byarry)
-            except TimeoutError:
-                self.socket.close()
-                raise Exception("mosbus tcp read fail")
-            else:
-                byte = self.socket.recv(1024)
-                self.socket.close()
-                return struct.unpack(f">{count}H", bytearray(byte[9:]))
+        return self.submit(pdu, slaveid)
 
-    def write_registers(self, start_addr, values: list, slaveid, funccode=0x6A):
-        length = len(values) * 2 + 7
-        # 报文头
-        bmap = bytearray([
-            0x00, 0x01,
-            0x00, 0x00,
-            length >> 8 & 0xff,  # 写入的字节数量高位
-            length & 0xff,  # 写入的字节数量低位
-            slaveid  # 单元标识
-        ])
+    def read_funcode_03(self, addr: int, count: int = 1, slaveid: int = 1):
+        frame = self._result(self.submit_read_funcode_03(addr, count, slaveid))
+        return struct.unpack(f">{count}H", frame[9:9 + count * 2])
 
+    def submit_write_registers(self, start_addr, values: list, slaveid, funccode=0x6A):
         pdu = bytearray(
             [
                 funccode,  # 功能码
@@ -148,26 +515,133 @@ class ModbusTcp6A:
         )
         for value in values:
             pdu.extend([(value >> 8) & 0xff, value & 0xff])
+        return self.submit(pdu, slaveid)
 
-        request = bmap + pdu
-        if self.isSucess:
-            self.socket.send(request)
-            data_recv = self.socket.recv(1024)
-            self.socket.close()
-        else:
-            self.socket.close()
-            raise Exception("modbus tcp connect fail")
+    def write_registers(self, start_addr, values: list, slaveid, funccode=0x6A):
+        data_recv = self._result(self.submit_write_registers(start_addr, values, slaveid, funccode))
         if funccode == 0x6A:
             return start_addr, len(values), data_recv  # 返回报文
         else:
             return struct.unpack(f">{len(values) * 2}H", bytearray(data_recv[8:])), data_recv
 
+    def write_many(self, writes, slaveid, funccode=0x6A):
+        """
+        流水线写入多组寄存器（如产线批量写序列号、MAC地址），不必逐条等待响应
+        :param writes: [(起始地址, 值列表), ...]
+        :param slaveid: 单元标识
+        :param funccode: 功能码
+        :return: 与writes一一对应的响应报文
+        """
+        futures = [self.submit_write_registers(start_addr, values, slaveid, funccode) for start_addr, values in writes]
+        return [self._result(future) for future in futures]
+
+
+class RtuFrameError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+def _make_crc16_table():
+    """
+    预计算Modbus CRC16（多项式0xA001，反射）查表
+    :return:
+    """
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC16_TABLE = _make_crc16_table()
+
+
+def crc16_modbus(data):
+    """
+    查表计算Modbus CRC16
+    :param data: bytes/bytearray/memoryview
+    :return: CRC值，帧中低字节在前
+    """
+    crc = 0xFFFF
+    table = _CRC16_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def build_rtu_frame(slave, funccode, address, count, values=None):
+    """
+    构建RTU请求帧（含CRC）
+    :param slave: 从站地址
+    :param funccode: 0x03读保持寄存器；0x10/0x6A写多个寄存器
+    :param address: 起始地址
+    :param count: 寄存器数量
+    :param values: 写入的寄存器值列表（仅写功能码）
+    :return: bytearray
+    """
+    if funccode == 0x03:
+        frame = bytearray(8)
+        struct.pack_into('>BBHH', frame, 0, slave, funccode, address, count)
+    else:
+        frame = bytearray(9 + 2 * len(values))
+        struct.pack_into(f'>BBHHB{len(values)}H', frame, 0, slave, funccode, address, count, 2 * len(values),
+                         *values)
+    crc = crc16_modbus(memoryview(frame)[:-2])
+    frame[-2] = crc & 0xFF
+    frame[-1] = crc >> 8
+    return frame
+
+
+def rtu_response_length(funccode, count):
+    """
+    根据功能码计算正常响应的长度
+    :param funccode: 0x03/0x10/0x6A
+    :param count: 寄存器数量
+    :return: 字节数
+    """
+    if funccode == 0x03:
+        return 5 + 2 * count  # 从站 功能码 字节数 数据 CRC
+    return 8  # 从站 功能码 起始地址 数量 CRC
+
+
+def rtu_transact(ser, frame, funccode, count):
+    """
+    发送请求并按预期长度读取响应，校验从站、功能码和CRC
+    :param ser: serial.Serial 实例
+    :param frame: build_rtu_frame 生成的请求帧
+    :param funccode: 功能码
+    :param count: 寄存器数量
+    :return: 完整响应帧（bytes）
+    """
+    ser.reset_input_buffer()
+    ser.write(frame)
+    # 异常响应只有5字节，先读5字节判断是否为异常响应，再一次读完剩余部分，避免异常时等满超时
+    response = ser.read(5)
+    if len(response) < 5:
+        raise RtuFrameError(f"RTU响应超时，收到: {response.hex()}")
+    if response[1] & 0x80:
+        if crc16_modbus(response) != 0:
+            raise RtuFrameError(f"RTU异常响应CRC错误: {response.hex()}")
+        raise RtuFrameError(f"RTU异常响应，功能码0x{response[1]:02X}，异常码{response[2]}")
+    expected = rtu_response_length(funccode, count)
+    response += ser.read(expected - 5)
+    if len(response) != expected:
+        raise RtuFrameError(f"RTU响应长度错误，预期{expected}字节，收到: {response.hex()}")
+    # 包含CRC在内的整帧再算一次CRC结果为0
+    if crc16_modbus(response) != 0:
+        raise RtuFrameError(f"RTU响应CRC错误: {response.hex()}")
+    if response[0] != frame[0] or response[1] != funccode:
+        raise RtuFrameError(f"RTU响应从站或功能码不匹配: {response.hex()}")
+    return response
+
 
 class SerialRtu:
-    def __init__(self, conn_mode='rtu'):
+    def __init__(self, conn_mode='rtu', timeout=0.5):
         try:
             self.ser = serial.Serial(port=modbus_config['rtu']['port'], baudrate=modbus_config['rtu']['baudrate'],
-                                     parity=modbus_config['rtu']['parity'])
+                                     parity=modbus_config['rtu']['parity'], timeout=timeout)
             if self.ser.is_open:
                 logging.info("打开串口成功。")
             else:
@@ -178,44 +652,38 @@ class SerialRtu:
     def close(self):
         self.ser.close()
 
+    def read_holding_registers(self, address, count, slave):
+        """
+        0x03读取保持寄存器
+        :param address:
+        :param count:
+        :param slave:
+        :return: 寄存器值元组
+        """
+        frame = build_rtu_frame(slave, 0x03, address, count)
+        response = rtu_transact(self.ser, frame, 0x03, count)
+        return struct.unpack_from(f'>{count}H', response, 3)
+
+    def write_registers(self, address, values: list, slave, funccode=0x10):
+        """
+        0x10（或0x6A）写入多个寄存器
+        :param address:
+        :param values:
+        :param slave:
+        :param funccode:
+        :return: 响应回显的(起始地址, 数量)
+        """
+        frame = build_rtu_frame(slave, funccode, address, len(values), values)
+        response = rtu_transact(self.ser, frame, funccode, len(values))
+        return struct.unpack_from('>HH', response, 2)
+
     def write_func6A_registers(self, address, count, values: list, slave, funccode=0x6A):
-        data = [
-            slave,
-            funccode,  # 功能码
-            address >> 8 & 0xff,  # 起始地址高位字节
-            address & 0xff,  # 起始地址低位字节
-            len(values) >> 8 & 0xff,  # 写入的数量高字节
-            len(values) & 0xff,  # 写入的数量低字节
-            len(values) * 2  # 字节数
-        ]
-        pdu = bytearray(data)
-        for value in values:
-            pdu.extend([(value >> 8) & 0xff, value & 0xff])
-        crc32_func = crcmod.mkCrcFun(0x18005, rev=True, initCrc=0xFFFF, xorOut=0x0000)
-        ret1 = str(hex(crc32_func(pdu)))
-        pdu.extend([int(ret1[4:6], 16) & 0xff])
-        pdu.extend([int(ret1[2:4], 16) & 0xff])
         try:
-            address_hex = hex(int(address))[2:6]
-            if count < 16:
-                count_hex = '0' + hex(int(count))[2:4]
-            else:
-                count_hex = hex(int(count))[2:4]
-            if count < 8:
-                count_hex_2 = '0' + hex(int(count * 2))[2:4]
-            else:
-                count_hex_2 = hex(int(count * 2))[2:4]
-            compare_str = str('0' + str(slave)) + '6a' + str(address_hex) + '00' + str(count_hex)
-            ret1 = self.ser.write(pdu)
-            str1 = ''
-            for i in range(6):
-                byte_seq = self.ser.read()
-                byte_seq1 = byte_seq[0]
-                str1 += f'0x{byte_seq1:02x}'
-            str1 = str1.replace('0x', '')
-            if str1 == compare_str:
-                return True
-            else:
-                return False
+            frame = build_rtu_frame(slave, funccode, address, len(values), values)
+            response = rtu_transact(self.ser, frame, funccode, len(values))
+            return struct.unpack_from('>HH', response, 2) == (address, count)
+        except RtuFrameError as e:
+            logging.error(e.msg)
+            return False
         except Exception as e:
-            return e
\ No newline at end of file
+            return e
@@ -0,0 +1,105 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from Common.modbus_config import modbus_config
+from Config.IOM.modbus_connet import conn_manager, endpoint_key
+
+
+class BoardEndpoint:
+    def __init__(self, name=None, conn_mode=None, port=None, ip=None, tcp_port=None, slave=1):
+        """
+        一块IOM板子的地址：所在总线（串口号或ip:port）+ 从站地址
+        :param name: 板子名称，为空时使用"总线#从站地址"
+        :param conn_mode: rtu/tcp，为空时使用config.json中的conn_mode
+        :param port: 串口号
+        :param ip: tcp地址
+        :param tcp_port: tcp端口
+        :param slave: 从站地址（slaveid）
+        """
+        self.conn_mode = conn_mode
+        self.port = port
+        self.ip = ip
+        self.tcp_port = tcp_port
+        self.slave = slave
+        self.bus = endpoint_key(conn_mode, port, ip, tcp_port)
+        self.name = name or f"{self.bus}#{slave}"
+
+    def client(self):
+        """
+        取该板子所在总线的长连接（同一总线上的板子共用一个连接）
+        :return: ModbusRtuOrTcp 实例
+        """
+        return conn_manager.get(conn_mode=self.conn_mode, port=self.port, ip=self.ip, tcp_port=self.tcp_port)
+
+    def __repr__(self):
+        return f"BoardEndpoint({self.name})"
+
+
+def load_board_endpoints():
+    """
+    从config.json读取板子列表（"boards"，每项字段同BoardEndpoint参数），
+    未配置时返回默认的单块板子
+    :return: [BoardEndpoint, ...]
+    """
+    boards = modbus_config.get('boards')
+    if not boards:
+        return [BoardEndpoint(slave=modbus_config['rtu'].get('slaveid', 1))]
+    endpoints = [BoardEndpoint(**board) for board in boards]
+    check_unique_names(endpoints)
+    return endpoints
+
+
+def check_unique_names(endpoints):
+    """
+    结果按板子名称返回，名称重复时结果会互相覆盖
+    :param endpoints: [BoardEndpoint, ...]
+    :return:
+    """
+    names = set()
+    for endpoint in endpoints:
+        if endpoint.name in names:
+            raise ValueError(f"板子名称重复: {endpoint.name}")
+        names.add(endpoint.name)
+
+
+class MultiBoardExecutor:
+    def __init__(self, endpoints):
+        """
+        多板并行执行：每条物理总线一个工作线程，不同总线之间并行，
+        同一总线上的板子（不同slaveid）严格按顺序执行
+        :param endpoints: [BoardEndpoint, ...]
+        """
+        self.endpoints = list(endpoints)
+        check_unique_names(self.endpoints)
+        # 总线 -> 该总线上的板子，保持传入顺序
+        self.buses = {}
+        for endpoint in self.endpoints:
+            self.buses.setdefault(endpoint.bus, []).append(endpoint)
+
+    @staticmethod
+    def _run_bus(endpoints, operation, args, kwargs):
+        results = {}
+        for endpoint in endpoints:
+            try:
+                results[endpoint.name] = operation(endpoint.client(), endpoint.slave, *args, **kwargs)
+            except Exception as e:
+                logging.error(f"{endpoint.name} 执行失败: {str(e)}")
+                results[endpoint.name] = e
+        return results
+
+    def run(self, operation, *args, **kwargs):
+        """
+        在所有板子上执行同一个操作，不同总线并行；驱动CL3021源的操作（如iom_test）在每个测试点内部持有source_lock，
+        板子配置和等待期间不占用源
+        :param operation: 函数，调用方式为 operation(modbus_client, slave, *args, **kwargs)，
+                          如 lambda client, slave: set_all_unit("°C", modbus_client=client, slave=slave)
+        :return: {板子名称: 返回值}，执行失败的板子返回值为异常对象，顺序与endpoints一致
+        """
+        if not self.buses:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(self.buses), thread_name_prefix='modbus-bus') as pool:
+            futures = [pool.submit(self._run_bus, endpoints, operation, args, kwargs)
+                       for endpoints in self.buses.values()]
+            bus_results = {}
+            for future in futures:
+                bus_results.update(future.result())
+        return {endpoint.name: bus_results[endpoint.name] for endpoint in self.endpoints}
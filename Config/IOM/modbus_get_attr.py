@@ -1,11 +1,20 @@
-import os
 import math
-import pandas as pd
 from typing import Any
-from Config.IOM.modbus_connet import ModbusRtuOrTcp
 import struct
+from array import array
 from datetime import datetime
-from Config.IOM.modbus_connet import ModbusRtuOrTcp
+from Config.IOM.modbus_connet import ModbusRtuOrTcp, conn_manager
+from Config.IOM.modbus_schema import AI_PARAM, AO_PARAM, AI_MEASUREMENT
+from Common.tolerance import parse_range, judge_block
+from Common.result_sink import default_sink
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 无numpy时按dtype存放解码结果的array类型码
+FLOAT_TYPECODES = {'float32': 'f', 'float64': 'd'}
 
 
 def convert_energy_registers(registers_data):
@@ -36,69 +45,91 @@ def convert_energy_registers(registers_data):
     return results
 
 
-def excel_append_ai_measurement(ai_number, input_data, measurement, range_str, write_to_file=False):
+def decode_float_registers(registers_data, dtype='float64', as_list=False):
+    """
+    批量将寄存器解码为浮点数，字序与convert_energy_registers一致（前一个寄存器为高16位），
+    全0寄存器对解码为0.0。
+    两个大端16位寄存器按顺序排列的字节正好是一个大端32位浮点数，一次字节视图转换即可完成解码。
+    :param registers_data: 一维寄存器序列，或二维(样本数, 寄存器数)数组
+    :param dtype: 'float32' 或 'float64'
+    :param as_list: 是否返回list
+    :return: numpy可用时返回dtype类型的ndarray，形状为(寄存器数/2,)或(样本数, 寄存器数/2)；
+             否则返回dtype对应的array.array（二维时为其列表）；as_list=True时返回list
+    """
+    if np is not None:
+        words = np.ascontiguousarray(registers_data, dtype='>u2')
+        # 寄存器中可能出现signaling NaN，转换时不告警
+        with np.errstate(invalid='ignore'):
+            values = words.view('>f4').astype(dtype)
+        return values.tolist() if as_list else values
+    if str(dtype) not in FLOAT_TYPECODES:
+        raise ValueError(f"不支持的dtype: {dtype}")
+    # 无numpy时使用struct整块解码，结果与numpy完全一致
+    if len(registers_data) and isinstance(registers_data[0], (list, tuple)):
+        return [decode_float_registers(row, dtype, as_list) for row in registers_data]
+    count = len(registers_data)
+    values = struct.unpack(f'>{count // 2}f', struct.pack(f'>{count}H', *registers_data))
+    return list(values) if as_list else array(FLOAT_TYPECODES[str(dtype)], values)
+
+
+def judge_measurement(measurement, range_str, bounds=None):
+    """
+    判定实测值是否在范围内
+    measurement -- 实测值 (浮点数)
+    range_str -- 范围字符串 (如 "-35.4000~-34.600")
+    bounds -- 多次采样均值的置信区间 (下界, 上界)，指定时整个区间都在范围内才判定合格
+    返回 "合格" 或 "不合格"，实测值为None（读取失败）时判定为不合格
+    """
+    # 解析结果有缓存，相同的范围字符串只解析一次
+    range_min, range_max = parse_range(range_str)
+    judge_min, judge_max = bounds if bounds else (measurement, measurement)
+    passed, _ = judge_block(judge_min, range_min, range_max, judge_max)
+    return "合格" if passed else "不合格"
+
+
+def excel_append_ai_measurement(ai_number, input_data, measurement, range_str, write_to_file=False, bounds=None,
+                                sink=None, result=None, timestamp=None):
     """
-    将AI测量数据追加到Excel文件中
+    判定AI测量数据并记录结果
     ai_number -- AI口编号 (1-16的整数)
     input_data -- 输入值 (浮点数)
-    measurement -- 实测值 (浮点数)
+    measurement -- 实测值 (浮点数)，多次采样时为均值
     range_str -- 范围字符串 (如 "-35.4000~-34.600")
-    write_to_file -- 是否写入Excel文件 (布尔值，默认为True)
+    write_to_file -- 未指定sink时，是否写入共享的默认sink（ai_i_measurements.xlsx，进程退出时生成） (布尔值，默认为False)
+    bounds -- 多次采样均值的置信区间 (下界, 上界)，指定时整个区间都在范围内才判定合格
+    sink -- Common.result_sink.ResultSink，指定时结果行交给sink缓冲写入，不再每次读写整个Excel文件
+    result -- 已经批量判定的结果（"合格"/"不合格"），指定时不再逐个判定
+    timestamp -- 测试时间 (datetime)，默认为当前时间
     """
     # 检查AI口编号范围
     if not 1 <= ai_number <= 16:
         raise ValueError("AI口编号必须为1-16的整数")
-    # 解析范围字符串
-    try:
-        if '~' not in range_str:
-            # 如果没有'~'符号，尝试将其解析为单个数字
-            single_value = float(range_str.strip())
-            range_min = range_max = single_value
-        else:
-            range_min, range_max = map(float, range_str.strip().split('~'))
-    except ValueError:
-        raise ValueError("范围格式错误，应类似'-35.4000~-34.600'")
+    if result is None:
+        result = judge_measurement(measurement, range_str, bounds)
     # 生成当前时间戳
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = (timestamp or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
     # 创建新数据行
     new_row = {
         "时间": timestamp,
         "AI口": f"AI{ai_number:02d}",
         "输入值": input_data,
         "实测值": measurement,
-        "范围": range_str
+        "范围": range_str,
+        "判定结果": result
     }
-    # 生成判定结果
-    if range_min <= measurement <= range_max:
-        new_row["判定结果"] = "合格"
-    else:
-        new_row["判定结果"] = "不合格"
-    # 文件路径
-    # 生成判定结果
-    result = new_row["判定结果"]
-    
-    # 仅当write_to_file为True时执行文件写入操作
-    if write_to_file:
-        file_path = "ai_i_measurements.xlsx"
-        # 创建分割行（全空值行）
-        separator_row = {col: "" for col in new_row.keys()}  # 所有列值为空字符串
-        # 处理文件存在与否的逻辑
-        if os.path.exists(file_path):
-            df_existing = pd.read_excel(file_path)
-            # 合并新数据与分割行
-            df_combined = pd.concat([df_existing, pd.DataFrame([new_row]), pd.DataFrame([separator_row])],
-                                    ignore_index=True)
-        else:
-            # 首次创建文件时，先添加数据行再添加分割行
-            df_combined = pd.concat([pd.DataFrame([new_row]), pd.DataFrame([separator_row])], ignore_index=True)
-        df_combined.to_excel(file_path, index=False)
-    
+    if sink is None and write_to_file:
+        # 不再每行读写整个Excel文件，交给共享的默认sink，进程退出时一次生成文件
+        sink = default_sink()
+    if sink is not None:
+        sink.write(new_row)
     return result
 
 
-def get_all_ai_y_measurements(modbus_client: ModbusRtuOrTcp):
+def get_all_ai_y_measurements(modbus_client: ModbusRtuOrTcp, slave=1):
     """
     读取所有AI测量值
+    :param modbus_client: ModbusRtuOrTcp 实例
+    :param slave: 从站地址
     :return:
     """
     # 列表推导式生成 ['AI1','AI2','AI3',,,,]
@@ -106,8 +137,9 @@ def get_all_ai_y_measurements(modbus_client: ModbusRtuOrTcp):
     ret = {}
     try:
         # 读取多个寄存器
-        energy: list = modbus_client.read_measurement(address=0x3700, count=32, slave=1)
-        measurement_value_list = convert_energy_registers(energy)
+        energy: list = modbus_client.read_measurement(address=AI_MEASUREMENT.base,
+                                                      count=AI_MEASUREMENT.stride * AI_MEASUREMENT.count, slave=slave)
+        measurement_value_list = decode_float_registers(energy, as_list=True)
         # 合并两个列表为字典
         for key, value in zip(measurement_key_list, measurement_value_list):
             ret[key] = value
@@ -116,24 +148,70 @@ def get_all_ai_y_measurements(modbus_client: ModbusRtuOrTcp):
     return ret
 
 
-def get_single_ai_y_measurement(ai_number, modbus_client) -> float | None:
+def get_single_ai_y_measurement(ai_number, modbus_client, slave=1) -> float | None:
     """
     读取单个AI输入
     :param ai_number: 1-16
     :param modbus_client: pytest fixture 提供的 ModbusRtuOrTcp 实例
+    :param slave: 从站地址
     :return: 解码后的 float 类型值
     """
-    # 生成AI1-AI16对应16个寄存器地址的键值对:{1:0x3500,2:0x3502,3:0x3504,,,,,,}
-    measurement_map = {i: 0x3700 + 2 * (i - 1) for i in range(1, 17)}
     try:
-        registers = modbus_client.read_measurement(address=measurement_map[ai_number], count=2, slave=1)
+        registers = modbus_client.read_measurement(address=AI_MEASUREMENT.address(ai_number), count=2, slave=slave)
         measurement_value = convert_energy_registers(registers)
         return measurement_value[0]
     except Exception as e:
         return None
 
 
+def get_ai_y_measurements(ai_numbers, modbus_client: ModbusRtuOrTcp, slave=1):
+    """
+    读取多个AI输入：所有通道的读取合并为最少的块读取
+    :param ai_numbers: AI口列表，如[1, 3, 5]
+    :param modbus_client: ModbusRtuOrTcp 实例
+    :param slave: 从站地址
+    :return: {'AI1': value, ...}，读取失败的通道为None
+    """
+    ranges = AI_MEASUREMENT.ranges(ai_numbers)
+    ret = {}
+    for ai_number, registers in zip(ai_numbers, modbus_client.read_ranges(ranges, slave=slave)):
+        ret[f'AI{ai_number}'] = convert_energy_registers(registers)[0] if registers else None
+    return ret
+
+
+def get_all_param(schema, modbus_client: ModbusRtuOrTcp, slave=1):
+    """
+    块读取并解码所有通道的配置
+    :param schema: AI_PARAM 或 AO_PARAM
+    :param modbus_client: ModbusRtuOrTcp 实例
+    :param slave: 从站地址
+    :return: [{字段名: 工程值}, ...]，按通道顺序，读取失败的通道为None
+    """
+    return [schema.decode(registers) if registers else None
+            for registers in modbus_client.read_ranges(schema.ranges(), slave=slave)]
+
+
+def get_all_ai_param(modbus_client: ModbusRtuOrTcp, slave=1):
+    """
+    读取所有AI口配置
+    :param modbus_client: ModbusRtuOrTcp 实例
+    :param slave: 从站地址
+    :return: [{'type', 'top_limit', 'bot_limit', 'line_number', 'X1'...'Y4'}, ...]
+    """
+    return get_all_param(AI_PARAM, modbus_client, slave)
+
+
+def get_all_ao_param(modbus_client: ModbusRtuOrTcp, slave=1):
+    """
+    读取所有AO口配置
+    :param modbus_client: ModbusRtuOrTcp 实例
+    :param slave: 从站地址
+    :return: [{'type', 'top_limit', 'bot_limit', 'line_number', 'X1'...'Y4'}, ...]
+    """
+    return get_all_param(AO_PARAM, modbus_client, slave)
+
+
 if __name__ == "__main__":
-    modbus_client = ModbusRtuOrTcp()
+    modbus_client = conn_manager.get()
     register = modbus_client.read_measurement(address=0x3000, count=1, slave=1)
     print(register)
\ No newline at end of file
@@ -0,0 +1,263 @@
+import logging
+import math
+import struct
+
+# 字段类型 -> struct格式字符（均为大端序，u16/i32/f32分别占1/2/2个寄存器，str4为GBK编码的4字节字符串）
+FIELD_FORMATS = {'u16': 'H', 'i32': 'i', 'f32': 'f', 'str4': '4s'}
+FIELD_REGISTERS = {'u16': 1, 'i32': 2, 'f32': 2, 'str4': 2}
+
+
+class Field:
+    def __init__(self, name, offset, kind, scale=1):
+        """
+        通道块中的一个字段
+        :param name: 字段名
+        :param offset: 相对通道块起始地址的寄存器偏移
+        :param kind: 'u16'、'i32'、'f32' 或 'str4'
+        :param scale: 缩放倍数，i32字段写入值 = 工程值 * scale（四舍五入，远离0）
+        """
+        if kind not in FIELD_FORMATS:
+            raise ValueError(f"不支持的字段类型: {kind}")
+        self.name = name
+        self.offset = offset
+        self.kind = kind
+        self.scale = scale
+        self.registers = FIELD_REGISTERS[kind]
+
+    def encode(self, value):
+        """工程值 -> struct打包用的原始值"""
+        if self.kind == 'i32':
+            return scale_to_int32(value, self.scale)
+        if self.kind == 'str4':
+            return encode_gbk4(value)
+        return value
+
+    def decode(self, raw):
+        """struct解包的原始值 -> 工程值"""
+        if self.kind == 'i32':
+            return raw / self.scale if self.scale != 1 else raw
+        if self.kind == 'str4':
+            return raw.rstrip(b'\x00').decode('gbk', errors='replace')
+        return raw
+
+    def __repr__(self):
+        return f"Field({self.name}, +0x{self.offset:X}, {self.kind})"
+
+
+def scale_to_int32(value, scale=1000):
+    """
+    工程值缩放并取整为32位有符号整数（四舍五入，远离0）
+    :param value: 整数或浮点数
+    :param scale: 缩放倍数
+    :return:
+    """
+    scaled_value = value * scale
+    if not math.isfinite(scaled_value):
+        raise ValueError("转换后值为非有限数(inf或nan)")
+    if scaled_value >= 0:
+        int_value = math.floor(scaled_value + 0.5)
+    else:
+        int_value = math.ceil(scaled_value - 0.5)
+    if int_value < -2147483648 or int_value > 2147483647:
+        raise ValueError(f"转换后值 {int_value} 超出32位整数范围")
+    return int_value
+
+
+def encode_gbk4(value):
+    """
+    字符串GBK编码后截取/补0为4字节，编码失败时为4个0
+    :param value:
+    :return:
+    """
+    try:
+        return value.encode('gbk')[:4]
+    except Exception as e:
+        logging.error(f"字符串GBK编码失败: {e}")
+        return b''
+
+
+class BlockSchema:
+    def __init__(self, name, base, stride, count, fields):
+        """
+        按通道重复的寄存器块描述，编译为预先生成的struct编解码器，
+        一次调用即可编码/解码一个通道或全部通道
+        :param name: 块名称
+        :param base: 第1个通道的起始地址
+        :param stride: 相邻通道的地址间隔（寄存器数）
+        :param count: 通道数
+        :param fields: [Field, ...]，字段需连续覆盖整个通道块（stride个寄存器）
+        """
+        self.name = name
+        self.base = base
+        self.stride = stride
+        self.count = count
+        self.fields = sorted(fields, key=lambda field: field.offset)
+        self.field_map = {field.name: field for field in self.fields}
+        offset = 0
+        for field in self.fields:
+            if field.offset != offset:
+                raise ValueError(f"{name} 字段 {field.name} 偏移应为0x{offset:X}，实际为0x{field.offset:X}")
+            offset += field.registers
+        if offset != stride:
+            raise ValueError(f"{name} 字段共{offset}个寄存器，与通道间隔{stride}不一致")
+        self.format = ''.join(FIELD_FORMATS[field.kind] for field in self.fields)
+        # 单通道编解码器
+        self.codec = struct.Struct('>' + self.format)
+        self.registers_codec = struct.Struct(f'>{stride}H')
+        # 全部通道编解码器，通道连续排列时（stride即块长度）一次打包/解包
+        self.all_codec = struct.Struct('>' + self.format * count)
+        self.all_registers_codec = struct.Struct(f'>{stride * count}H')
+
+    def address(self, channel):
+        """
+        :param channel: 通道号，从1开始
+        :return: 该通道块的起始地址
+        """
+        if not 1 <= channel <= self.count:
+            raise ValueError(f"{self.name} 通道号必须为1-{self.count}")
+        return self.base + self.stride * (channel - 1)
+
+    def field_address(self, channel, name):
+        """
+        :param channel: 通道号，从1开始
+        :param name: 字段名
+        :return: 该通道指定字段的地址
+        """
+        return self.address(channel) + self.field_map[name].offset
+
+    def ranges(self, channels=None):
+        """
+        :param channels: 通道号列表，为空时为全部通道
+        :return: [(起始地址, 寄存器数量), ...]，可直接用于read_ranges
+        """
+        channels = channels or range(1, self.count + 1)
+        return [(self.address(channel), self.stride) for channel in channels]
+
+    def continuations(self):
+        """
+        :return: 所有通道中多寄存器字段除第一个寄存器以外的地址，写入时不能从这些地址切开
+        """
+        return [self.address(channel) + field.offset + n for channel in range(1, self.count + 1)
+                for field in self.fields for n in range(1, field.registers)]
+
+    def _raw_values(self, record):
+        return [field.encode(record[field.name]) for field in self.fields]
+
+    def encode(self, record):
+        """
+        :param record: {字段名: 工程值}，需包含所有字段
+        :return: 一个通道的寄存器列表（stride个）
+        """
+        return list(self.registers_codec.unpack(self.codec.pack(*self._raw_values(record))))
+
+    def encode_field(self, name, value):
+        """
+        :param name: 字段名
+        :param value: 工程值
+        :return: 该字段的寄存器列表（1或2个）
+        """
+        field = self.field_map[name]
+        packed = struct.pack('>' + FIELD_FORMATS[field.kind], field.encode(value))
+        return list(struct.unpack(f'>{field.registers}H', packed))
+
+    def encode_all(self, records):
+        """
+        :param records: count个{字段名: 工程值}，或一个字典表示所有通道写入相同的值
+        :return: 全部通道连续排列的寄存器列表，从base开始一次写入
+        """
+        if isinstance(records, dict):
+            records = [records] * self.count
+        if len(records) != self.count:
+            raise ValueError(f"{self.name} 需要{self.count}个通道的值，实际为{len(records)}个")
+        raw_values = []
+        for record in records:
+            raw_values.extend(self._raw_values(record))
+        return list(self.all_registers_codec.unpack(self.all_codec.pack(*raw_values)))
+
+    def decode(self, registers):
+        """
+        :param registers: 一个通道的寄存器列表（stride个）
+        :return: {字段名: 工程值}
+        """
+        raw_values = self.codec.unpack(self.registers_codec.pack(*registers))
+        return {field.name: field.decode(raw) for field, raw in zip(self.fields, raw_values)}
+
+    def decode_all(self, registers):
+        """
+        :param registers: 全部通道连续排列的寄存器列表
+        :return: [{字段名: 工程值}, ...]，按通道顺序
+        """
+        raw_values = self.all_codec.unpack(self.all_registers_codec.pack(*registers))
+        width = len(self.fields)
+        return [{field.name: field.decode(raw) for field, raw in zip(self.fields, raw_values[n:n + width])}
+                for n in range(0, len(raw_values), width)]
+
+    def __repr__(self):
+        return f"BlockSchema({self.name}, 0x{self.base:X}, stride={self.stride}, count={self.count})"
+
+
+def channel_param_fields():
+    """
+    AI/AO配置块的字段（每个通道22个寄存器），限值和X/Y标定点为×1000的32位有符号整数
+    """
+    return [
+        Field('type', 0x00, 'u16'),
+        Field('top_limit', 0x01, 'i32', 1000),
+        Field('bot_limit', 0x03, 'i32', 1000),
+        Field('line_number', 0x05, 'u16'),
+        Field('X1', 0x06, 'i32', 1000),
+        Field('X2', 0x08, 'i32', 1000),
+        Field('X3', 0x0a, 'i32', 1000),
+        Field('X4', 0x0c, 'i32', 1000),
+        Field('Y1', 0x0e, 'i32', 1000),
+        Field('Y2', 0x10, 'i32', 1000),
+        Field('Y3', 0x12, 'i32', 1000),
+        Field('Y4', 0x14, 'i32', 1000),
+    ]
+
+
+# set_*_param中type_line_value、parameter_values对应的字段名
+TYPE_LINE_KEYS = ['type', 'line_number']
+PARAMETER_KEYS = ['top_limit', 'bot_limit', 'X1', 'Y1', 'X2', 'Y2', 'X3', 'Y3', 'X4', 'Y4']
+
+AI_PARAM = BlockSchema('AI_PARAM', 0x3000, 22, 16, channel_param_fields())
+AO_PARAM = BlockSchema('AO_PARAM', 0x3400, 22, 4, channel_param_fields())
+AI_UNIT = BlockSchema('AI_UNIT', 0x3200, 2, 16, [Field('unit', 0, 'str4')])
+AO_UNIT = BlockSchema('AO_UNIT', 0x34A0, 2, 4, [Field('unit', 0, 'str4')])
+AO_PMI = BlockSchema('AO_PMI', 0x3950, 2, 4, [Field('value', 0, 'i32', 1000)])
+AI_MEASUREMENT = BlockSchema('AI_MEASUREMENT', 0x3700, 2, 16, [Field('value', 0, 'f32')])
+
+SCHEMAS = [AI_PARAM, AO_PARAM, AI_UNIT, AO_UNIT, AO_PMI, AI_MEASUREMENT]
+# 已知寄存器块中位于字段中间的地址
+FIELD_CONTINUATIONS = frozenset(address for schema in SCHEMAS for address in schema.continuations())
+
+
+def field_start(address):
+    """
+    :param address: 寄存器地址
+    :return: 该地址所在字段的起始地址，不在已知块中时为地址本身
+    """
+    while address in FIELD_CONTINUATIONS:
+        address -= 1
+    return address
+
+
+def field_end(address):
+    """
+    :param address: 区间结束地址（不含）
+    :return: 向后扩展到字段边界的结束地址，区间不会在字段中间结束
+    """
+    while address in FIELD_CONTINUATIONS:
+        address += 1
+    return address
+
+
+def param_record(type_line_value, parameter_values):
+    """
+    :param type_line_value: type, line_number
+    :param parameter_values: top_limit, bot_limit, X1, Y1, X2, Y2, X3, Y3, X4, Y4
+    :return: {字段名: 工程值}
+    """
+    record = dict(zip(TYPE_LINE_KEYS, type_line_value))
+    record.update(zip(PARAMETER_KEYS, parameter_values))
+    return record
@@ -1,16 +1,36 @@
 import logging
-import math
-import struct
 import time
 import openpyxl
-from datetime import timedelta
+from datetime import datetime, timedelta
 
-from Config.IOM.modbus_connet import ModbusRtuOrTcp
+from Config.IOM.modbus_connet import ModbusRtuOrTcp, conn_manager
+from Config.IOM.modbus_batch import RegisterWriteBatch, verify_frames
+from Config.IOM.modbus_schema import AI_PARAM, AO_PARAM, AI_UNIT, AO_UNIT, AO_PMI, param_record
 from Config.IOM.modbus_get_attr import get_single_ai_y_measurement, excel_append_ai_measurement, \
     get_all_ai_y_measurements
-from Source.CL3021.source_control import set_dc, close_dc, close_dc_all, read_dc
+from Source.CL3021.source_control import set_dc, close_dc, close_dc_all, read_dc, source_lock
+from Common.settle import wait_until_stable
+from Common.stats import collect_stats
+from Common.result_sink import open_sink
+from Common.tolerance import ToleranceTable
+from Common.sweep_journal import SweepJournal
 
-client = ModbusRtuOrTcp()
+# AI输入滤波的时间常数（秒）：原固定等待5~6.7s即为等待滤波输出跟上输入
+AI_FILTER_TIME_CONSTANT = 1.3
+# AI读数至少等待几个滤波时间常数后才开始判定稳定
+AI_SETTLE_TIME_CONSTANTS = 2
+# 未指定settle_tolerance时，稳定判定的波动范围取预期范围宽度的比例，与读数的单位（mA、V、工程单位）一致
+SETTLE_TOLERANCE_RATIO = 0.1
+# 预期范围宽度为0（单值）时的波动范围
+DEFAULT_SETTLE_TOLERANCE = 0.005
+
+def get_client(modbus_client: ModbusRtuOrTcp = None) -> ModbusRtuOrTcp:
+    """
+    获取Modbus连接：优先使用传入的连接，否则取连接管理器中的默认端点长连接
+    :param modbus_client: ModbusRtuOrTcp 实例
+    :return:
+    """
+    return modbus_client or conn_manager.get()
 
 
 def current_time():
@@ -30,208 +50,249 @@ def res_is_error(res, address):
         print(f"{current_time()} 警告：写入地址 0x{address:X} 失败")
 
 
-def float_to_uint32t_4bytes(value):
+def write_batch(client, batch: RegisterWriteBatch, slave=1, verify=False):
     """
-    将数值（整数或浮点数）转换为：32位无符号整形即两个16位整数，存入两个寄存器（大端序）
-    :param value: 要转换的数值（整数或浮点数）
-    :return: (high_register, low_register) - 包含两个16进制整数的元组
+    发送批量写入（合并为最少的FC16帧），并逐帧检查写入结果
+    :param client: ModbusRtuOrTcp 实例
+    :param batch: RegisterWriteBatch 实例
+    :param slave: 从站地址
+    :param verify: 是否在全部写入后块读取回读校验
+    :return: 回读不一致的寄存器 [(地址, 预期值, 实际值), ...]
     """
-    # 应用缩放
-    scaled_value = value * 1000
-    # 检查是否为有限值
-    if not math.isfinite(scaled_value):
-        raise ValueError("转换后值为非有限数(inf或nan)")
-    # 缩放后取整
-    if scaled_value >= 0:
-        int_value = math.floor(scaled_value + 0.5)  # 正数四舍五入
-    else:
-        int_value = math.ceil(scaled_value - 0.5)  # 负数四舍五入
-    # 范围检查（32位有符号整数）
-    if int_value < -2147483648 or int_value > 2147483647:
-        raise ValueError(f"转换后值 {int_value} 超出32位整数范围")
-
-    # 大端序打包
-    packed_data = struct.pack('>i', int_value)
-    # 拆分为两个16位整数（高位在前）
-    return struct.unpack('>HH', packed_data)
+    frames = batch.frames()
+    for address, values, response in batch.flush(client, slave=slave):
+        res_is_error(response, address)
+    if not verify:
+        return []
+    mismatches = verify_frames(client, frames, slave=slave)
+    for address, expected, actual in mismatches:
+        print(f"{current_time()} 警告：地址 0x{address:X} 回读值为{actual}，预期为{expected}")
+    return mismatches
 
 
-def string_to_uint8t_4bytes(value):
-    """
-    将中英文字符串转换为：4个8位无符号整形数组，存入两个寄存器（大端序，GBK编码）
-    :param value: 要转换的中英文字符串.
-    :return: 2个16进制整数的列表（如[0xA1E3, 0x4300]）
-    """
-    try:
-        # 使用GBK编码将字符串转换为字节
-        gbk_bytes = value.encode('gbk')
-
-        # 创建一个4字节的缓冲区
-        result_bytes = bytearray(4)
-        # 复制GBK编码的字节到缓冲区，保持大端序
-        for i in range(min(len(gbk_bytes), 4)):
-            result_bytes[i] = gbk_bytes[i]
-
-        # 将4字节转换为2个16进制整数（大端序）
-        # 第一个整数：前两个字节（高字节在前）
-        int1 = (result_bytes[0] << 8) | result_bytes[1]
-        # 第二个整数：后两个字节（高字节在前）
-        int2 = (result_bytes[2] << 8) | result_bytes[3]
-
-        return [int1, int2]
-    except Exception as e:
-        logging.error(f"字符串转换为2个16进制整数失败: {e}")
-        # 发生错误时返回两个0
-        return [0, 0]
-
-
-def set_ai_param(ai_num, type_line_value, parameter_values):
+def set_ai_param(ai_num, type_line_value, parameter_values, modbus_client=None, verify=False, slave=1):
     """
     修改指定AI口配套参数
     :param ai_num: 1-16
     :param type_line_value: ai_type, line_number
     :param parameter_values: top_limit, bot_limit, X1, Y1, X2, Y2, X3, Y3, X4, Y4
-    :return:
+    :param modbus_client: ModbusRtuOrTcp 实例，为空时使用默认长连接
+    :param verify: 是否在写入后回读校验
+    :param slave: 从站地址（slaveid）
+    :return: 回读不一致的寄存器 [(地址, 预期值, 实际值), ...]
     """
-    # parameter_keys = ['top_limit', 'bot_limit', 'X1', 'Y1', 'X2', 'Y2', 'X3', 'Y3', 'X4', 'Y4']
-    type_line_address = [0x3000, 0x3005]
-    parameter_address = [0x3001, 0x3003, 0x3006, 0x300e, 0x3008, 0x3010, 0x300a, 0x3012, 0x300c, 0x3014]
-    # 提前将parameter_values转换，以便循环中写入
-    convert_values = [float_to_uint32t_4bytes(value) for value in parameter_values]
+    client = get_client(modbus_client)
+    # 整个通道块（22个寄存器）一次编码
+    registers = AI_PARAM.encode(param_record(type_line_value, parameter_values))
     print(f"{current_time()} 开始修改AI{ai_num}口的所有配置")
     print(f"'ai_type','line_number'为：{type_line_value}")
     print(
         f"'top_limit', 'bot_limit', 'X1', 'Y1', 'X2', 'Y2', 'X3', 'Y3', 'X4', 'Y4'参数为：{parameter_values}")
-    for addr, value in zip(type_line_address, type_line_value):
-        response = client.write_registers(addr + 22 * (ai_num - 1), [value], slave=1)
-        res_is_error(response, addr + 22 * (ai_num - 1))
-    # 修改所有配套参数
-    for address, convert_value in zip(parameter_address, convert_values):
-        response = client.write_registers(address + 22 * (ai_num - 1), convert_value, slave=1)
-        res_is_error(response, address + 22 * (ai_num - 1))
-    client.close()
+    batch = RegisterWriteBatch().add(AI_PARAM.address(ai_num), registers)
+    return write_batch(client, batch, slave=slave, verify=verify)
 
 
-def set_all_ai_param(type_line_value, parameter_values):
+def set_all_ai_param(type_line_value, parameter_values, modbus_client=None, verify=False, slave=1):
     """
     修改所有AI口配套参数
     :param type_line_value: ai_type, line_number
     :param parameter_values: top_limit, bot_limit, X1, Y1, X2, Y2, X3, Y3, X4, Y4
-    :return:
+    :param modbus_client: ModbusRtuOrTcp 实例，为空时使用默认长连接
+    :param verify: 是否在写入后回读校验
+    :param slave: 从站地址（slaveid）
+    :return: 回读不一致的寄存器 [(地址, 预期值, 实际值), ...]
     """
-    # 关闭客户端连接
-    client.close()
-    # 定义AI类型和线路号的寄存器地址
-    type_line_address = [0x3000, 0x3005]
-    # 定义各个参数的寄存器地址
-    parameter_address = [0x3001, 0x3003, 0x3006, 0x300e, 0x3008, 0x3010, 0x300a, 0x3012, 0x300c, 0x3014]
-    # 提前将parameter_values转换，以便循环中写入
-    convert_values = [float_to_uint32t_4bytes(value) for value in parameter_values]
+    client = get_client(modbus_client)
+    # 16个AI口的配置块连续，一次编码为一段连续的寄存器
+    registers = AI_PARAM.encode_all(param_record(type_line_value, parameter_values))
     print(f"{current_time()} 开始修改所有AI口的所有配置")
     print(f"'ai_type','line_number'为：{type_line_value}")
     print(
         f"'top_limit', 'bot_limit', 'X1', 'Y1', 'X2', 'Y2', 'X3', 'Y3', 'X4', 'Y4'参数为：{parameter_values}")
-    for n in range(16):
-        for addr, value in zip(type_line_address, type_line_value):
-            response = client.write_registers(addr + 22 * n, [value], slave=1)
-            # 检查是否写入成功（pymodbus通常用isError()方法检查）
-            res_is_error(response, addr + 22 * (n - 1))
-        # 修改所有配套参数
-        for address, convert_value in zip(parameter_address, convert_values):
-            response = client.write_registers(address + 22 * n, convert_value, slave=1)
-            res_is_error(response, address + 22 * (n - 1))
-    client.close()
-
-
-def set_ao_param(ao_num, type_line_value, parameter_values):
+    batch = RegisterWriteBatch().add(AI_PARAM.base, registers)
+    return write_batch(client, batch, slave=slave, verify=verify)
+
+
+def set_all_ai_top_bot(top_bot, modbus_client=None, verify=False, slave=1):
+    """
+    只修改所有AI口的上下限，其余配置不变
+    :param top_bot: top_limit, bot_limit
+    :param modbus_client: ModbusRtuOrTcp 实例，为空时使用默认长连接
+    :param verify: 是否在写入后回读校验
+    :param slave: 从站地址（slaveid）
+    :return: 回读不一致的寄存器 [(地址, 预期值, 实际值), ...]
+    """
+    client = get_client(modbus_client)
+    top_limit, bot_limit = top_bot
+    # top_limit、bot_limit在通道块中相邻，每个通道写入4个寄存器
+    registers = AI_PARAM.encode_field('top_limit', top_limit) + AI_PARAM.encode_field('bot_limit', bot_limit)
+    print(f"{current_time()} 开始修改所有AI口的上下限：{top_bot}")
+    batch = RegisterWriteBatch()
+    for ai_num in range(1, AI_PARAM.count + 1):
+        batch.add(AI_PARAM.field_address(ai_num, 'top_limit'), registers)
+    return write_batch(client, batch, slave=slave, verify=verify)
+
+
+def set_ao_param(ao_num, type_line_value, parameter_values, modbus_client=None, verify=False, slave=1):
     """
     修改指定AO口配套参数
     :param ao_num: 1-16
     :param type_line_value: ao_type, line_number
     :param parameter_values: top_limit, bot_limit, X1, Y1, X2, Y2, X3, Y3, X4, Y4
-    :return:
+    :param modbus_client: ModbusRtuOrTcp 实例，为空时使用默认长连接
+    :param verify: 是否在写入后回读校验
+    :param slave: 从站地址（slaveid）
+    :return: 回读不一致的寄存器 [(地址, 预期值, 实际值), ...]
     """
-    # parameter_keys = ['top_limit', 'bot_limit', 'X1', 'Y1', 'X2', 'Y2', 'X3', 'Y3', 'X4', 'Y4']
-    type_line_address = [0x3400, 0x3405]
-    parameter_address = [0x3401, 0x3403, 0x3406, 0x340e, 0x3408, 0x3410, 0x340a, 0x3412, 0x340c, 0x3414]
-    # 提前将parameter_values转换，以便循环中写入
-    convert_values = [float_to_uint32t_4bytes(value) for value in parameter_values]
+    client = get_client(modbus_client)
+    # 整个通道块（22个寄存器）一次编码
+    registers = AO_PARAM.encode(param_record(type_line_value, parameter_values))
     print(f"{current_time()} 开始修改AO{ao_num}口的所有配置")
     print(f"'ao_type','line_number'为：{type_line_value}")
     print(
         f"'top_limit', 'bot_limit', 'X1', 'Y1', 'X2', 'Y2', 'X3', 'Y3', 'X4', 'Y4'参数为：{parameter_values}")
-    for addr, value in zip(type_line_address, type_line_value):
-        response = client.write_registers(addr + 22 * (ao_num - 1), [value], slave=1)
-        res_is_error(response, addr + 22 * (ao_num - 1))
-    # 修改所有配套参数
-    for address, convert_value in zip(parameter_address, convert_values):
-        response = client.write_registers(address + 22 * (ao_num - 1), convert_value, slave=1)
-        res_is_error(response, address + 22 * (ao_num - 1))
-    client.close()
+    batch = RegisterWriteBatch().add(AO_PARAM.address(ao_num), registers)
+    return write_batch(client, batch, slave=slave, verify=verify)
 
 
-def set_all_ao_param(type_line_value, parameter_values):
+def set_all_ao_param(type_line_value, parameter_values, modbus_client=None, verify=False, slave=1):
     """
     修改所有AO口配置参数
     :param type_line_value:
     :param parameter_values:
-    :return:
+    :param modbus_client: ModbusRtuOrTcp 实例，为空时使用默认长连接
+    :param verify: 是否在写入后回读校验
+    :param slave: 从站地址（slaveid）
+    :return: 回读不一致的寄存器 [(地址, 预期值, 实际值), ...]
     """
-    type_line_address = [0x3400, 0x3405]
-    parameter_address = [0x3401, 0x3403, 0x3406, 0x340e, 0x3408, 0x3410, 0x340a, 0x3412, 0x340c, 0x3414]
-    # 提前将parameter_values转换，以便循环中写入
-    convert_values = [float_to_uint32t_4bytes(value) for value in parameter_values]
+    client = get_client(modbus_client)
+    # 4个AO口的配置块连续，一次编码为一段连续的寄存器
+    registers = AO_PARAM.encode_all(param_record(type_line_value, parameter_values))
     print(f"{current_time()} 开始修改所有AO口的所有配置")
     print(f"'ao_type','line_number'为：{type_line_value}")
     print(
         f"'top_limit', 'bot_limit', 'X1', 'Y1', 'X2', 'Y2', 'X3', 'Y3', 'X4', 'Y4'参数为：{parameter_values}")
     print(type_line_value, parameter_values)
-    for n in range(4):
-        for addr, value in zip(type_line_address, type_line_value):
-            response = client.write_registers(addr + 22 * n, [value], slave=1)
-            res_is_error(response, addr + 22 * n)
-        # 修改所有配套参数
-        for address, convert_value in zip(parameter_address, convert_values):
-            response = client.write_registers(address + 22 * n, convert_value, slave=1)
-            res_is_error(response, address + 22 * n)
-    client.close()
-
-
-def set_ao_pmi(ao_num, value):
+    batch = RegisterWriteBatch().add(AO_PARAM.base, registers)
+    return write_batch(client, batch, slave=slave, verify=verify)
+
+
+def set_ao_pmi(ao_num, value, modbus_client=None, verify=False, slave=1):
     """
     配置AO physical measurement Input
     :param ao_num:
     :param value:
-    :return:
+    :param modbus_client: ModbusRtuOrTcp 实例，为空时使用默认长连接
+    :param verify: 是否在写入后回读校验
+    :param slave: 从站地址（slaveid）
+    :return: 回读不一致的寄存器 [(地址, 预期值, 实际值), ...]
     """
-    address = 0x3950 + 2 * (ao_num - 1)
-    rel_value = float_to_uint32t_4bytes(value)
-    response = client.write_registers(address, rel_value, slave=1)
-    res_is_error(response, address)
-    client.close()
+    client = get_client(modbus_client)
+    batch = RegisterWriteBatch().add(AO_PMI.address(ao_num), AO_PMI.encode({'value': value}))
+    return write_batch(client, batch, slave=slave, verify=verify)
 
 
-def set_all_unit(unit):
+def set_all_unit(unit, modbus_client=None, verify=False, slave=1):
     """
     配置所有单位
     :param unit: 2个中文，4个字母或者所有可以输入的特殊字符（"°C"中的"°"：英文状态下：ALT+0176）
-    :return:
+    :param modbus_client: ModbusRtuOrTcp 实例，为空时使用默认长连接
+    :param verify: 是否在写入后回读校验
+    :param slave: 从站地址（slaveid）
+    :return: 回读不一致的寄存器 [(地址, 预期值, 实际值), ...]
+    """
+    client = get_client(modbus_client)
+    batch = RegisterWriteBatch()
+    batch.add(AI_UNIT.base, AI_UNIT.encode_all({'unit': unit}))
+    batch.add(AO_UNIT.base, AO_UNIT.encode_all({'unit': unit}))
+    return write_batch(client, batch, slave=slave, verify=verify)
+
+
+def _range_list(value, channels):
+    """预期范围的上限或下限（单值或各通道数组）展开为各通道的列表"""
+    try:
+        return [float(v) for v in value]
+    except TypeError:
+        return [float(value)] * channels
+
+
+def settle_criteria(expected_ranges, index, test_type, settle_tolerance=None, channels=1):
+    """
+    测试点的稳定判定条件：波动范围按预期范围的宽度取值；目标值和上一个值取本测试点和上一个测试点预期范围的中点，
+    读数需先离开上一个测试点的值，避免滑动窗口被上一个测试点仍然稳定的读数填满而提前判定
+    :param expected_ranges: ToleranceTable
+    :param index: 测试点下标
+    :param test_type: 'ao_voltage'/'ao_current'/'ai_current'/'ai_voltage'
+    :param settle_tolerance: 为空时按预期范围宽度的SETTLE_TOLERANCE_RATIO；单值为固定波动范围；
+                             dict按测试类型分别指定，如 {'ai_current': 0.01, 'ai_voltage': 0.005}
+    :param channels: 通道数
+    :return: wait_until_stable的参数 {'tolerance': , 'target': , 'origin': }
+    """
+    if isinstance(settle_tolerance, dict):
+        settle_tolerance = settle_tolerance.get(test_type)
+    if expected_ranges is None:
+        return {'tolerance': DEFAULT_SETTLE_TOLERANCE if settle_tolerance is None else settle_tolerance}
+    low = _range_list(expected_ranges.lo[index], channels)
+    high = _range_list(expected_ranges.hi[index], channels)
+    if settle_tolerance is None:
+        tolerance = [SETTLE_TOLERANCE_RATIO * (hi - lo) if hi > lo else DEFAULT_SETTLE_TOLERANCE
+                     for lo, hi in zip(low, high)]
+    else:
+        tolerance = [settle_tolerance] * channels
+    if index == 0:
+        return {'tolerance': tolerance}
+    target = [(lo + hi) / 2 for lo, hi in zip(low, high)]
+    origin = [(lo + hi) / 2 for lo, hi in zip(_range_list(expected_ranges.lo[index - 1], channels),
+                                               _range_list(expected_ranges.hi[index - 1], channels))]
+    return {'tolerance': tolerance, 'target': target, 'origin': origin}
+
+
+def measure_point(read, settle_value, channels=1, samples=1, sample_window=None, judge='mean', confidence_z=1.96):
+    """
+    测试点取值：默认直接使用稳定后的读数；多次采样时按通道在线统计，取均值
+    :param read: 无参读数函数，返回单值或各通道值列表
+    :param settle_value: 稳定后的读数
+    :param channels: 通道数
+    :param samples: 每个测试点的读取次数
+    :param sample_window: 每个测试点的读取时长（秒）
+    :param judge: 'mean'按均值判定，'bound'按均值的置信区间判定
+    :param confidence_z: 置信区间的正态分位数
+    :return: (各通道值列表, 各通道置信区间列表，按均值判定时为None)
     """
-    value = string_to_uint8t_4bytes(unit)
-    for n in range(20):
-        if n <= 15:
-            address = 0x3200 + 2 * n
-            response = client.write_registers(address, value, slave=1)
-            res_is_error(response, address)
-        else:
-            address = 0x34A0 + 2 * (n-16)
-            response = client.write_registers(address, value, slave=1)
-            res_is_error(response, address)
-    client.close()
+    if samples <= 1 and not sample_window:
+        values = settle_value if isinstance(settle_value, list) else [settle_value]
+        return values, None
+    stats = collect_stats(read, channels, samples=samples if samples > 1 else None, duration=sample_window)
+    values = [stats.mean[channel] if stats.count[channel] else None for channel in range(channels)]
+    for channel in range(channels):
+        print(f"通道{channel + 1}统计：{stats.summary(channel)}")
+    if judge != 'bound':
+        return values, None
+    return values, [stats.confidence_bounds(channel, confidence_z) for channel in range(channels)]
+
+
+def replay_point(journal, sink, mode, channel, index, range_str):
+    """
+    断点续测时，已完成测试点的记录按原测试时间重新写入本次的sink，本次批次的结果仍包含所有测试点
+    :param journal: SweepJournal
+    :param sink: ResultSink，为空时不写入
+    :param mode: 测试类型
+    :param channel: 通道号
+    :param index: 测试点下标
+    :param range_str: 预期范围
+    :return: 记录的判定结果
+    """
+    entry = journal.entry(mode, channel, index)
+    if sink is not None:
+        excel_append_ai_measurement(channel, entry.get('input'), entry.get('measurement'), range_str, sink=sink,
+                                    result=entry.get('result'), timestamp=datetime.fromtimestamp(entry['time']))
+    return entry.get('result')
 
 
 def iom_test(ai_number=None, ao_number=None, ai_current=None, ai_voltage=None, ao_current=None, ao_voltage=None, expected=None,
-             write_to_file=False):
+             write_to_file=False, modbus_client=None, slave=1, settle_tolerance=None, settle_window=5,
+             samples=1, sample_window=None, judge='mean', sink=None, result_path="ai_i_measurements.xlsx",
+             journal=None, settle_min_time=None):
     """
     :param ai_number: 输入通道号
     :param ao_number: 输出通道号
@@ -241,8 +302,48 @@ def iom_test(ai_number=None, ao_number=None, ai_current=None, ai_voltage=None, a
     :param ao_voltage: 输出电压
     :param expected: 预期值
     :param write_to_file: 是否写入表格：True/False
+    :param modbus_client: ModbusRtuOrTcp 实例，为空时使用默认长连接
+    :param slave: 从站地址（slaveid）
+    :param settle_tolerance: 判定读数稳定的波动范围，滑动窗口内最大值与最小值之差不超过该值即开始判定；
+                             为空时按各测试点预期范围宽度的比例取值，dict按测试类型分别指定，见settle_criteria
+    :param settle_window: 判定读数稳定的滑动窗口样本数
+    :param samples: 每个测试点的读取次数，大于1时按均值判定
+    :param sample_window: 每个测试点的读取时长（秒），指定时在该时长内持续读取
+    :param judge: 多次读取时的判定方式：'mean'按均值，'bound'要求均值的95%置信区间都在预期范围内
+    :param sink: Common.result_sink.ResultSink，多次调用共用一个sink时由调用方负责关闭
+    :param result_path: 未传入sink且write_to_file为True时，本次测试结果写入的文件（.xlsx/.csv/.db）
+    :param journal: 断点续测记录文件路径或SweepJournal，中断后用相同参数重新运行时跳过已完成的测试点
+    :param settle_min_time: AI测试设定输入后开始判定稳定前的最短等待时间（秒），
+                            为空时取AI_SETTLE_TIME_CONSTANTS个AI滤波时间常数
     :return:
     """
+    if settle_min_time is None:
+        settle_min_time = AI_SETTLE_TIME_CONSTANTS * AI_FILTER_TIME_CONSTANT
+    # 整个测试只打开一次结果文件，结束时统一写入
+    own_sink = sink is None and write_to_file
+    if own_sink:
+        sink = open_sink(result_path)
+    own_journal = not isinstance(journal, SweepJournal)
+    if own_journal:
+        plan = dict(ai_number=ai_number, ao_number=ao_number, ai_current=ai_current, ai_voltage=ai_voltage,
+                    ao_current=ao_current, ao_voltage=ao_voltage, expected=expected, slave=slave)
+        journal = SweepJournal(journal, plan)
+    try:
+        _iom_test(ai_number, ao_number, ai_current, ai_voltage, ao_current, ao_voltage, expected, modbus_client, slave,
+                  settle_tolerance, settle_window, settle_min_time, samples, sample_window, judge, sink, journal)
+    finally:
+        if own_sink:
+            sink.close()
+        if own_journal:
+            journal.close()
+
+
+def _iom_test(ai_number, ao_number, ai_current, ai_voltage, ao_current, ao_voltage, expected, modbus_client, slave,
+              settle_tolerance, settle_window, settle_min_time, samples, sample_window, judge, sink, journal):
+    """iom_test的测试流程，参数同iom_test"""
+    client = get_client(modbus_client)
+    # 预期范围在测试开始前统一解析
+    expected_ranges = ToleranceTable(expected) if expected else None
     ai_start, ai_end = 1, 17
     ao_start, ao_end = 1, 5
     if ai_number or ao_number is None:
@@ -253,17 +354,35 @@ def iom_test(ai_number=None, ao_number=None, ai_current=None, ai_voltage=None, a
         ao_start, ao_end = ao_number, ao_number+1
     if ao_voltage:
         for t in range(ao_start, ao_end):
+            if journal.channel_done('ao_voltage', t, len(ao_voltage)):
+                print(f"AO{t}已测试完成，跳过")
+                for i in range(len(ao_voltage)):
+                    replay_point(journal, sink, 'ao_voltage', t, i, expected[i])
+                continue
             if t != 1:
                 time.sleep(5)
             print(f"*************************开始执行AO{t}*************************")
             ao_number = t
             for i in range(len(ao_voltage)):
-                set_ao_pmi(ao_number, ao_voltage[i])
-                time.sleep(5)
-                measurement_data = read_dc(0)
+                if journal.done('ao_voltage', ao_number, i):
+                    replay_point(journal, sink, 'ao_voltage', ao_number, i, expected[i])
+                    continue
+                # 多块板子共用一台源：设定输出、等待稳定和读数期间独占源
+                with source_lock:
+                    set_ao_pmi(ao_number, ao_voltage[i], client, slave=slave)
+                    # AO输出由源的表直接读回，没有AI滤波，只要求读数离开上一个测试点
+                    settle = wait_until_stable(lambda: read_dc(0), window=settle_window, timeout=5,
+                                               **settle_criteria(expected_ranges, i, 'ao_voltage', settle_tolerance))
+                    print(f"{current_time()} 稳定耗时{settle.elapsed:.2f}s，{'已稳定' if settle.settled else '超时未稳定'}")
+                    values, bounds = measure_point(lambda: read_dc(0), settle.value, 1, samples, sample_window, judge)
+                measurement_data = values[0]
+                result = excel_append_ai_measurement(ao_number, ao_voltage[i], measurement_data, expected[i],
+                                                     bounds=bounds and bounds[0], sink=sink)
                 print(
                     f"{i + 1}、现在执行AO {ao_number}，输入电压为{ao_voltage[i]}V，物理测量值为{measurement_data}，预期范围在{expected[i]}, ".replace(" ",""),
-                    f"判定结果为：{excel_append_ai_measurement(ao_number, ao_voltage[i], measurement_data, expected[i], write_to_file)}")
+                    f"判定结果为：{result}")
+                journal.record('ao_voltage', ao_number, i, input=ao_voltage[i], measurement=measurement_data,
+                               result=result)
             if ao_number == 4:
                 print(f"*********************************所有AO口测试结束！*********************************")
             else:
@@ -271,17 +390,34 @@ def iom_test(ai_number=None, ao_number=None, ai_current=None, ai_voltage=None, a
                     f"*********************************AO{ao_number} 测试完成,你有5s时间切换到AO{ao_number + 1}*********************************")
     elif ao_current:
         for t in range(ao_start, ao_end):
+            if journal.channel_done('ao_current', t, len(ao_current)):
+                print(f"AO{t}已测试完成，跳过")
+                for i in range(len(ao_current)):
+                    replay_point(journal, sink, 'ao_current', t, i, expected[i])
+                continue
             if t != 1:
                 time.sleep(5)
             print(f"*********************************开始执行AO{t}*********************************")
             ao_number = t
             for i in range(len(ao_current)):
-                set_ao_pmi(ao_number, ao_current[i])
-                time.sleep(5)
-                measurement_data = read_dc(1)
+                if journal.done('ao_current', ao_number, i):
+                    replay_point(journal, sink, 'ao_current', ao_number, i, expected[i])
+                    continue
+                # 多块板子共用一台源：设定输出、等待稳定和读数期间独占源
+                with source_lock:
+                    set_ao_pmi(ao_number, ao_current[i], client, slave=slave)
+                    settle = wait_until_stable(lambda: read_dc(1), window=settle_window, timeout=5,
+                                               **settle_criteria(expected_ranges, i, 'ao_current', settle_tolerance))
+                    print(f"{current_time()} 稳定耗时{settle.elapsed:.2f}s，{'已稳定' if settle.settled else '超时未稳定'}")
+                    values, bounds = measure_point(lambda: read_dc(1), settle.value, 1, samples, sample_window, judge)
+                measurement_data = values[0]
+                result = excel_append_ai_measurement(ao_number, ao_current[i], measurement_data, expected[i],
+                                                     bounds=bounds and bounds[0], sink=sink)
                 print(
                     f"{i + 1}、现在执行AO {ao_number}，输入电流为{ao_current[i]}V，物理测量值为{measurement_data}，预期范围在{expected[i]}, ".replace(" ",""),
-                    f"判定结果为：{excel_append_ai_measurement(ao_number, ao_current[i], measurement_data, expected[i], write_to_file)}")
+                    f"判定结果为：{result}")
+                journal.record('ao_current', ao_number, i, input=ao_current[i], measurement=measurement_data,
+                               result=result)
             if ao_number == 4:
                 print(f"*********************************所有AO口测试结束！*********************************")
             else:
@@ -291,17 +427,37 @@ def iom_test(ai_number=None, ao_number=None, ai_current=None, ai_voltage=None, a
         print("此时AI_Type为电流档,测试所有AI口")
         for ai_number in range(ai_start, ai_end):
         # for ai_number in range(end - 1, start - 1, -1):
+            if journal.channel_done('ai_current', ai_number, len(ai_current)):
+                print(f"AI{ai_number}已测试完成，跳过")
+                for n in range(len(ai_current)):
+                    replay_point(journal, sink, 'ai_current', ai_number, n, expected[n])
+                continue
             if ai_number != 1:
                 time.sleep(3)
             print(f"AI{ai_number}测试开始")
             for n in range(len(ai_current)):
-                set_dc(0, ai_current[n])
-                time.sleep(6.7)
-                measurement_data = get_single_ai_y_measurement(ai_number, client)
+                if journal.done('ai_current', ai_number, n):
+                    replay_point(journal, sink, 'ai_current', ai_number, n, expected[n])
+                    continue
+                # 多块板子共用一台源：设定输出、等待稳定和读数期间独占源
+                with source_lock:
+                    set_dc(0, ai_current[n])
+                    settle = wait_until_stable(lambda: get_single_ai_y_measurement(ai_number, client, slave=slave),
+                                               window=settle_window, timeout=6.7, min_time=settle_min_time,
+                                               **settle_criteria(expected_ranges, n, 'ai_current', settle_tolerance))
+                    print(f"{current_time()} 稳定耗时{settle.elapsed:.2f}s，{'已稳定' if settle.settled else '超时未稳定'}")
+                    values, bounds = measure_point(lambda: get_single_ai_y_measurement(ai_number, client, slave=slave),
+                                                   settle.value, 1, samples, sample_window, judge)
+                measurement_data = values[0]
+                result = excel_append_ai_measurement(ai_number, ai_current[n], measurement_data, expected[n],
+                                                     bounds=bounds and bounds[0], sink=sink)
                 print(
                     f"{n + 1}、现在执行AI {ai_number}，输入电流为{ai_current[n]}mA，物理测量值为{measurement_data}，预期范围在{expected[n]}, ".replace(" ",""),
-                    f"判定结果为：{excel_append_ai_measurement(ai_number, ai_current[n], measurement_data, expected[n], write_to_file)}")
-            close_dc(2)
+                    f"判定结果为：{result}")
+                journal.record('ai_current', ai_number, n, input=ai_current[n], measurement=measurement_data,
+                               result=result)
+            with source_lock:
+                close_dc(2)
             if ai_number == 16:
                 print(f"*********************************所有AI口测试结束！*********************************")
             else:
@@ -311,18 +467,50 @@ def iom_test(ai_number=None, ao_number=None, ai_current=None, ai_voltage=None, a
     elif ai_voltage:
         print("此时AI_Type为电压档,测试所有AI口")
         for nv in range(len(ai_voltage)):
+            if all(journal.done('ai_voltage', n, nv) for n in range(ai_start, ai_end)):
+                print(f"输入{ai_voltage[nv]}V已测试完成，跳过")
+                for n in range(ai_start, ai_end):
+                    replay_point(journal, sink, 'ai_voltage', n, nv, expected[nv])
+                continue
             if nv != 0:
                 time.sleep(4)
             print(f"*********************************测试输入{ai_voltage[nv]}V*********************************")
-            set_dc(ai_voltage[nv], 0)
-            time.sleep(5)
-            measurement_datas = get_all_ai_y_measurements(client)
-            time.sleep(0.5)
+            # 多块板子共用一台源：设定输出、等待稳定和读数期间独占源
+            with source_lock:
+                set_dc(ai_voltage[nv], 0)
+                measurement_keys = [f"AI{n}" for n in range(ai_start, ai_end)]
+
+                def read_block():
+                    datas = get_all_ai_y_measurements(client, slave=slave)
+                    return [datas[key] for key in measurement_keys] if datas else None
+                # 等待所有被测AI口同时稳定
+                settle = wait_until_stable(read_block, window=settle_window, timeout=5, min_time=settle_min_time,
+                                           **settle_criteria(expected_ranges, nv, 'ai_voltage', settle_tolerance,
+                                                             len(measurement_keys)))
+                print(f"{current_time()} 稳定耗时{settle.elapsed:.2f}s，{'已稳定' if settle.settled else '超时未稳定'}")
+                values, bounds = measure_point(read_block, settle.value or [], len(measurement_keys), samples,
+                                               sample_window, judge)
+            measurement_datas = dict(zip(measurement_keys, values))
+            # 所有通道一次判定
+            if bounds:
+                passed, distance = expected_ranges.judge(nv, [b[0] if b else None for b in bounds],
+                                                         upper=[b[1] if b else None for b in bounds])
+            else:
+                passed, distance = expected_ranges.judge(nv, values)
+            results = dict(zip(measurement_keys, ["合格" if ok else "不合格" for ok in passed]))
             for n in range(ai_start, ai_end):  # 循环16个ai口
+                if journal.done('ai_voltage', n, nv):
+                    # 该输入电压下中断前已完成的通道只写入原记录，不重复记录
+                    replay_point(journal, sink, 'ai_voltage', n, nv, expected[nv])
+                    continue
                 measurement = measurement_datas[f"AI{n}"]
+                result = excel_append_ai_measurement(n, ai_voltage[nv], measurement, expected[nv], sink=sink,
+                                                     result=results[f"AI{n}"])
                 print(f"{n + 1}、AI{n}口输入电压{ai_voltage[nv]}V，物理测量值为{measurement}，预期范围在{expected[nv]}, ".replace(" ",""),
-                      f"判定结果为：{excel_append_ai_measurement(n, ai_voltage[nv], measurement, expected[nv], write_to_file)}")
-        close_dc_all()
+                      f"判定结果为：{result}")
+                journal.record('ai_voltage', n, nv, input=ai_voltage[nv], measurement=measurement, result=result)
+        with source_lock:
+            close_dc_all()
 
 
 if __name__ == "__main__":
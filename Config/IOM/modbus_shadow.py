@@ -0,0 +1,72 @@
+from Config.IOM.modbus_schema import field_start, field_end
+
+
+class SkippedWriteResponse:
+    def __init__(self, address, count):
+        """
+        写入值与影子缓存一致而跳过写入时返回的结果，接口与pymodbus响应一致
+        :param address: 起始地址
+        :param count: 寄存器数量
+        """
+        self.address = address
+        self.count = count
+
+    def isError(self):
+        return False
+
+    def __repr__(self):
+        return f"SkippedWriteResponse(address=0x{self.address:X}, count={self.count})"
+
+
+class RegisterShadow:
+    def __init__(self):
+        """
+        设备寄存器的影子缓存（写穿透）：记录已写入或读到的寄存器值，用于跳过值未变化的写入
+        """
+        # 从站地址 -> {寄存器地址: 值}
+        self._values = {}
+
+    def update(self, slave, address, values):
+        """
+        写入成功或块读取后同步缓存
+        :param slave: 从站地址
+        :param address: 起始地址
+        :param values: 寄存器值列表
+        :return:
+        """
+        registers = self._values.setdefault(slave, {})
+        for offset, value in enumerate(values):
+            registers[address + offset] = value
+
+    def changed_span(self, slave, address, values):
+        """
+        找出与缓存不一致的最小连续区间，并扩展到字段边界，32位字段的两个寄存器总是一起写入
+        :param slave: 从站地址
+        :param address: 起始地址
+        :param values: 待写入的寄存器值列表
+        :return: (首个变化的偏移, 最后一个变化的偏移+1)，全部一致时返回None
+        """
+        registers = self._values.get(slave, {})
+        changed = [offset for offset, value in enumerate(values) if registers.get(address + offset) != value]
+        if not changed:
+            return None
+        first = max(field_start(address + changed[0]) - address, 0)
+        last = min(field_end(address + changed[-1] + 1) - address, len(values))
+        return first, last
+
+    def invalidate(self, slave=None, address=None, count=None):
+        """
+        使缓存失效：设备重启、重连或写入失败后调用
+        :param slave: 为空时清空所有从站
+        :param address: 为空时清空该从站的所有寄存器
+        :param count: 寄存器数量
+        :return:
+        """
+        if slave is None:
+            self._values.clear()
+        elif address is None:
+            self._values.pop(slave, None)
+        else:
+            registers = self._values.get(slave, {})
+            for offset in range(count):
+                registers.pop(address + offset, None)
@@ -0,0 +1,167 @@
+import json
+import struct
+import sys
+import time
+from datetime import datetime
+from Config.IOM.modbus_connet import ModbusRtuOrTcp
+from Config.IOM.modbus_schema import SCHEMAS
+
+# 文件格式：文件头(魔数, 版本, 元数据长度) + 元数据(JSON, UTF-8) + 各区域寄存器(大端u16，按元数据中区域顺序)
+SNAPSHOT_MAGIC = b'IOMSNAP\x00'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('>8sHI')
+SCHEMA_MAP = {schema.name: schema for schema in SCHEMAS}
+
+
+class SnapshotError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+class Snapshot:
+    def __init__(self, areas, metadata=None):
+        """
+        一块板子所有已知寄存器区域的快照
+        :param areas: {区域名: 寄存器列表}，读取失败的区域为None，区域名对应modbus_schema中的块名称
+        :param metadata: 时间戳、端点、从站地址等附加信息
+        """
+        self.areas = areas
+        self.metadata = metadata or {}
+
+    @classmethod
+    def capture(cls, modbus_client: ModbusRtuOrTcp, slave=1, schemas=SCHEMAS, **metadata):
+        """
+        读取所有区域：每个区域是一段连续寄存器，经read_ranges合并为最少的块读取
+        :param modbus_client: ModbusRtuOrTcp 实例
+        :param slave: 从站地址
+        :param schemas: 要读取的区域
+        :param metadata: 额外记录的信息，如 name='测试前'
+        :return: Snapshot
+        """
+        ranges = [(schema.base, schema.stride * schema.count) for schema in schemas]
+        started = time.time()
+        results = modbus_client.read_ranges(ranges, slave=slave)
+        finished = time.time()
+        metadata.update({
+            'created': datetime.fromtimestamp(started).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            'timestamp': started,
+            'duration': finished - started,
+            'endpoint': getattr(modbus_client, 'endpoint', None),
+            'slave': slave,
+        })
+        return cls({schema.name: registers for schema, registers in zip(schemas, results)}, metadata)
+
+    def save(self, path):
+        """
+        保存为二进制文件
+        :param path:
+        :return:
+        """
+        metadata = dict(self.metadata)
+        metadata['areas'] = [{'name': name, 'count': len(registers) if registers else 0}
+                             for name, registers in self.areas.items()]
+        meta_bytes = json.dumps(metadata, ensure_ascii=False).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(meta_bytes)))
+            f.write(meta_bytes)
+            for registers in self.areas.values():
+                if registers:
+                    f.write(struct.pack(f'>{len(registers)}H', *registers))
+
+    @classmethod
+    def load(cls, path):
+        """
+        读取save保存的快照文件
+        :param path:
+        :return: Snapshot
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < SNAPSHOT_HEADER.size:
+            raise SnapshotError(f"{path} 不是快照文件")
+        magic, version, meta_length = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise SnapshotError(f"{path} 不是快照文件或版本不支持")
+        offset = SNAPSHOT_HEADER.size
+        metadata = json.loads(data[offset:offset + meta_length].decode('utf-8'))
+        offset += meta_length
+        areas = {}
+        for area in metadata.pop('areas'):
+            count = area['count']
+            if count:
+                areas[area['name']] = list(struct.unpack_from(f'>{count}H', data, offset))
+                offset += 2 * count
+            else:
+                areas[area['name']] = None
+        return cls(areas, metadata)
+
+    def decode(self, name):
+        """
+        :param name: 区域名
+        :return: [{字段名: 工程值}, ...]，按通道顺序，读取失败的区域为None
+        """
+        registers = self.areas.get(name)
+        return SCHEMA_MAP[name].decode_all(registers) if registers else None
+
+    def diff(self, other):
+        """
+        比较两个快照，先按区域比较原始寄存器，只对不同的通道解码，按字段列出差异
+        :param other: Snapshot
+        :return: [(区域名, 通道号, 字段名, 本快照的值, other的值), ...]，
+                 某一方读取失败的区域记为 (区域名, None, None, 是否读取成功, 是否读取成功)
+        """
+        diffs = []
+        for name, schema in SCHEMA_MAP.items():
+            if name not in self.areas and name not in other.areas:
+                continue
+            mine, theirs = self.areas.get(name), other.areas.get(name)
+            if not mine or not theirs:
+                if bool(mine) != bool(theirs):
+                    diffs.append((name, None, None, bool(mine), bool(theirs)))
+                continue
+            if mine == theirs:
+                continue
+            for channel in range(1, schema.count + 1):
+                start = schema.stride * (channel - 1)
+                mine_block = mine[start:start + schema.stride]
+                theirs_block = theirs[start:start + schema.stride]
+                if mine_block == theirs_block:
+                    continue
+                mine_record, theirs_record = schema.decode(mine_block), schema.decode(theirs_block)
+                for field in schema.fields:
+                    field_slice = slice(field.offset, field.offset + field.registers)
+                    if mine_block[field_slice] != theirs_block[field_slice]:
+                        diffs.append((name, channel, field.name, mine_record[field.name], theirs_record[field.name]))
+        return diffs
+
+
+def format_diff(diffs):
+    """
+    :param diffs: Snapshot.diff的结果
+    :return: 每条差异一行的文本
+    """
+    lines = []
+    for name, channel, field, before, after in diffs:
+        if channel is None:
+            lines.append(f"{name}: 读取{'成功' if before else '失败'} -> 读取{'成功' if after else '失败'}")
+        else:
+            lines.append(f"{name}[{channel}].{field}: {before} -> {after}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    # python -m Config.IOM.modbus_snapshot capture <文件> [从站地址]
+    # python -m Config.IOM.modbus_snapshot diff <文件1> <文件2>
+    if len(sys.argv) >= 3 and sys.argv[1] == 'capture':
+        from Config.IOM.modbus_connet import conn_manager
+        slave = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+        snapshot = Snapshot.capture(conn_manager.get(), slave=slave)
+        snapshot.save(sys.argv[2])
+        print(f"快照已保存到{sys.argv[2]}，耗时{snapshot.metadata['duration']:.3f}s")
+    elif len(sys.argv) == 4 and sys.argv[1] == 'diff':
+        print(format_diff(Snapshot.load(sys.argv[2]).diff(Snapshot.load(sys.argv[3]))) or "无差异")
+    else:
+        print("用法: capture <文件> [从站地址] | diff <文件1> <文件2>")
@@ -0,0 +1,93 @@
+from collections import deque
+
+
+class RtuTiming:
+    def __init__(self, baudrate, parity='N', bytesize=8, stopbits=1):
+        """
+        根据波特率和校验位计算RTU时序
+        :param baudrate: 波特率
+        :param parity: N/E/O
+        :param bytesize: 数据位
+        :param stopbits: 停止位
+        """
+        # 每个字符：起始位 + 数据位 + 校验位 + 停止位
+        bits = 1 + bytesize + (0 if parity == 'N' else 1) + stopbits
+        self.char_time = bits / baudrate
+        # Modbus规范：波特率高于19200时帧间隔固定为 t1.5=750us、t3.5=1.75ms
+        if baudrate > 19200:
+            self.t15 = 0.00075
+            self.t35 = 0.00175
+        else:
+            self.t15 = 1.5 * self.char_time
+            self.t35 = 3.5 * self.char_time
+
+    def frame_time(self, nbytes):
+        """
+        nbytes字节的帧在线路上的传输时间（秒）
+        :param nbytes:
+        :return:
+        """
+        return nbytes * self.char_time
+
+    def wire_time(self, request_bytes, response_bytes):
+        """
+        一次事务中请求和响应的传输时间，加上两次3.5字符帧间静默
+        :param request_bytes: 请求帧字节数
+        :param response_bytes: 响应帧字节数
+        :return:
+        """
+        return self.frame_time(request_bytes + response_bytes) + 2 * self.t35
+
+
+class RttEstimator:
+    def __init__(self, window=64, percentile=95, margin=1.5, floor=0.05, ceiling=1.0, initial=0.5, min_samples=8):
+        """
+        根据最近若干次事务的设备响应时间（扣除线路传输时间）的百分位数估算响应超时；
+        超时的事务没有响应时间样本，每次超时将超时时间加倍，直到下一次成功的事务
+        :param window: 统计最近多少次事务
+        :param percentile: 使用的百分位数
+        :param margin: 百分位数的放大倍数
+        :param floor: 超时下限（秒）
+        :param ceiling: 超时上限（秒）
+        :param initial: 样本不足时使用的超时（秒）
+        :param min_samples: 开始自适应所需的最少样本数
+        """
+        self.samples = deque(maxlen=window)
+        self.percentile = percentile
+        self.margin = margin
+        self.floor = floor
+        self.ceiling = ceiling
+        self.initial = initial
+        self.min_samples = min_samples
+        # 超时退避后的超时时间，为0时不退避
+        self.backoff_timeout = 0
+
+    def add(self, rtt):
+        """
+        记录一次成功事务的设备响应时间，同时结束超时退避
+        :param rtt: 秒
+        :return:
+        """
+        self.samples.append(rtt)
+        self.backoff_timeout = 0
+
+    def backoff(self):
+        """
+        记录一次超时：超时时间加倍，不超过ceiling
+        :return: 退避后的超时（秒）
+        """
+        self.backoff_timeout = min(2 * self.timeout(), self.ceiling)
+        return self.backoff_timeout
+
+    def timeout(self):
+        """
+        当前的设备响应超时（秒），不含线路传输时间
+        :return:
+        """
+        if len(self.samples) < self.min_samples:
+            estimate = self.initial
+        else:
+            ordered = sorted(self.samples)
+            index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+            estimate = ordered[index] * self.margin
+        return min(max(estimate, self.backoff_timeout, self.floor), self.ceiling)
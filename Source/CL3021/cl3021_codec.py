@@ -0,0 +1,286 @@
+import struct
+from functools import reduce
+from operator import xor
+
+# 帧头
+FRAME_HEAD = 0x81
+# 数值字段：32位有符号整数（小端序），带指数字节时指数为有符号字节，0xfc表示×10^-4
+VALUE_EXP = struct.Struct('<ib')
+EXP_1E4 = -4
+DEFAULT_SCALE = 10000
+
+# 各命令的固定帧头（不含数据和校验）
+DC_HEAD = bytes([0x81, 0x01, 0x26, 0x11, 0x31, 0x03])
+AC_HEAD = bytes([0x81, 0x01, 0x25, 0x49, 0xa3, 0x05, 0x46, 0x3f])
+AC_TAIL = bytes([0x07, 0x07, 0x3F, 0x3F, 0x00])
+HARMONIC_CONTENT_HEAD = bytes([0x81, 0x01, 0x07, 0x74, 0xa6, 0x05, 0x02, 0x00, 0x00, 0x69])
+HARMONIC_PHASE_HEAD = bytes([0x81, 0x01, 0x07, 0x5f, 0xa6, 0x05, 0x0a, 0x00, 0x00, 0x54])
+HARMONIC_SWITCH_HEAD = bytes([0x81, 0x01, 0x25, 0x22, 0xa3, 0x05, 0x20, 0x7f])
+WIRE_HEAD = bytes([0x81, 0x01, 0x25, 0x0a, 0xa3, 0x00, 0x01, 0x20])
+READ_DC_HEAD = bytes([0x81, 0x01, 0x26, 0x06, 0xA3])
+HARMONIC_COUNT = 21
+
+# 预编译的数据段：设置交流为6个相位 + 0xFF + 6个带指数的幅值 + 频率；设置直流为带指数的电压、电流
+DC_BODY = struct.Struct('<ibib')
+AC_BODY = struct.Struct('<6iB' + 'ib' * 6 + 'i')
+HARMONIC_CONTENT_BODY = struct.Struct('<' + 'ib' * HARMONIC_COUNT)
+# 谐波相位每个值前有一个0x00字节，之后为小端序的4字节值
+HARMONIC_PHASE_BODY = struct.Struct('<' + 'xi' * HARMONIC_COUNT)
+HARMONIC_SWITCH_BODY = struct.Struct('<6IB')
+# 直流测量响应：电压在[16:21]，电流在[21:26]（值 + 指数字节）
+DC_RESPONSE_CMD = 0x53
+DC_RESPONSE_U = 16
+DC_RESPONSE_I = 21
+DC_RESPONSE_LENGTH = 0x20
+# 读取交流测量值：读取全部幅值、频率、相位、功率因数、功率
+READ_AC_HEAD = bytes([0x81, 0x01, 0x25, 0x0d, 0xa0, 0x02, 0x3d, 0xff, 0x3f, 0xff, 0xff, 0x0f])
+# 交流测量响应：8字节帧头和标志之后依次为 6个幅值（Int4E1）、频率（u32，×10^4）、过载标志、标志、6个相位（u32，×10^4）、
+# 标志、3个相角（u32，×10^4）、5个功率因数（s32，×10^4）、标志、8个有功/无功功率（Int4E1）、标志、4个视在功率（Int4E1）
+AC_RESPONSE_CMD = 0x50
+AC_RESPONSE_BODY = struct.Struct('<8x' + 'ib' * 6 + 'IBx' + '6I' + 'x' + '3I' + '5i' + 'x' + 'ib' * 8 + 'x' + 'ib' * 4)
+AC_RESPONSE_LENGTH = AC_RESPONSE_BODY.size + 1
+AC_FIELDS = ('uc', 'ub', 'ua', 'ic', 'ib', 'ia', 'f', 'overload',
+             'quc', 'qub', 'qua', 'qic', 'qib', 'qia', 'phic', 'phib', 'phia',
+             'pfc', 'pfb', 'pfa', 'cos', 'sin',
+             'pc', 'pb', 'pa', 'p', 'qc', 'qb', 'qa', 'q', 'sc', 'sb', 'sa', 's')
+DC_FIELDS = ('u', 'i')
+
+# 帧格式：帧头 + 接收ID + 发送ID + 帧长 + 指令码 + 数据 + 异或和
+DEVICE_ID = 0x01
+AC_HOST = 0x25
+DC_HOST = 0x26
+# 设备返回的指令码：写入类命令返回成功/失败，读取类命令返回数据或失败
+ACK_OK = 0x30
+ACK_FAIL = 0x33
+ACK_LENGTH = 6
+READ_DC_CMD = 0xA3
+READ_CMD = 0xA0
+READ_ARRAY_CMD = 0xA5
+ONLINE_CMD = 0xC9
+# (发送ID, 指令码) -> (返回指令码, 返回帧最小长度)，长度为None时以返回帧自身的帧长为准
+RESPONSES = {
+    (DC_HOST, READ_DC_CMD): (DC_RESPONSE_CMD, DC_RESPONSE_LENGTH),
+    (AC_HOST, READ_CMD): (AC_RESPONSE_CMD, None),
+    (AC_HOST, READ_ARRAY_CMD): (0x55, None),
+    (AC_HOST, ONLINE_CMD): (0x39, 0x29),
+}
+
+
+class Cl3021CodecError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+def scaled(value, scale=DEFAULT_SCALE):
+    """
+    工程值放大为整数，与原有的int(value * 10000)一致（向0截断）
+    :param value:
+    :param scale:
+    :return:
+    """
+    return int(value * scale)
+
+
+def xor_checksum(data, start=1, end=None):
+    """
+    异或校验和
+    :param data: 帧（bytes/bytearray）
+    :param start: 参与校验的起始下标，协议中不含帧头
+    :param end: 参与校验的结束下标（不含），部分命令不含最后一个数据字节
+    :return:
+    """
+    return reduce(xor, memoryview(data)[start:end], 0)
+
+
+def finish_frame(frame, end=None):
+    """
+    追加校验码
+    :param frame: bytearray
+    :param end: 校验范围的结束下标，为空时校验到末尾
+    :return: bytes
+    """
+    frame.append(xor_checksum(frame, 1, end))
+    return bytes(frame)
+
+
+def parse_bits(bits):
+    """
+    二进制字符串转整数，如 '101' -> 5
+    :param bits:
+    :return:
+    """
+    try:
+        return int(bits, 2)
+    except ValueError:
+        raise Cl3021CodecError(f"{bits}不是一个有效的二进制字符串")
+
+
+def encode_dc(u, i):
+    """
+    设置直流源输出
+    :param u: 单位V
+    :param i: 单位mA
+    :return: 帧
+    """
+    frame = bytearray(DC_HEAD)
+    frame += DC_BODY.pack(scaled(u), EXP_1E4, scaled(i / 1000), EXP_1E4)
+    return finish_frame(frame)
+
+
+def encode_ac(quc, qub, qua, qic, qib, qia, uc, ub, ua, ic, ib, ia, f):
+    """
+    设置交流相位、幅值、频率，参数同source_control.set_ac
+    :return: 帧
+    """
+    values = [scaled(q) for q in (quc, qub, qua, qic, qib, qia)] + [0xFF]
+    for amplitude in (uc, ub, ua, ic, ib, ia):
+        values += [scaled(amplitude), EXP_1E4]
+    values.append(scaled(f))
+    frame = bytearray(AC_HEAD)
+    frame += AC_BODY.pack(*values)
+    frame += AC_TAIL
+    return finish_frame(frame)
+
+
+def encode_harmonic_content(harmonic_content):
+    """
+    设置谐波含量：数值不放大，基波的指数字节为0x00，其余为0xfe；校验不含最后一个字节
+    :param harmonic_content: 21个谐波百分比值
+    :return: 帧
+    """
+    if len(harmonic_content) != HARMONIC_COUNT:
+        raise Cl3021CodecError('谐波次数最大为21次，请确保为21个谐波')
+    values = []
+    for index, element in enumerate(harmonic_content):
+        values += [int(element), 0 if index == 0 else -2]
+    frame = bytearray(HARMONIC_CONTENT_HEAD)
+    frame += HARMONIC_CONTENT_BODY.pack(*values)
+    return finish_frame(frame, -1)
+
+
+def encode_harmonic_phase(harmonic_phase):
+    """
+    设置谐波相位：每个值为 0x00 + 放大10000倍的小端序4字节；校验不含最后一个字节
+    :param harmonic_phase: 21个谐波相位
+    :return: 帧
+    """
+    if len(harmonic_phase) != HARMONIC_COUNT:
+        raise Cl3021CodecError('谐波次数最大为21次，请确保为21个谐波')
+    frame = bytearray(HARMONIC_PHASE_HEAD)
+    frame += HARMONIC_PHASE_BODY.pack(*[scaled(element) for element in harmonic_phase])
+    return finish_frame(frame, -1)
+
+
+def encode_harmonic_switch(uc_hc, ub_hc, ua_hc, ic_hc, ib_hc, ia_hc, total_switch):
+    """
+    设置谐波开关：6个通道各4字节（小端序，bit n为n+1次谐波），总开关1字节；校验不含总开关字节
+    :param uc_hc: 二进制字符串，如 '101' 表示开启基波和3次谐波
+    :return: 帧
+    """
+    switches = [parse_bits(bits) for bits in (uc_hc, ub_hc, ua_hc, ic_hc, ib_hc, ia_hc, total_switch)]
+    frame = bytearray(HARMONIC_SWITCH_HEAD)
+    frame += HARMONIC_SWITCH_BODY.pack(*switches)
+    return finish_frame(frame, -1)
+
+
+def encode_wire(way):
+    """
+    设置接线方式
+    :param way: 二进制字符串，如 '00001000'
+    :return: 帧
+    """
+    frame = bytearray(WIRE_HEAD)
+    frame.append(parse_bits(way))
+    return finish_frame(frame)
+
+
+def encode_read_dc():
+    """
+    读取直流测量值
+    :return: 帧
+    """
+    return finish_frame(bytearray(READ_DC_HEAD))
+
+
+def encode_read_ac():
+    """
+    读取交流测量值
+    :return: 帧
+    """
+    return finish_frame(bytearray(READ_AC_HEAD))
+
+
+def exponent_value(value, exponent):
+    """
+    Int4E1：值 * 10^指数
+    """
+    # 负指数用除法，结果与原有的 整数/1e6 完全一致
+    if exponent < 0:
+        return value / 10 ** -exponent
+    return value * 10 ** exponent
+
+
+def decode_value(byte_data, offset):
+    """
+    解析 4字节有符号整数 + 指数字节 的数值
+    :param byte_data: 响应帧
+    :param offset: 数值起始下标
+    :return: 值 * 10^指数
+    """
+    return exponent_value(*VALUE_EXP.unpack_from(byte_data, offset))
+
+
+def parse_dc(byte_data):
+    """
+    解析直流测量值的响应帧
+    :param byte_data: 响应帧
+    :return: (电压, 电流)
+    """
+    if len(byte_data) < DC_RESPONSE_I + VALUE_EXP.size:
+        raise Cl3021CodecError(f"直流测量响应长度错误：{bytes(byte_data).hex()}")
+    return decode_value(byte_data, DC_RESPONSE_U), decode_value(byte_data, DC_RESPONSE_I)
+
+
+def parse_ac(byte_data):
+    """
+    解析交流测量值的响应帧（读取全部数据时）
+    :param byte_data: 响应帧
+    :return: 与AC_FIELDS对应的值列表
+    """
+    if len(byte_data) < AC_RESPONSE_LENGTH:
+        raise Cl3021CodecError(f"交流测量响应长度错误：{bytes(byte_data).hex()}")
+    raw = AC_RESPONSE_BODY.unpack_from(byte_data)
+    # 6个幅值
+    values = [exponent_value(raw[index], raw[index + 1]) for index in range(0, 12, 2)]
+    # 频率、过载标志
+    values += [raw[12] / DEFAULT_SCALE, raw[13]]
+    # 6个相位、3个相角、5个功率因数
+    values += [value / DEFAULT_SCALE for value in raw[14:28]]
+    # 12个功率
+    values += [exponent_value(raw[index], raw[index + 1]) for index in range(28, 52, 2)]
+    return values
+
+
+def expected_response(frame):
+    """
+    发送帧对应的设备返回
+    :param frame: 发送帧
+    :return: (返回的发送ID（即本机ID）, 返回指令码, 返回帧最小长度)，失败返回（ACK_FAIL）对所有命令都有效
+    """
+    host, cmd = frame[2], frame[4]
+    response_cmd, length = RESPONSES.get((host, cmd), (ACK_OK, ACK_LENGTH))
+    return host, response_cmd, length
+
+
+def parse_header(frame):
+    """
+    校验设备返回帧的帧头、发送ID和帧长
+    :param frame: 返回帧
+    :return: (接收ID（本机ID）, 指令码, 校验是否正确)
+    """
+    if len(frame) < ACK_LENGTH or frame[0] != FRAME_HEAD or frame[2] != DEVICE_ID or frame[3] != len(frame):
+        raise Cl3021CodecError(f"返回帧格式错误：{bytes(frame).hex()}")
+    return frame[1], frame[4], xor_checksum(frame, 1, -1) == frame[-1]
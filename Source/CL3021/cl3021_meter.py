@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from collections import deque
+from Common.ring_buffer import RingBuffer
+from Source.CL3021 import cl3021_codec
+from Source.CL3021.cl3021_transport import Cl3021TransportError
+from Source.CL3021.source_control import default_source
+
+# 模式 -> (读取帧, 解析函数, 字段)
+METER_MODES = {
+    'dc': (cl3021_codec.encode_read_dc, cl3021_codec.parse_dc, cl3021_codec.DC_FIELDS),
+    'ac': (cl3021_codec.encode_read_ac, cl3021_codec.parse_ac, cl3021_codec.AC_FIELDS),
+}
+
+
+class Cl3021Meter(threading.Thread):
+    def __init__(self, mode='dc', source=None, rate_hz=None, capacity=10000, pipeline=2, timeout=None):
+        """
+        后台持续读取CL3021直流表或交流表，解析后带时间戳写入环形缓冲区，用于观察源输出的稳定过程
+        :param mode: 'dc'：直流电压、电流；'ac'：交流幅值、频率、相位、功率等（字段见cl3021_codec.AC_FIELDS）
+        :param source: Cl3021SourCon 实例，为空时使用共享的默认会话，可与其他命令共用
+        :param rate_hz: 目标读取速率（次/秒），为空时按设备能达到的最高速率连续读取
+        :param capacity: 环形缓冲区容量（条）
+        :param pipeline: 同时等待返回的请求数，大于1时可掩盖网络往返时间
+        :param timeout: 每个请求的等待时间（秒），为空时使用默认值；超时不重发，计入errors
+        """
+        if mode not in METER_MODES:
+            raise ValueError(f"不支持的模式: {mode}，可选 {list(METER_MODES)}")
+        super().__init__(name=f'cl3021-{mode}-meter', daemon=True)
+        self.mode = mode
+        self.source = source
+        encode, self.parse, self.fields = METER_MODES[mode]
+        self.frame = encode()
+        self.period = 1 / rate_hz if rate_hz else 0
+        self.pipeline = max(1, pipeline)
+        self.timeout = timeout
+        self.buffer = RingBuffer(capacity, len(self.fields))
+        self.errors = 0
+        self._stop_event = threading.Event()
+        self._started_at = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def achieved_rate(self):
+        """实际读取速率（次/秒）"""
+        if not self._started_at or not self.buffer.written:
+            return 0.0
+        return self.buffer.written / (time.monotonic() - self._started_at)
+
+    def run(self):
+        source_control = self.source or default_source()
+        self._started_at = time.monotonic()
+        next_time = self._started_at
+        waiting = deque()
+        while not self._stop_event.is_set():
+            # 连续读取时保持pipeline个请求在途；限速时逐个发送
+            while len(waiting) < (self.pipeline if not self.period else 1):
+                waiting.append(source_control.request(self.frame, self.timeout, retries=0))
+            try:
+                future = waiting.popleft()
+                response = source_control.transport.wait(future, self.frame, self.timeout, retries=0)
+                # 时间戳取返回到达的时间，不受排队和匹配顺序影响
+                self.buffer.append(future.received_at, self.parse(response[0]))
+            except (Cl3021TransportError, cl3021_codec.Cl3021CodecError) as e:
+                self.errors += 1
+                logging.warning(f"CL3021{self.mode}表读取失败: {e}")
+                if source_control.closed:
+                    break
+            if not self.period:
+                continue
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                # 设备跟不上设定速率，从当前时刻重新计时，不追赶积压的周期
+                next_time = time.monotonic()
+        for future in waiting:
+            future.cancel()
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def snapshot(self):
+        """
+        :return: (时间戳, 值)，从旧到新，值与fields对应
+        """
+        return self.buffer.snapshot()
+
+    def latest(self, n=1):
+        """
+        :param n: 最近n条
+        :return: (时间戳, 值)，从旧到新
+        """
+        return self.buffer.latest(n)
+
+    def latest_values(self):
+        """
+        :return: 最近一次读数 {字段名: 值}，还没有读数时为None
+        """
+        if not self.buffer.written:
+            return None
+        timestamps, values = self.buffer.latest(1)
+        return dict(zip(self.fields, [float(value) for value in values[0]]))
+
+    def samples(self, poll_interval=0.05):
+        """
+        生成器：持续产出新的读数 (时间戳, 值)，停止后结束
+        :param poll_interval:
+        :return:
+        """
+        return self.buffer.follow(poll_interval, self._stop_event)
@@ -0,0 +1,265 @@
+import logging
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from Source.CL3021 import cl3021_codec
+
+# 各返回指令码的默认等待时间（秒）
+RESPONSE_TIMEOUT = {
+    cl3021_codec.ACK_OK: 0.5,
+    cl3021_codec.DC_RESPONSE_CMD: 0.5,
+    0x50: 1.0,
+    0x55: 1.0,
+    0x39: 1.0,
+}
+DEFAULT_TIMEOUT = 1.0
+DEFAULT_RETRIES = 2
+# 接收线程的socket超时，即检查超时和重发的周期
+TICK = 0.02
+# 超时请求的迟到返回在该时间（秒）内丢弃
+STALE_WINDOW = 3.0
+
+
+class Cl3021TransportError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+class Cl3021TimeoutError(Cl3021TransportError):
+    pass
+
+
+class Cl3021NakError(Cl3021TransportError):
+    """设备返回失败（0x33）"""
+    pass
+
+
+class _Pending:
+    def __init__(self, frame, host, response_cmd, length, timeout, retries):
+        """
+        一个等待设备返回的请求
+        """
+        self.frame = frame
+        self.host = host
+        self.response_cmd = response_cmd
+        self.length = length
+        self.timeout = timeout
+        self.retries = retries
+        self.sent = 0
+        self.deadline = None
+        self.future = Future()
+
+    def matches(self, cmd, length):
+        if cmd == cl3021_codec.ACK_FAIL:
+            return True
+        return cmd == self.response_cmd and (self.length is None or length >= self.length)
+
+
+class Cl3021Transport:
+    def __init__(self, udp_socket, dest_addr, retries=DEFAULT_RETRIES):
+        """
+        CL3021 UDP收发：后台线程独占接收，按 (本机ID, 返回指令码, 帧长) 将返回匹配到最早的等待请求，
+        超时后重发，重发次数用尽后以异常结束请求
+        :param udp_socket: 已绑定本地端口的UDP socket
+        :param dest_addr: 设备地址
+        :param retries: 默认重发次数
+        """
+        self.udp_socket = udp_socket
+        self.dest_addr = dest_addr
+        self.retries = retries
+        # 本机ID -> 按发送顺序排列的等待请求（设备对同一ID的命令按顺序返回）
+        self._pending = {}
+        # 本机ID -> [(返回指令码, 丢弃截止时间)]：每个超时或取消的请求登记一条，其迟到的返回在没有等待中的请求时丢弃，
+        # 不放入unsolicited；有等待中的请求时仍交给该请求，避免丢包后每次返回都被当作迟到返回而连续超时
+        self._stale = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # 未匹配到请求的数据报
+        self.unsolicited = queue.Queue(maxsize=64)
+        self._thread = threading.Thread(target=self._receive_loop, name='cl3021-receiver', daemon=True)
+        self.udp_socket.settimeout(TICK)
+        self._thread.start()
+
+    def request(self, frame, timeout=None, retries=None, callback=None):
+        """
+        发送一帧并返回Future，结果为 (返回帧, 设备地址)
+        :param frame: 发送帧
+        :param timeout: 每次发送的等待时间（秒），为空时按返回指令码取默认值
+        :param retries: 重发次数，为空时使用默认值
+        :param callback: 完成时的回调，参数为Future
+        :return: concurrent.futures.Future，设备返回失败时异常为Cl3021NakError，无返回时为Cl3021TimeoutError
+        """
+        host, response_cmd, length = cl3021_codec.expected_response(frame)
+        if timeout is None:
+            timeout = RESPONSE_TIMEOUT.get(response_cmd, DEFAULT_TIMEOUT)
+        pending = _Pending(bytes(frame), host, response_cmd, length, timeout,
+                           self.retries if retries is None else retries)
+        if callback is not None:
+            pending.future.add_done_callback(callback)
+        with self._lock:
+            if self._stop.is_set():
+                raise Cl3021TransportError('CL3021连接已关闭')
+            # 先登记再发送，避免返回先于登记到达；加锁保证登记顺序与发送顺序一致
+            self._pending.setdefault(host, deque()).append(pending)
+            self._send(pending)
+        return pending.future
+
+    def max_wait(self, frame, timeout=None, retries=None):
+        """
+        一个请求最长的等待时间（含重发），用于Future.result的超时，接收线程异常时调用方也不会一直阻塞
+        :return: 秒
+        """
+        if timeout is None:
+            timeout = RESPONSE_TIMEOUT.get(cl3021_codec.expected_response(frame)[1], DEFAULT_TIMEOUT)
+        return timeout * ((self.retries if retries is None else retries) + 1) + 1.0
+
+    def wait(self, future, frame, timeout=None, retries=None):
+        """
+        等待请求完成，最多等待max_wait秒
+        :return: (返回帧, 设备地址)
+        """
+        try:
+            return future.result(self.max_wait(frame, timeout, retries))
+        except FutureTimeoutError:
+            future.cancel()
+            raise Cl3021TimeoutError(f"CL3021请求等待超时：{bytes(frame).hex()}")
+
+    def _send(self, pending):
+        pending.sent += 1
+        pending.deadline = time.monotonic() + pending.timeout
+        try:
+            self.udp_socket.sendto(pending.frame, self.dest_addr)
+        except OSError as e:
+            # 发送失败按丢包处理，超时后重发
+            logging.warning(f"CL3021发送失败：{e}")
+
+    def _receive_loop(self):
+        while not self._stop.is_set():
+            try:
+                data, addr = self.udp_socket.recvfrom(1024)
+            except socket.timeout:
+                data = None
+            except ConnectionResetError:
+                # Windows下设备端口不可达（控源软件未打开）时的ICMP错误，继续等待，由超时和重发处理
+                data = None
+            except OSError as e:
+                if not self._stop.is_set():
+                    logging.error(f"CL3021接收线程异常退出：{e}")
+                    self._stop.set()
+                break
+            with self._lock:
+                finished = self._dispatch(data, addr, time.monotonic()) if data is not None else []
+                finished += self._check_deadlines()
+            self._finish(finished)
+        self._fail_pending()
+
+    @staticmethod
+    def _finish(finished):
+        # 在锁外完成Future，回调中可以继续发送请求
+        for future, result, error in finished:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _fail_pending(self):
+        """接收停止后，未完成的请求以异常结束"""
+        with self._lock:
+            waiting = [pending for requests in self._pending.values() for pending in requests]
+            self._pending.clear()
+        self._finish([(pending.future, None, Cl3021TransportError('CL3021连接已关闭')) for pending in waiting])
+
+    def _dispatch(self, data, addr, received_at):
+        """
+        :param received_at: 收到的时间（time.monotonic()），记录在Future.received_at
+        :return: [(Future, 结果, 异常)]
+        """
+        try:
+            host, cmd, checksum_ok = cl3021_codec.parse_header(data)
+        except cl3021_codec.Cl3021CodecError as e:
+            logging.debug(f"丢弃CL3021数据报：{e}")
+            return []
+        if not checksum_ok:
+            # UDP本身已有校验，这里只记录，不丢弃
+            logging.warning(f"CL3021返回帧校验和不一致：{data.hex()}")
+        waiting = self._pending.get(host, ())
+        for pending in waiting:
+            if pending.matches(cmd, len(data)):
+                waiting.remove(pending)
+                pending.future.received_at = received_at
+                if cmd == cl3021_codec.ACK_FAIL:
+                    return [(pending.future, None, Cl3021NakError(f"CL3021返回失败：{pending.frame.hex()}"))]
+                return [(pending.future, (data, addr), None)]
+        if self._drop_stale(host, cmd):
+            logging.debug(f"丢弃超时请求的迟到返回：{data.hex()}")
+            return []
+        try:
+            self.unsolicited.put_nowait((data, addr))
+        except queue.Full:
+            logging.debug(f"丢弃未匹配的CL3021数据报：{data.hex()}")
+        return []
+
+    def _mark_stale(self, pending):
+        deadline = time.monotonic() + max(pending.timeout, STALE_WINDOW)
+        self._stale.setdefault(pending.host, []).append((pending.response_cmd, deadline))
+
+    def _drop_stale(self, host, cmd):
+        stale = self._stale.get(host)
+        if not stale:
+            return False
+        now = time.monotonic()
+        stale[:] = [(response_cmd, deadline) for response_cmd, deadline in stale if deadline > now]
+        for index, (response_cmd, _) in enumerate(stale):
+            if cmd in (response_cmd, cl3021_codec.ACK_FAIL):
+                del stale[index]
+                return True
+        return False
+
+    def _check_deadlines(self):
+        """
+        已取消的请求不再等待，超时的请求重发或以Cl3021TimeoutError结束
+        :return: [(Future, 结果, 异常)]
+        """
+        finished = []
+        now = time.monotonic()
+        for waiting in self._pending.values():
+            for pending in list(waiting):
+                if pending.future.cancelled():
+                    waiting.remove(pending)
+                    self._mark_stale(pending)
+                elif pending.deadline <= now:
+                    if pending.sent <= pending.retries:
+                        logging.warning(f"CL3021无返回，第{pending.sent}次重发：{pending.frame.hex()}")
+                        self._send(pending)
+                    else:
+                        waiting.remove(pending)
+                        self._mark_stale(pending)
+                        finished.append((pending.future, None, Cl3021TimeoutError(
+                            f"CL3021无返回（发送{pending.sent}次）：{pending.frame.hex()}")))
+        return finished
+
+    def recv(self, timeout):
+        """
+        读取一个未匹配到请求的数据报
+        :param timeout: 等待时间（秒）
+        :return: (数据, 设备地址)
+        """
+        try:
+            return self.unsolicited.get(timeout=timeout)
+        except queue.Empty:
+            raise Cl3021TimeoutError('CL3021无数据')
+
+    def close(self):
+        """停止接收线程，未完成的请求以异常结束"""
+        self._stop.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+        self._fail_pending()
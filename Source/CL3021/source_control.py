@@ -1,8 +1,14 @@
+import asyncio
+import atexit
 import socket
+import threading
 import struct
 import time
 import logging
 from Common.modbus_config import modbus_config
+from Common.settle import wait_until_stable
+from Source.CL3021 import cl3021_codec
+from Source.CL3021 import cl3021_transport
 from decimal import Decimal, ROUND_HALF_UP
 
 
@@ -11,6 +17,30 @@ class SourceControlError(Exception):
         self.msg = msg
 
 
+class SettleTimeoutError(SourceControlError):
+    def __init__(self, msg, settle):
+        """
+        源输出在等待时间内没有稳定到设定值
+        :param msg:
+        :param settle: SettleResult，包含最后一次读回值和等待耗时
+        """
+        super().__init__(msg)
+        self.settle = settle
+
+    def __str__(self):
+        return self.msg
+
+
+# 源输出稳定判定：窗口内所有读回值都在 目标值±max(目标值×0.2%, 下限) 以内
+SETTLE_RELATIVE_ACCURACY = 0.002
+SETTLE_MIN_ACCURACY = 0.001
+SETTLE_WINDOW = 3
+SETTLE_INTERVAL = 0.05
+# 各读回量的默认精度下限：直流电压V、直流电流A；交流电压V、交流电流A、频率Hz
+DC_ACCURACY_FLOOR = {'u': 0.005, 'i': 0.00005}
+AC_ACCURACY_FLOOR = {'u': 0.05, 'i': 0.001, 'f': 0.01}
+
+
 class SourCon:
     def __init__(self):
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # udp方式socket配置：ipv4，udp
@@ -79,13 +109,15 @@ def sour_para_conf(input_method='直接'):
     re.close()
 
 
-def sour_output(voltage: float, current: float, stable_time=10):
+def sour_output(voltage: float, current: float, stable_time=10, read=None, accuracy=None):
     """
     控制电压电流输出
     :param voltage:
     :param current:
-    :param stable_time:
-    :return:
+    :param stable_time: 未指定read时为固定等待时间；指定read时为最长等待时间
+    :param read: 读回函数，返回 (电压, 电流)，指定后读回值到达目标值并稳定即返回
+    :param accuracy: 读回值与目标值之差的上限（单值或 (电压, 电流)），为空时为目标值的0.2%
+    :return: 指定read时返回SettleResult
     """
     vol = voltage / 1000 * 100  # 输出电压，转化为百分比，适应量程变化
     cur = current / 500 * 100  # 输出电流，转化为百分比，适应量程变化
@@ -102,20 +134,22 @@ def sour_output(voltage: float, current: float, stable_time=10):
     re = SourCon()
     re.send(data, wait_response=False)
     re.close()
-    time.sleep(stable_time)  # 输出稳定等待时间10s
+    return wait_for_output(read, (voltage, current), accuracy, stable_time)
 
 
 def mv_sour_output(voltage: float, current: float, shunt_rate=18, stable_time=10, current_direction='正向',
-                   mv_flag=True):
+                   mv_flag=True, read=None, accuracy=None):
     """
     控制源输出参数
     :param voltage: 源输出的电压
     :param current: 源输出的电流
     :param shunt_rate: Shunt的额定电压，仅在mV信号时使用，非mV信号禁止修改
-    :param stable_time: 源输出到稳定的时间
+    :param stable_time: 源输出到稳定的时间；指定read时为最长等待时间
     :param current_direction: 电能方向，仅在mV信号时使用，非mV信号禁止修改
     :param mv_flag: 是否使用mv信号的标志，True:需要将源的电流接入方式为间接接入式，False:源的电流接入方式为直接接入式
-    :return:
+    :param read: 读回函数，返回 (电压, 电流)，指定后读回值到达目标值并稳定即返回
+    :param accuracy: 读回值与目标值之差的上限（单值或 (电压, 电流)），为空时为目标值的0.2%
+    :return: 指定read时返回SettleResult
     """
     if mv_flag is True:
         vol = voltage / 1000 * 100
@@ -141,7 +175,43 @@ def mv_sour_output(voltage: float, current: float, shunt_rate=18, stable_time=10
     if expect_receive not in receive_ret:
         raise SourceControlError('Source control fail,Please check Environment.')
     logging.info('Source control success, voltage is:{}, current is:{}'.format(voltage, current))
-    time.sleep(stable_time)
+    return wait_for_output(read, (voltage, current), accuracy, stable_time)
+
+
+def wait_for_output(read, target, accuracy=None, timeout=10, floor=None):
+    """
+    源输出后的等待：有读回时轮询读回值，到达目标值并稳定即返回；没有读回时按timeout固定等待
+    :param read: 无参读回函数，返回与target对齐的值，读取失败返回None
+    :param target: 目标值列表
+    :param accuracy: 读回值与目标值之差的上限，为空时为目标值的SETTLE_RELATIVE_ACCURACY，且不小于floor
+    :param timeout: 最长等待时间（秒）
+    :param floor: 各目标值默认精度的下限列表
+    :return: 有读回时返回SettleResult，否则返回None
+    """
+    if read is None:
+        time.sleep(timeout)
+        return None
+    if accuracy is None:
+        accuracy = [max(abs(value) * SETTLE_RELATIVE_ACCURACY, limit)
+                    for value, limit in zip(target, floor or [SETTLE_MIN_ACCURACY] * len(target))]
+    settle = wait_until_stable(read, target=list(target), accuracy=accuracy, window=SETTLE_WINDOW,
+                               interval=SETTLE_INTERVAL, timeout=timeout)
+    if settle.settled:
+        logging.info(f"源输出已稳定，耗时{settle.elapsed:.2f}s，读回值{settle.value}")
+    else:
+        logging.warning(f"源输出{timeout}s内未稳定到{list(target)}，最后读回值{settle.value}")
+    return settle
+
+
+def check_settled(settle, what):
+    """
+    :param settle: SettleResult，为None（不等待）时不检查
+    :param what: 用于错误信息的输出描述
+    :return: settle
+    """
+    if settle is not None and not settle.settled:
+        raise SettleTimeoutError(f"{what}在{settle.elapsed:.2f}s内未稳定到设定值，最后读回值{settle.value}", settle)
+    return settle
 
 
 def sour_stop():
@@ -153,31 +223,186 @@ def sour_stop():
 
 
 class Cl3021SourCon:
-    def __init__(self):
+    def __init__(self, retries=cl3021_transport.DEFAULT_RETRIES):
+        """
+        控源UDP会话：绑定本地端口一次，之后的所有命令复用同一个socket，可作为上下文管理器使用。
+        设备的返回由后台线程接收并匹配到对应的命令，无返回时自动重发
+        :param retries: 无返回时的重发次数
+        """
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # ipv4，udp
-        self.udp_socket.settimeout(3)  # 3s超时
         self.udp_socket.bind((modbus_config['local']['ip'], modbus_config['local']['port']))
         self.dest_addr = (modbus_config['source']['ip'], modbus_config['source']['port'])
-
-    def send(self, hex_data, wait_response=True):
-        ret = self.udp_socket.sendto(hex_data, self.dest_addr)  # 返回发送的字节数
+        self.transport = cl3021_transport.Cl3021Transport(self.udp_socket, self.dest_addr, retries)
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def request(self, hex_data, timeout=None, retries=None, callback=None):
+        """
+        发送命令，不等待返回
+        :param hex_data: 发送帧
+        :param timeout: 每次发送的等待时间（秒），为空时按命令取默认值
+        :param retries: 重发次数，为空时使用会话的默认值
+        :param callback: 完成时的回调，参数为Future
+        :return: concurrent.futures.Future，结果为 (返回帧, 设备地址)
+        """
+        return self.transport.request(hex_data, timeout, retries, callback)
+
+    def send(self, hex_data, wait_response=True, timeout=None, retries=None):
+        """
+        发送命令
+        :param hex_data: 发送帧
+        :param wait_response: True：等待设备返回，设备返回失败或重发后仍无返回时抛出异常；
+                              False：不等待，失败只记录日志
+        :param timeout: 每次发送的等待时间（秒）
+        :param retries: 重发次数
+        :return: (发送的字节数, (返回帧, 设备地址))，不等待时返回帧为None
+        """
         if wait_response:
-            recv_data = self.udp_socket.recvfrom(1024)
-            return ret, recv_data
-        return ret, None
-
-    def recv(self):
+            future = self.request(hex_data, timeout, retries)
+            return len(hex_data), self.transport.wait(future, hex_data, timeout, retries)
+        self.request(hex_data, timeout, retries, callback=_log_failure)
+        return len(hex_data), None
+
+    def recv(self, timeout=3):
+        """
+        读取一个未匹配到命令的数据报
+        :param timeout: 等待时间（秒）
+        :return: 数据
+        """
         try:
-            recv_data = self.udp_socket.recvfrom(1024)
-        except TimeoutError:
+            return self.transport.recv(timeout)[0]
+        except cl3021_transport.Cl3021TimeoutError:
             raise SourceControlError(
                 'Source control timeout. Check whether the software of the control source is turned on.')
-        return recv_data[0]
 
     def close(self):
+        self.closed = True
+        self.transport.close()
         self.udp_socket.close()
 
 
+def _log_failure(future):
+    """不等待返回的命令失败时记录日志"""
+    if not future.cancelled() and future.exception() is not None:
+        logging.error(f"控源命令失败：{future.exception()}")
+
+
+_default_source = None
+_default_source_lock = threading.Lock()
+# 整台CL3021源的独占锁：只有一台源，从设定输出到测量完成期间持有，多块板子的测试依次驱动源
+source_lock = threading.RLock()
+
+
+def default_source():
+    """
+    共享的默认控源会话，不存在或已关闭时新建；各命令函数未传入source时使用
+    :return: Cl3021SourCon 实例
+    """
+    global _default_source
+    with _default_source_lock:
+        if _default_source is None or _default_source.closed:
+            _default_source = Cl3021SourCon()
+        return _default_source
+
+
+def close_default_source():
+    """关闭共享的默认控源会话"""
+    global _default_source
+    with _default_source_lock:
+        if _default_source is not None:
+            _default_source.close()
+            _default_source = None
+
+
+# 进程退出时释放本地端口
+atexit.register(close_default_source)
+
+
+class _Cl3021DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.queue.put_nowait((data, addr))
+
+
+class AsyncCl3021SourCon:
+    def __init__(self, timeout=3, retries=cl3021_transport.DEFAULT_RETRIES):
+        """
+        Cl3021SourCon 的异步版本，可与异步Modbus客户端在同一事件循环中并发。
+        与Cl3021SourCon绑定同一个本地端口，使用前需先关闭默认会话（close_default_source）
+        :param timeout: 每次发送等待响应的超时时间（秒）
+        :param retries: 无返回时的重发次数
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.transport = None
+        self.protocol = None
+        self.dest_addr = (modbus_config['source']['ip'], modbus_config['source']['port'])
+        # 同一时刻只有一条命令等待返回
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        self.transport, self.protocol = await loop.create_datagram_endpoint(
+            _Cl3021DatagramProtocol, local_addr=(modbus_config['local']['ip'], modbus_config['local']['port']))
+
+    async def send(self, hex_data, wait_response=True):
+        if self.transport is None:
+            await self.connect()
+        if not wait_response:
+            self.transport.sendto(bytes(hex_data), self.dest_addr)
+            return len(hex_data), None
+        host, response_cmd, length = cl3021_codec.expected_response(hex_data)
+        async with self.lock:
+            for attempt in range(self.retries + 1):
+                self.transport.sendto(bytes(hex_data), self.dest_addr)
+                try:
+                    data, addr = await self.recv(host, response_cmd, length)
+                except SourceControlError:
+                    if attempt == self.retries:
+                        raise
+                    logging.warning(f"CL3021无返回，第{attempt + 1}次重发：{bytes(hex_data).hex()}")
+                    continue
+                if data[4] == cl3021_codec.ACK_FAIL:
+                    raise cl3021_transport.Cl3021NakError(f"CL3021返回失败：{bytes(hex_data).hex()}")
+                return len(hex_data), (data, addr)
+
+    async def recv(self, host=None, response_cmd=None, length=None):
+        """
+        等待返回，丢弃与期望的 (本机ID, 返回指令码, 帧长) 不符的数据报（如之前命令迟到的返回）
+        :return: (返回帧, 设备地址)
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        while True:
+            try:
+                data, addr = await asyncio.wait_for(self.protocol.queue.get(), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                raise SourceControlError(
+                    'Source control timeout. Check whether the software of the control source is turned on.')
+            if response_cmd is None:
+                return data, addr
+            try:
+                rx, cmd, _ = cl3021_codec.parse_header(data)
+            except cl3021_codec.Cl3021CodecError:
+                continue
+            if rx == host and (cmd == cl3021_codec.ACK_FAIL or
+                               (cmd == response_cmd and (length is None or len(data) >= length))):
+                return data, addr
+            logging.debug(f"丢弃不匹配的CL3021数据报：{data.hex()}")
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+
 def bin_to_hex(binary):
     """
     将二进制字节流转化为16进制，（tcp或udp都是将数据转化为二进制字节流）
@@ -211,19 +436,19 @@ def xor_sum(numbers):
     return result
 
 
-def online():
+def online(source=None):
     """
     设备上线
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     online_cmd = [0x81, 0x01, 0x25, 0x06, 0xc9, 0xeb]
     pdu = bytearray(online_cmd)
-    source_control = Cl3021SourCon()
-    source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    source_control.send(pdu)
 
 
-def set_wire(way: str):
+def set_wire(way: str, source=None):
     """
     设置接线方式
     :param way:
@@ -235,25 +460,17 @@ def set_wire(way: str):
         BIT1 1——Q90;
         BIT0 1——Q60;
         其中BIT0~BIT3只能有一位为1，并与BIT6一起使用
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
-    try:
-        int(way, 2)  # 使用int()函数，第二个参数2表示二进制
-    except ValueError:
-        print(f"{way}不是一个有效的二进制字符串")
-    a = int(bin_to_hex(way), 16)
-    set_cmd = [0x81, 0x01, 0x25, 0x0a, 0xa3, 0x00, 0x01, 0x20, a]
-    xor = xor_sum(set_cmd[1:])
-    set_cmd.append(int(xor))
-    pdu = bytearray(set_cmd)  # 转化为2进制字节
-    source_control = Cl3021SourCon()
-    bytes_sent, _ = source_control.send(pdu, wait_response=False)
-    source_control.close()
+    pdu = cl3021_codec.encode_wire(way)
+    source_control = source or default_source()
+    bytes_sent, _ = source_control.send(pdu)
     return bytes_sent
 
 
 def set_ac(quc: float, qub: float, qua: float, qic: float, qib: float, qia: float, uc: float, ub: float, ua: float,
-           ic: float, ib: float, ia: float, f: float):
+           ic: float, ib: float, ia: float, f: float, source=None, settle_timeout=None, accuracy=None):
     """
     设置AC，相位，幅值，频率值
     :param quc: C相电压相位
@@ -269,90 +486,23 @@ def set_ac(quc: float, qub: float, qua: float, qic: float, qib: float, qia: floa
     :param ib: B相电流
     :param ia: A相电流
     :param f: 频率
-    :return:
-    """
-    set_cmd = [0x81, 0x01, 0x25, 0x49, 0xa3, 0x05, 0x46, 0x3f]
-
-    #  value = int(f * 10000)
-    #  pdu = list(value.to_bytes(4, 'little'))
-    # 放大10000倍，浮点转整数，整数转8位16进制，补0到8位
-    pdu = str(hex(int(quc * 10000))).replace('0x', '').zfill(8)
-    # 大端序改为小端序，可使用value.to_bytes(4, 'little') ？
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)).replace('0x', '').zfill(8)
-    # 将8位16进制转化为4个10进制数字列表
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-
-    pdu = str(hex(int(qub * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)).replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(qua * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)).replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(qic * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)).replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(qib * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)).replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(qia * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)).replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    set_cmd.append(0xFF)
-
-    pdu = str(hex(int(uc * 10000))).replace('0x', '').zfill(8)  # 电压幅值转化为16进制
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)) + 'fc'  # 转为小端序
-    pdu = pdu.replace('0x', '').zfill(10)  # 去掉0x，补足10位
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]  # 转化为5个数的列表
-    set_cmd += pdu
-    pdu = str(hex(int(ub * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)) + 'fc'
-    pdu = pdu.replace('0x', '').zfill(10)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(ua * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)) + 'fc'
-    pdu = pdu.replace('0x', '').zfill(10)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]
-    set_cmd += pdu
-
-    pdu = str(hex(int(ic * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)) + 'fc'
-    pdu = pdu.replace('0x', '').zfill(10)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]  # 转化为5个数的列表
-    set_cmd += pdu
-    pdu = str(hex(int(ib * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)) + 'fc'
-    pdu = pdu.replace('0x', '').zfill(10)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(ia * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)) + 'fc'
-    pdu = pdu.replace('0x', '').zfill(10)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(f * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16))
-    pdu = pdu.replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    set_cmd += [0x07, 0x07, 0x3F, 0x3F, 0x00]
-    xor = xor_sum(set_cmd[1:])
-    set_cmd.append(int(hex(xor).replace('0x', ''), 16))  # 添加校验码
-    pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    source_control.close()
-    time.sleep(5)
-    return ret
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
+    :param settle_timeout: 等待交流表读回的幅值、频率稳定到设定值的最长时间（秒），为空时不等待
+    :param accuracy: 读回值与设定值之差的上限，为空时使用默认精度
+    :return: 不等待时返回send的结果 (发送字节数, 返回帧)；等待时返回SettleResult（读回值、稳定耗时），
+             超时未稳定时抛出SettleTimeoutError，异常的settle属性为最后的读回结果
+    """
+    pdu = cl3021_codec.encode_ac(quc, qub, qua, qic, qib, qia, uc, ub, ua, ic, ib, ia, f)
+    source_control = source or default_source()
+    ret = source_control.send(pdu)
+    if not settle_timeout:
+        return ret
+    settle = settle_ac({'uc': uc, 'ub': ub, 'ua': ua, 'ic': ic, 'ib': ib, 'ia': ia, 'f': f}, accuracy,
+                       settle_timeout, source_control)
+    return check_settled(settle, "交流源输出")
 
 
-def set_gear_switching_mode(mode: str = '00000000'):
+def set_gear_switching_mode(mode: str = '00000000', source=None):
     """
     设置档位切换模式
     :param mode:
@@ -367,6 +517,7 @@ def set_gear_switching_mode(mode: str = '00000000'):
             BIT3=1,Ic 更新档位
             BIT4=1,Ib 更新档位
             BIT5=1,Ia 更新档位
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     try:
@@ -377,71 +528,39 @@ def set_gear_switching_mode(mode: str = '00000000'):
     xor = xor_sum(set_cmd[1:-1])
     set_cmd.append(int(xor))
     pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    ret = source_control.send(pdu)
     return ret
 
 
-def set_harmonic_content(harmonic_content: list):
+def set_harmonic_content(harmonic_content: list, source=None):
     """
     设置谐波含量
     :param harmonic_content:长度限制为21,每一个元素为谐波百分比值
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
-    if len(harmonic_content) != 21:
-        raise '谐波次数最大为21次，请确保为21个谐波'
-    set_cmd = [0x81, 0x01, 0x07, 0x74, 0xa6, 0x05, 0x02, 0x00, 0x00, 0x69]
-    for index, element in enumerate(harmonic_content):
-        if index == 0:
-            pdu = str(hex(int(element))).replace('0x', '').zfill(8)
-            pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)) + '00'
-            pdu = pdu.replace('0x', '').zfill(10)
-            pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]
-            set_cmd += pdu
-            continue
-        pdu = str(hex(int(element))).replace('0x', '').zfill(8)
-        pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)) + 'fe'
-        pdu = pdu.replace('0x', '').zfill(10)
-        pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]
-        set_cmd += pdu
-
-    xor = xor_sum(set_cmd[1:-1])
-    set_cmd.append(int(xor))
-    pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    source_control.close()
+    pdu = cl3021_codec.encode_harmonic_content(harmonic_content)
+    source_control = source or default_source()
+    ret = source_control.send(pdu)
     return ret
 
 
-def set_harmonic_phase(harmonic_phase: list):
+def set_harmonic_phase(harmonic_phase: list, source=None):
     """
     设置谐波相位
     :param harmonic_phase:
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
-    if len(harmonic_phase) != 21:
-        raise '谐波次数最大为21次，请确保为21个谐波'
-    set_cmd = [0x81, 0x01, 0x07, 0x5f, 0xa6, 0x05, 0x0a, 0x00, 0x00, 0x54]
-    for index, element in enumerate(harmonic_phase):
-        pdu = str(hex(int(element * 10000))).replace('0x', '').zfill(8)
-        pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16))
-        pdu = pdu.replace('0x', '').zfill(10)
-        pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]
-        set_cmd += pdu
-        print(set_cmd)
-
-    xor = xor_sum(set_cmd[1:-1])
-    set_cmd.append(int(xor))
-    pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    source_control.close()
+    pdu = cl3021_codec.encode_harmonic_phase(harmonic_phase)
+    source_control = source or default_source()
+    ret = source_control.send(pdu)
     return ret
 
 
-def set_harmonic_switch(uc_hc: str, ub_hc: str, ua_hc: str, ic_hc: str, ib_hc: str, ia_hc: str, total_switch: str):
+def set_harmonic_switch(uc_hc: str, ub_hc: str, ua_hc: str, ic_hc: str, ib_hc: str, ia_hc: str, total_switch: str,
+                        source=None):
     """
     设置谐波开关
     :param uc_hc:
@@ -467,50 +586,16 @@ def set_harmonic_switch(uc_hc: str, ub_hc: str, ua_hc: str, ic_hc: str, ib_hc: s
     :param ib_hc:
     :param ia_hc:
     :param total_switch:
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
-    set_cmd = [0x81, 0x01, 0x25, 0x22, 0xa3, 0x05, 0x20, 0x7f]
-    pdu = str(hex(int(bin_to_hex(uc_hc)))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16))
-    pdu = pdu.replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(bin_to_hex(ub_hc)))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16))
-    pdu = pdu.replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(bin_to_hex(ua_hc)))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16))
-    pdu = pdu.replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(bin_to_hex(ic_hc)))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16))
-    pdu = pdu.replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(bin_to_hex(ib_hc)))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16))
-    pdu = pdu.replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    pdu = str(hex(int(bin_to_hex(ia_hc)))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16))
-    pdu = pdu.replace('0x', '').zfill(8)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16)]
-    set_cmd += pdu
-    set_cmd.append(int(bin_to_hex(total_switch), 16))
-    xor = xor_sum(set_cmd[1:-1])
-    set_cmd.append(int(xor))
-    pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    source_control.close()
+    pdu = cl3021_codec.encode_harmonic_switch(uc_hc, ub_hc, ua_hc, ic_hc, ib_hc, ia_hc, total_switch)
+    source_control = source or default_source()
+    ret = source_control.send(pdu)
     return ret
 
 
-def clear_overload_lock(overload_flag: str):
+def clear_overload_lock(overload_flag: str, source=None):
     """
     清除过载锁定
     :param overload_flag:
@@ -521,6 +606,7 @@ def clear_overload_lock(overload_flag: str):
             BIT4=0,清除 IB
             BIT5=0,清除 IA
             其他 BIT 无效忽略
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     try:
@@ -531,102 +617,97 @@ def clear_overload_lock(overload_flag: str):
     xor = xor_sum(set_cmd[1:-1])
     set_cmd.append(int(xor))
     pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    ret = source_control.send(pdu)
     return ret
 
 
-def switch_device_screen_interface(inter: int):
+def switch_device_screen_interface(inter: int, source=None):
     """
     切换设备屏幕界面
     :param inter: 0x00  ARM版显示主界面;0x01  交流表界面;0x02  直流表界面;0x03 电能表误差检定界面
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     set_cmd = [0x81, 0x01, 0x25, 0x0a, 0xa3, 0x00, 0x10, 0x80, inter]
     xor = xor_sum(set_cmd[1:])
     set_cmd.append(int(xor))
     pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    source_control.send(pdu)
 
 
-def change__underly_communicate(port):
+def change__underly_communicate(port, source=None):
     """
     切换底层通讯端口
     :param port:0-交流源;1-交流表;2-直流源;3-其他串口0;4-其他串口1
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     set_cmd = [0x81, 0x01, 0x25, 0x0a, 0xa3, 0x00, 0x10, 0x80, port]
     xor = xor_sum(set_cmd[1:-1])
     set_cmd.append(int(xor))
     pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    source_control.send(pdu)
 
 
-def phase_amplitude_update():
+def phase_amplitude_update(source=None):
     """
     相位更新 幅值更新
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     set_cmd = [0x81, 0x01, 0x25, 0x29, 0xa3, 0x05, 0x44, 0x3f, 0xe8, 0xcd, 0x08, 0x00, 0xfc, 0xe8, 0xcd, 0x08, 0x00,
                0xfc, 0xe8, 0xcd, 0x08, 0x00, 0xfc, 0x40, 0x4b, 0x4c, 0x00, 0xfa, 0x40, 0x4b, 0x4c, 0x00, 0xfa, 0x40,
                0x4b, 0x4c, 0x00, 0xfa, 0x02, 0x3f, 0x81]
     pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    source_control.send(pdu)
 
 
-def frequency_renewal():
+def frequency_renewal(source=None):
     """
     频率更新
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     set_cmd = [0x81, 0x01, 0x25, 0x0e, 0xa3, 0x05, 0x04, 0xc0, 0x20, 0xa1, 0x07, 0x00, 0x07, 0xc9]
     pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    source_control.send(pdu)
 
 
-def harmonic_settings_and_switches():
+def harmonic_settings_and_switches(source=None):
     """
     谐波设置和谐波开关
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     set_cmd = [0x81, 0x01, 0x25, 0x23, 0xa3, 0x05, 0x42, 0x3f, 0x80, 0x4f, 0x12, 0x00, 0x00, 0x9f, 0x24, 0x00, 0x00,
                0x00, 0x00, 0x00, 0x80, 0x4f, 0x12, 0x00, 0x00, 0x9f, 0x24, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01, 0x3f,
                0xe2]
     pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    source_control.send(pdu)
 
 
-def read_ac():
+def read_ac(source=None):
     """
-    读取交流参数
-    :return:
+    读取交流测量值：幅值、频率、相位、功率因数、功率
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
+    :return: {字段名: 值}，字段见 cl3021_codec.AC_FIELDS
     """
-    set_cmd = [0x81, 0x01, 0x25, 0x0d, 0xa0, 0x02, 0x3d, 0xff, 0x3f, 0xff, 0xff, 0x0f]
-    xor = xor_sum(set_cmd[1:])
-    set_cmd.append(int(xor))
-    pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    print(ret)
-    print(ret[1][0].hex())
-    source_control.close()
+    source_control = source or default_source()
+    ret = source_control.send(cl3021_codec.encode_read_ac())
+    return dict(zip(cl3021_codec.AC_FIELDS, cl3021_codec.parse_ac(ret[1][0])))
 
 
-def voltage_gear_update(gear):
+def voltage_gear_update(gear, source=None):
     """
     更新电压档位
     :param gear: 值 0：600V 档位，值 1：480V 档位，值 2：240V 档位，值 3：120V 档位，值 4：60V 档位，值 5：30V 档位，
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     # gear=hex(gear)
@@ -635,12 +716,11 @@ def voltage_gear_update(gear):
     xor = xor_sum(set_cmd[1:])
     set_cmd.append(int(xor))
     pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    ret = source_control.send(pdu)
 
 
-def current_gear_update(gear):
+def current_gear_update(gear, source=None):
     """
      更新电流档位
     :param gear:
@@ -657,6 +737,7 @@ def current_gear_update(gear):
     10：0.05A 档位，
     11：0.02A 档位，
     12：0.01A 档位，
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     # gear=hex(gear)
@@ -665,91 +746,86 @@ def current_gear_update(gear):
     xor = xor_sum(set_cmd[1:])
     set_cmd.append(int(xor))
     pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    ret = source_control.send(pdu)
 
 
-def set_current_gear(gear):
+def set_current_gear(gear, source=None):
     """
     根据电流值自动选择合适档位
     :param gear:
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     if gear <= 0.01:
-        current_gear_update(12)
+        current_gear_update(12, source)
     elif 0.01 < gear <= 0.02:
-        current_gear_update(11)
+        current_gear_update(11, source)
     elif 0.02 < gear <= 0.05:
-        current_gear_update(10)
+        current_gear_update(10, source)
     elif 0.05 < gear <= 0.1:
-        current_gear_update(9)
+        current_gear_update(9, source)
     elif 0.1 < gear <= 0.2:
-        current_gear_update(8)
+        current_gear_update(8, source)
     elif 0.2 < gear <= 0.5:
-        current_gear_update(7)
+        current_gear_update(7, source)
     elif 0.5 < gear <= 1:
-        current_gear_update(6)
+        current_gear_update(6, source)
     elif 1 < gear <= 2:
-        current_gear_update(5)
+        current_gear_update(5, source)
     elif 2 < gear <= 5:
-        current_gear_update(4)
+        current_gear_update(4, source)
     elif 5 < gear <= 10:
-        current_gear_update(3)
+        current_gear_update(3, source)
     elif 10 < gear <= 20:
-        current_gear_update(2)
+        current_gear_update(2, source)
     elif 20 < gear <= 50:
-        current_gear_update(1)
+        current_gear_update(1, source)
     else:
-        current_gear_update(0)
+        current_gear_update(0, source)
 
 
-def set_voltage_gear(gear):
+def set_voltage_gear(gear, source=None):
     """
     根据电压值自动选择合适档位
     :param gear:
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
 
     if gear <= 30:
-        voltage_gear_update(5)
+        voltage_gear_update(5, source)
     elif 30 < gear <= 60:
-        voltage_gear_update(4)
+        voltage_gear_update(4, source)
     elif 60 < gear <= 120:
-        voltage_gear_update(3)
+        voltage_gear_update(3, source)
     elif 120 < gear <= 240:
-        voltage_gear_update(2)
+        voltage_gear_update(2, source)
     elif 240 < gear <= 480:
-        voltage_gear_update(1)
+        voltage_gear_update(1, source)
     else:
-        voltage_gear_update(0)
+        voltage_gear_update(0, source)
 
 
-def set_dc(u: float, i: float):
+def set_dc(u: float, i: float, source=None, settle_timeout=None, accuracy=None):
     """
     设置直流源输出
     :param u: 单位V
     :param i: 单位mA
-    :return:
-    """
-    set_cmd = [0x81, 0x01, 0x26, 0x11, 0x31, 0x03]
-    pdu = str(hex(int(u * 10000))).replace('0x', '').zfill(8)  # 电压幅值转化为16进制
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)) + 'fc'  # 转为小端序
-    pdu = pdu.replace('0x', '').zfill(10)  # 去掉0x，补足10位
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]  # 转化为5个数的列表
-    set_cmd += pdu
-    i = i/1000
-    pdu = str(hex(int(i * 10000))).replace('0x', '').zfill(8)
-    pdu = hex(int(pdu[6:8] + pdu[4:6] + pdu[2:4] + pdu[0:2], 16)) + 'fc'
-    pdu = pdu.replace('0x', '').zfill(10)
-    pdu = [int(pdu[0:2], 16), int(pdu[2:4], 16), int(pdu[4:6], 16), int(pdu[6:8], 16), int(pdu[8:10], 16)]
-    set_cmd += pdu
-    xor = xor_sum(set_cmd[1:])
-    set_cmd.append(int(hex(xor).replace('0x', ''), 16))  # 添加校验码
-    pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    source_control.close()
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
+    :param settle_timeout: 等待直流表读回稳定到设定值的最长时间（秒），为空时不等待
+    :param accuracy: 读回值与设定值之差的上限，为空时使用默认精度
+    :return: SettleResult，不等待时为None；超时未稳定时抛出SettleTimeoutError
+    """
+    pdu = cl3021_codec.encode_dc(u, i)
+    source_control = source or default_source()
+    source_control.send(pdu)
+    if not settle_timeout:
+        return None
+    # 只判定输出的量（电流输出时电压为负载电压，不是设定值），都为0时两者都判定
+    settle = settle_dc(u if u or not i else None, i / 1000 if i or not u else None, accuracy, settle_timeout,
+                       source_control)
+    return check_settled(settle, "直流源输出")
 
 
 def bytes_to_float(hex_list, scale=1e6):
@@ -757,25 +833,37 @@ def bytes_to_float(hex_list, scale=1e6):
     return integer_value/scale
 
 
-def read_dc(u_or_ma=3):
+def read_dc(u_or_ma=3, source=None):
     """
     读取直流测量值
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
-    set_cmd = [0x81, 0x01, 0x26, 0x06, 0xA3]
-    xor = xor_sum(set_cmd[1:])
-    set_cmd.append(int(xor))
-    pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=True)
-    source_control.close()
-    # 分析返回值
-    byte_data = ret[1][0]
-    # 字节转16进制整数列表
-    measurement_data = list(byte_data)
-    # [129, 38, 1, 32, 83, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 254, 255, 255, 255, 250, 191, 255, 255, 255, 250, 0, 0, 0, 0, 0, 21]
-    u_data = bytes_to_float(measurement_data[16:20])
-    i_data = bytes_to_float(measurement_data[21:25])
+    source_control = source or default_source()
+    ret = source_control.send(cl3021_codec.encode_read_dc())
+    return parse_dc_response(ret[1][0], u_or_ma)
+
+
+async def async_read_dc(source_control: AsyncCl3021SourCon, u_or_ma=3):
+    """
+    读取直流测量值（异步），可与异步Modbus读取并发执行
+    :param source_control: AsyncCl3021SourCon 实例
+    :param u_or_ma: 0：电压，1：电流，其他：(电压, 电流)
+    :return:
+    """
+    ret = await source_control.send(cl3021_codec.encode_read_dc(), wait_response=True)
+    return parse_dc_response(ret[1][0], u_or_ma)
+
+
+def parse_dc_response(byte_data, u_or_ma=3):
+    """
+    解析直流测量值的返回报文
+    :param byte_data: 返回报文
+    :param u_or_ma: 0：电压，1：电流，其他：(电压, 电流)
+    :return:
+    """
+    # 电压、电流均为 4字节有符号整数（小端序） + 指数字节
+    u_data, i_data = cl3021_codec.parse_dc(byte_data)
     if u_or_ma == 0:
         return u_data
     elif u_or_ma == 1:
@@ -784,12 +872,63 @@ def read_dc(u_or_ma=3):
         return u_data, i_data
 
 
-def set_dc_read_mode():
+def _safe_read(read):
+    """读取失败时返回None，由稳定判定继续轮询"""
+    def wrapper():
+        try:
+            return read()
+        except (cl3021_transport.Cl3021TransportError, cl3021_codec.Cl3021CodecError) as e:
+            logging.warning(f"CL3021读回失败：{e}")
+            return None
+    return wrapper
+
+
+def settle_dc(u=None, i=None, accuracy=None, timeout=10.0, source=None):
+    """
+    轮询直流表，直到读回值在设定值的精度以内并保持稳定
+    :param u: 电压目标值（V），为空时不判定电压
+    :param i: 电流目标值（A，与直流表读回的单位相同），为空时不判定电流
+    :param accuracy: 读回值与目标值之差的上限（单值或与判定的量对齐的列表），为空时使用默认精度
+    :param timeout: 最长等待时间（秒）
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
+    :return: SettleResult，elapsed为稳定耗时
+    """
+    source_control = source or default_source()
+    keys = [key for key, value in (('u', u), ('i', i)) if value is not None]
+    target = [u if key == 'u' else i for key in keys]
+
+    def read():
+        readings = dict(zip(cl3021_codec.DC_FIELDS, read_dc(3, source_control)))
+        return [readings[key] for key in keys]
+    return wait_for_output(_safe_read(read), target, accuracy, timeout, [DC_ACCURACY_FLOOR[key] for key in keys])
+
+
+def settle_ac(target, accuracy=None, timeout=10.0, source=None):
+    """
+    轮询交流表，直到读回值在设定值的精度以内并保持稳定
+    :param target: {字段名: 目标值}，字段见 cl3021_codec.AC_FIELDS，如 {'ua': 220, 'ia': 5, 'f': 50}
+    :param accuracy: 读回值与目标值之差的上限（单值或与target对齐的列表），为空时使用默认精度
+    :param timeout: 最长等待时间（秒）
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
+    :return: SettleResult，elapsed为稳定耗时
+    """
+    source_control = source or default_source()
+    keys = list(target)
+
+    def read():
+        readings = read_ac(source_control)
+        return [readings[key] for key in keys]
+    floor = [AC_ACCURACY_FLOOR.get(key[0], SETTLE_MIN_ACCURACY) for key in keys]
+    return wait_for_output(_safe_read(read), [target[key] for key in keys], accuracy, timeout, floor)
+
+
+def set_dc_read_mode(source=None):
     """
     配置直流表测量模式
         0x00,同时测量电压和电流
         0x01,测量直流电压
         0x02,测量直流电流`
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
     set_cmd = [0x81, 0x01, 0x26, 0x07, 0x3C, 0x00]
@@ -797,51 +936,45 @@ def set_dc_read_mode():
     set_cmd.append(int(xor))
     print(set_cmd)
     pdu = bytearray(set_cmd)
-    source_control = Cl3021SourCon()
-    ret = source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control = source or default_source()
+    ret = source_control.send(pdu)
 
 
-def close_dc(gear):
+def close_dc(gear, source=None):
     """
     关闭输出，电流或电压
     :param gear: 1：电压，2：电流
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
     :return:
     """
-    source_control = Cl3021SourCon()
+    source_control = source or default_source()
     set_cmd = [0x81, 0x01, 0x26, 0x07, 0x38, gear]
     xor = xor_sum(set_cmd[1:])
     set_cmd.append(int(xor))
     pdu = bytearray(set_cmd)
-    source_control.send(pdu, wait_response=False)
-    source_control.close()
+    source_control.send(pdu)
 
 
-def close_dc_all():
+def close_dc_all(source=None, settle_timeout=2.0):
     """
-    关闭直流源输出
+    关闭直流源输出：清除过载、关闭电压和电流输出，直流表读回降到0后再切换设备内部通信。
+    每条命令都等待设备返回成功，不再固定间隔500ms
+    :param source: Cl3021SourCon 实例，为空时使用共享的默认会话
+    :param settle_timeout: 等待读回降到0的最长时间（秒），为0时不等待
+    :return: SettleResult，不等待时为None；读回超时未降到0时，关闭命令仍全部发送，之后抛出SettleTimeoutError
     """
-    source_control = Cl3021SourCon()
+    source_control = source or default_source()
     set_cmd_clear_overload = [0x81, 0x01, 0x26, 0x07, 0x39, 0x00, 0x19]
     set_cmd_u_close = [0x81, 0x01, 0x26, 0x07, 0x38, 0x01, 0x19]
     set_cmd_i_close = [0x81, 0x01, 0x26, 0x07, 0x38, 0x02, 0x19]
     set_cmd_1 = [0x81, 0x01, 0x25, 0x0a, 0xa3, 0x05, 0x01, 0x40, 0x00, 0xc9]
     set_cmd_2 = [0x81, 0x01, 0x25, 0x0a, 0xa3, 0x00, 0x10, 0x80, 0x00, 0x1d]
-    pdu = bytearray(set_cmd_clear_overload)
-    source_control.send(pdu, wait_response=False)
-    time.sleep(0.5)
-    pdu = bytearray(set_cmd_u_close)
-    source_control.send(pdu, wait_response=False)
-    time.sleep(0.5)
-    pdu = bytearray(set_cmd_i_close)
-    source_control.send(pdu, wait_response=False)
-    time.sleep(0.5)
-    pdu = bytearray(set_cmd_1)
-    source_control.send(pdu, wait_response=False)
-    time.sleep(0.5)
-    pdu = bytearray(set_cmd_2)
-    source_control.send(pdu, wait_response=False)
-    source_control.close()
+    for set_cmd in (set_cmd_clear_overload, set_cmd_u_close, set_cmd_i_close):
+        source_control.send(bytearray(set_cmd))
+    settle = settle_dc(0, 0, timeout=settle_timeout, source=source_control) if settle_timeout else None
+    for set_cmd in (set_cmd_1, set_cmd_2):
+        source_control.send(bytearray(set_cmd))
+    return check_settled(settle, "直流源关闭后输出")
 
 
 if __name__ == "__main__":
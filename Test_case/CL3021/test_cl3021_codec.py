@@ -0,0 +1,127 @@
+import struct
+import pytest
+from Source.CL3021 import cl3021_codec
+from Source.CL3021 import source_control
+from Common.settle import SettleResult
+
+# 由改为struct编码之前的 set_dc / set_ac / set_harmonic_* / set_wire 生成的报文
+GOLDEN_FRAMES = [
+    ('encode_dc', (0, 0), '81012611310300000000fc00000000fc04'),
+    ('encode_dc', (5, 0), '81012611310350c30000fc00000000fc97'),
+    ('encode_dc', (0, 12), '81012611310300000000fc78000000fc7c'),
+    ('encode_dc', (10.5, 20), '810126113103289a0100fcc8000000fc7f'),
+    ('encode_dc', (0.1234, 0.2), '810126113103d2040000fc02000000fcd0'),
+    ('encode_dc', (7.3, 4.0), '810126113103281d0100fc28000000fc18'),
+    ('encode_ac', (0, 240, 120, 0, 240, 120, 220, 220, 220, 5, 5, 5, 50),
+     '81012549a305463f00000000009f2400804f120000000000009f2400804f1200ffc0912100fcc0912100fcc0912100fc50c30000fc'
+     '50c30000fc50c30000fc20a1070007073f3f0028'),
+    ('encode_ac', (10.5, 250.25, 130, 30, 270, 150, 57.7, 57.7, 57.7, 1.5, 1.5, 1.5, 49.99),
+     '81012549a305463f289a0100642f260020d61300e0930400e032290060e31600ffe8cd0800fce8cd0800fce8cd0800fc983a0000fc'
+     '983a0000fc983a0000fcbca0070007073f3f00fb'),
+    ('encode_harmonic_content', ([100] + [0] * 20,),
+     '81010774a60502000069640000000000000000fe00000000fe00000000fe00000000fe00000000fe00000000fe00000000fe000000'
+     '00fe00000000fe00000000fe00000000fe00000000fe00000000fe00000000fe00000000fe00000000fe00000000fe00000000fe00'
+     '000000fe00000000fe20'),
+    ('encode_harmonic_content', ([100, 5, 10, 0, 3] + [1] * 16,),
+     '81010774a60502000069640000000005000000fe0a000000fe00000000fe03000000fe01000000fe01000000fe01000000fe010000'
+     '00fe01000000fe01000000fe01000000fe01000000fe01000000fe01000000fe01000000fe01000000fe01000000fe01000000fe01'
+     '000000fe01000000fe2c'),
+    ('encode_harmonic_phase', ([0] * 21,), '8101075fa6050a000054' + '00' * 105 + 'a4'),
+    ('encode_harmonic_phase', ([0, 30.5, 120, 0, 270] + [1.25] * 16,),
+     '8101075fa6050a00005400000000000068a7040000804f1200000000000000e032290000d430000000d430000000d430000000d430'
+     '000000d430000000d430000000d430000000d430000000d430000000d430000000d430000000d430000000d430000000d430000000'
+     'd430000000d430000049'),
+    ('encode_harmonic_switch', ('1', '101', '1', '1', '111', '1', '00111111'),
+     '81012522a305207f0100000005000000010000000100000007000000010000003ffd'),
+    ('encode_wire', ('00001000',), '8101250aa300012008a4'),
+]
+
+# 协议文档“读取AC幅值、相位、频率、功率”中的返回示例
+AC_RESPONSE_BODY = ('023dff' + 'e8df1c0dfa' * 3 + '904b4c00fa' * 3 + '20a10700' + '003f' + '804f1200' * 6 + 'ff' +
+                    '804f1200' * 3 + '10270000' * 4 + '00000000' + 'ff' +
+                    'bd7f8d06fb' 'e5668e06fb' '1c808e06fb' 'be66aa13fb' '97effffffb' 'f9fbfffffb' '0bf2fffffb' '9bddfffffb' + '0f' +
+                    'c07f8d06fb' 'd8668e06fb' '18808e06fb' 'c066aa13fb')
+
+
+class RecordingSource:
+    """代替Cl3021SourCon，只记录发送的报文"""
+
+    def __init__(self):
+        self.frames = []
+
+    def send(self, hex_data, wait_response=True):
+        self.frames.append(bytes(hex_data))
+        return len(hex_data), None
+
+
+class TestCl3021Codec:
+    @pytest.mark.parametrize("encoder, args, frame", GOLDEN_FRAMES)
+    def test_golden_frames(self, encoder, args, frame):
+        assert getattr(cl3021_codec, encoder)(*args).hex() == frame
+
+    @pytest.mark.parametrize("encoder, args, frame", GOLDEN_FRAMES)
+    def test_source_control_frames(self, encoder, args, frame):
+        source = RecordingSource()
+        getattr(source_control, encoder.replace('encode_', 'set_'))(*args, source=source)
+        assert source.frames[0].hex() == frame
+
+    def test_set_ac_returns_send_result(self):
+        # 默认不等待稳定，返回值与原先一样为send的结果
+        source = RecordingSource()
+        ac_args = next(args for encoder, args, frame in GOLDEN_FRAMES if encoder == 'encode_ac')
+        assert source_control.set_ac(*ac_args, source=source) == (len(source.frames[0]), None)
+        assert len(source.frames) == 1
+
+    def test_negative_dc(self):
+        frame = cl3021_codec.encode_dc(-1.5, -2)
+        assert struct.unpack_from('<ibib', frame, 6) == (-15000, -4, -20, -4)
+        assert frame[-1] == cl3021_codec.xor_checksum(frame[:-1])
+
+    def test_harmonic_switch_binary(self):
+        # 第5次谐波（bit4）
+        frame = cl3021_codec.encode_harmonic_switch('10000', '1', '1', '1', '1', '1', '1')
+        assert struct.unpack_from('<I', frame, 8)[0] == 16
+
+    def test_read_dc_frame(self):
+        assert cl3021_codec.encode_read_dc().hex() == '81012606a382'
+
+    def test_parse_dc(self):
+        response = bytearray(32)
+        response[4] = cl3021_codec.DC_RESPONSE_CMD
+        response[16:21] = struct.pack('<ib', 5000000, -6)
+        response[21:26] = struct.pack('<ib', -12000000, -6)
+        assert cl3021_codec.parse_dc(response) == (5.0, -12.0)
+        assert source_control.parse_dc_response(response, 0) == 5.0
+
+    def test_parse_dc_matches_old_parser(self):
+        response = bytearray(32)
+        response[16:21] = struct.pack('<Ib', 123456789, -6)
+        response[21:26] = struct.pack('<Ib', 20000, -6)
+        assert cl3021_codec.parse_dc(response) == (source_control.bytes_to_float(response[16:20]),
+                                                   source_control.bytes_to_float(response[21:25]))
+
+    def test_read_ac_frame(self):
+        assert cl3021_codec.encode_read_ac().hex() == '8101250da0023dff3fffff0f79'
+
+    def test_parse_ac(self):
+        response = bytearray([0x81, 0x25, 0x01, 0xa4, 0x50]) + bytes.fromhex(AC_RESPONSE_BODY)
+        response.append(cl3021_codec.xor_checksum(response))
+        values = dict(zip(cl3021_codec.AC_FIELDS, cl3021_codec.parse_ac(response)))
+        assert values['ua'] == 219.996136
+        assert values['ia'] == 5.00008
+        assert values['f'] == 50.0
+        assert values['qua'] == 120.0
+        assert values['cos'] == 1.0
+        assert values['pc'] == 1099.36573
+        assert values['qc'] == -0.04201
+        assert values['s'] == 3299.34528
+        assert cl3021_codec.parse_header(response) == (cl3021_codec.AC_HOST, cl3021_codec.AC_RESPONSE_CMD, True)
+
+    def test_close_dc_all_settle_timeout(self, monkeypatch):
+        source = RecordingSource()
+        monkeypatch.setattr(source_control, 'settle_dc', lambda *args, **kwargs: SettleResult([0.3, 0], False, 2.0, 40))
+        with pytest.raises(source_control.SettleTimeoutError) as error:
+            source_control.close_dc_all(source)
+        # 读回未降到0时关闭命令仍全部发送
+        assert len(source.frames) == 5
+        assert error.value.settle.value == [0.3, 0]
@@ -0,0 +1,171 @@
+import socket
+import struct
+import threading
+import time
+import pytest
+from Source.CL3021 import cl3021_codec
+from Source.CL3021.cl3021_transport import Cl3021Transport, Cl3021TimeoutError, Cl3021NakError, \
+    Cl3021TransportError
+
+
+def reply(host, cmd, data=b''):
+    frame = bytearray([cl3021_codec.FRAME_HEAD, host, cl3021_codec.DEVICE_ID, 6 + len(data), cmd]) + data
+    return cl3021_codec.finish_frame(frame)
+
+
+class FakeCl3021(threading.Thread):
+    """本地UDP模拟设备：读直流返回递增的电压值，可设置丢包、延迟返回和返回失败"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.bind(('127.0.0.1', 0))
+        self.udp_socket.settimeout(0.05)
+        self.addr = self.udp_socket.getsockname()
+        self.drop = 0
+        self.delay = 0
+        self.nak = False
+        self.received = []
+        self.value = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try:
+                data, addr = self.udp_socket.recvfrom(1024)
+            except socket.timeout:
+                continue
+            self.received.append(data)
+            if self.drop:
+                self.drop -= 1
+                continue
+            host, cmd = data[2], data[4]
+            if self.nak:
+                response = reply(host, cl3021_codec.ACK_FAIL)
+            elif (host, cmd) == (cl3021_codec.DC_HOST, cl3021_codec.READ_DC_CMD):
+                self.value += 1
+                body = bytes(11) + struct.pack('<ib', self.value, 0) + struct.pack('<ib', 0, 0) + bytes(5)
+                response = reply(host, cl3021_codec.DC_RESPONSE_CMD, body)
+            else:
+                response = reply(host, cl3021_codec.ACK_OK)
+            if self.delay:
+                threading.Timer(self.delay, self.udp_socket.sendto, (response, addr)).start()
+            else:
+                self.udp_socket.sendto(response, addr)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.udp_socket.close()
+
+
+class ResetOnceSocket:
+    """第一次接收时抛出ConnectionResetError（Windows下端口不可达时的行为）"""
+
+    def __init__(self, udp_socket):
+        self.udp_socket = udp_socket
+        self.reset = True
+
+    def recvfrom(self, size):
+        if self.reset:
+            self.reset = False
+            raise ConnectionResetError(10054, 'connection reset')
+        return self.udp_socket.recvfrom(size)
+
+    def __getattr__(self, name):
+        return getattr(self.udp_socket, name)
+
+
+@pytest.fixture()
+def device():
+    fake = FakeCl3021()
+    fake.start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture()
+def transport(device):
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.bind(('127.0.0.1', 0))
+    client = Cl3021Transport(udp_socket, device.addr, retries=0)
+    yield client
+    client.close()
+    udp_socket.close()
+
+
+def read_value(transport, timeout=0.2, retries=None):
+    frame = cl3021_codec.encode_read_dc()
+    response = transport.wait(transport.request(frame, timeout, retries), frame, timeout, retries)
+    return cl3021_codec.parse_dc(response[0])[0]
+
+
+class TestCl3021Transport:
+    def test_reply_matched(self, transport, device):
+        assert read_value(transport) == 1
+        ack = transport.wait(transport.request(cl3021_codec.encode_dc(1, 0)), cl3021_codec.encode_dc(1, 0))
+        assert ack[0][4] == cl3021_codec.ACK_OK
+
+    def test_lost_datagram_retried(self, transport, device):
+        device.drop = 1
+        assert read_value(transport, retries=2) == 1
+        assert len(device.received) == 2
+
+    def test_timeout_after_retries(self, transport, device):
+        device.drop = 3
+        with pytest.raises(Cl3021TimeoutError):
+            read_value(transport, timeout=0.1, retries=2)
+        assert len(device.received) == 3
+
+    def test_no_cascade_after_loss(self, transport, device):
+        device.drop = 1
+        with pytest.raises(Cl3021TimeoutError):
+            read_value(transport, timeout=0.1)
+        # 丢包后的请求都能正常收到返回，不会被当作迟到返回丢弃
+        assert [read_value(transport, timeout=0.1) for _ in range(5)] == [1, 2, 3, 4, 5]
+
+    def test_late_reply_dropped(self, transport, device):
+        device.delay = 0.3
+        with pytest.raises(Cl3021TimeoutError):
+            read_value(transport, timeout=0.1)
+        # 迟到的返回在没有等待中的请求时丢弃，不进入unsolicited，也不影响之后的请求
+        time.sleep(0.4)
+        device.delay = 0
+        assert transport.unsolicited.empty()
+        assert read_value(transport) == 2
+
+    def test_nak(self, transport, device):
+        device.nak = True
+        frame = cl3021_codec.encode_dc(1, 0)
+        with pytest.raises(Cl3021NakError):
+            transport.wait(transport.request(frame), frame)
+
+    def test_callback(self, transport, device):
+        done = threading.Event()
+        results = []
+
+        def callback(future):
+            results.append(cl3021_codec.parse_dc(future.result()[0])[0])
+            done.set()
+        transport.request(cl3021_codec.encode_read_dc(), callback=callback)
+        assert done.wait(1)
+        assert results == [1]
+
+    def test_close_fails_pending(self, transport, device):
+        device.drop = 1
+        future = transport.request(cl3021_codec.encode_read_dc(), timeout=5)
+        transport.close()
+        assert isinstance(future.exception(1), Cl3021TransportError)
+        with pytest.raises(Cl3021TransportError):
+            transport.request(cl3021_codec.encode_read_dc())
+
+    def test_connection_reset_keeps_receiving(self, device):
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_socket.bind(('127.0.0.1', 0))
+        client = Cl3021Transport(ResetOnceSocket(udp_socket), device.addr, retries=0)
+        try:
+            time.sleep(0.1)
+            assert read_value(client) == 1
+        finally:
+            client.close()
+            udp_socket.close()
@@ -42,8 +42,7 @@ class TestAi:
     #         logging.info(f"{voltage[t]}V测试结束=====================================================================")
     #     close_dc_all()
 
-    def test_single_ai_current(self):
-        modbus_client = ModbusRtuOrTcp()
+    def test_single_ai_current(self, modbus_client):
         register = modbus_client.read_measurement(address=0x3000, count=1, slave=1)
         print(register)
 
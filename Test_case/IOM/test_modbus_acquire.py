@@ -0,0 +1,55 @@
+import struct
+import threading
+import pytest
+from Config.IOM import modbus_acquire
+from Config.IOM.modbus_acquire import AiAcquisition
+from Config.IOM.modbus_get_attr import decode_float_registers
+
+
+def float_registers(values):
+    registers = []
+    for value in values:
+        registers.extend(struct.unpack('>HH', struct.pack('>f', value)))
+    return registers
+
+
+class FakeModbusClient:
+    """代替ModbusRtuOrTcp：依次返回预先准备的寄存器，读完后停止采集"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.done = threading.Event()
+
+    def read_measurement(self, address, count, slave):
+        if not self.responses:
+            self.done.set()
+            return "resp is error"
+        return self.responses.pop(0)
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+class TestAiAcquisition:
+    def test_samples_decoded(self, monkeypatch, use_numpy):
+        if not use_numpy:
+            monkeypatch.setattr(modbus_acquire, 'np', None)
+        samples = [[n + channel / 10 for channel in range(16)] for n in range(5)]
+        responses = [float_registers(sample) for sample in samples]
+        client = FakeModbusClient(responses + ["resp is error"])
+        acquisition = AiAcquisition(client, rate_hz=1000, capacity=10)
+        with acquisition:
+            assert client.done.wait(5)
+        timestamps, values = acquisition.snapshot()
+        # 每条记录是各自样本的值，复用的解码缓冲区不会影响已写入的记录
+        assert [list(row) for row in values] == [
+            decode_float_registers(registers, as_list=True) for registers in responses]
+        assert acquisition.errors >= 2
+
+    def test_decode_reuses_buffer(self, monkeypatch, use_numpy):
+        if not use_numpy:
+            monkeypatch.setattr(modbus_acquire, 'np', None)
+        acquisition = AiAcquisition(FakeModbusClient([]), channels=2)
+        scratch = acquisition._words
+        first = list(acquisition._decode(float_registers([1.5, -2.0])))
+        second = list(acquisition._decode(float_registers([0.0, 3.25])))
+        assert first == [1.5, -2.0] and second == [0.0, 3.25]
+        assert acquisition._words is scratch
@@ -0,0 +1,109 @@
+import threading
+import concurrent.futures
+import pytest
+from Config.IOM.modbus_async import AsyncLoopRunner, SyncModbusFacade
+
+
+class FakeAsyncClient:
+    """代替AsyncModbusRtuOrTcp，记录协程在哪个线程上执行"""
+
+    def __init__(self):
+        self.endpoint = 'fake'
+        self.connected = False
+        self.closed_in = None
+        self.threads = []
+        self.registers = {}
+
+    async def connect(self):
+        self.threads.append(threading.current_thread().name)
+        self.connected = True
+        return True
+
+    def is_healthy(self):
+        return self.connected
+
+    async def ensure_connected(self):
+        return self.connected
+
+    def close(self):
+        self.closed_in = threading.current_thread().name
+        self.connected = False
+
+    async def write_registers(self, address, values, slave):
+        self.threads.append(threading.current_thread().name)
+        for offset, value in enumerate(values):
+            self.registers[address + offset] = value
+        return len(values)
+
+    async def write_register(self, address, value, slave):
+        return await self.write_registers(address, [value], slave)
+
+    async def read_measurement(self, address, count, slave):
+        self.threads.append(threading.current_thread().name)
+        if slave == 0:
+            raise ConnectionError('slave 0 不响应')
+        return [self.registers.get(address + i, 0) for i in range(count)]
+
+    async def read_ranges(self, ranges, slave, max_gap=8):
+        return [await self.read_measurement(address, count, slave) for address, count in ranges]
+
+
+@pytest.fixture
+def runner():
+    runner = AsyncLoopRunner()
+    yield runner
+    if not runner.loop.is_closed():
+        runner.stop()
+
+
+class TestSyncModbusFacade:
+    def test_round_trip(self, runner):
+        # 同步调用 -> 后台事件循环线程执行 -> 返回结果
+        client = FakeAsyncClient()
+        facade = SyncModbusFacade(client, runner)
+        assert facade.is_healthy()
+        assert facade.write_registers(0x3000, [1, 2, 3], slave=1) == 3
+        assert facade.write_register(0x3003, 4, slave=1) == 1
+        assert facade.read_measurement(0x3000, 4, slave=1) == [1, 2, 3, 4]
+        assert facade.read_ranges([(0x3000, 2), (0x3002, 2)], slave=1) == [[1, 2], [3, 4]]
+        assert facade.ensure_connected()
+        assert set(client.threads) == {'modbus-async-loop'}
+        assert threading.current_thread().name != 'modbus-async-loop'
+
+    def test_exception_propagates(self, runner):
+        # 协程中的异常原样抛给同步调用方，事件循环继续可用
+        facade = SyncModbusFacade(FakeAsyncClient(), runner)
+        with pytest.raises(ConnectionError):
+            facade.read_measurement(0, 1, slave=0)
+        assert facade.read_measurement(0, 1, slave=1) == [0]
+
+    def test_timeout(self, runner):
+        # 超时后协程被取消，不会一直占用端点的锁
+        cancelled = threading.Event()
+
+        async def never():
+            try:
+                await runner.loop.create_future()
+            except BaseException:
+                cancelled.set()
+                raise
+        with pytest.raises(concurrent.futures.TimeoutError):
+            runner.run(never(), timeout=0.05)
+        assert cancelled.wait(1)
+
+    def test_gather_returns_exceptions(self, runner):
+        client = FakeAsyncClient()
+        results = runner.gather(client.read_measurement(0, 2, slave=1), client.read_measurement(0, 2, slave=0))
+        assert results[0] == [0, 0]
+        assert isinstance(results[1], ConnectionError)
+
+    def test_shutdown(self, runner):
+        # close在事件循环线程上关闭客户端，stop后线程退出、事件循环关闭
+        client = FakeAsyncClient()
+        facade = SyncModbusFacade(client, runner)
+        facade.close()
+        runner.stop()
+        assert client.closed_in == 'modbus-async-loop'
+        assert not facade.is_healthy()
+        assert not runner._thread.is_alive()
+        assert runner.loop.is_closed()
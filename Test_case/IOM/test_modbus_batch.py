@@ -0,0 +1,197 @@
+import random
+import pytest
+from Config.IOM.modbus_batch import RegisterWriteBatch, verify_frames, plan_reads, split_reads, \
+    MAX_WRITE_REGISTERS, MAX_READ_REGISTERS
+from Config.IOM.modbus_schema import AI_PARAM, AO_PARAM, FIELD_CONTINUATIONS, field_end
+
+
+class FakeModbusClient:
+    """代替ModbusRtuOrTcp，寄存器保存在字典中，记录每次写入的帧"""
+
+    def __init__(self):
+        self.registers = {}
+        self.writes = []
+        self.fail_reads = set()
+
+    def write_registers(self, address, values, slave):
+        assert len(values) <= MAX_WRITE_REGISTERS
+        self.writes.append((address, list(values)))
+        for offset, value in enumerate(values):
+            self.registers[address + offset] = value
+        return 'ok'
+
+    def read_ranges(self, ranges, slave):
+        return [None if address in self.fail_reads else [self.registers.get(address + i, 0) for i in range(count)]
+                for address, count in ranges]
+
+
+def field_writes(seed, repeats=2):
+    """逐字段写入序列（原先每个字段一帧的写法），同一字段会被写入多次，后写入的值生效"""
+    rng = random.Random(seed)
+    writes = []
+    for _ in range(repeats):
+        for schema in (AI_PARAM, AO_PARAM):
+            for channel in range(1, schema.count + 1):
+                for field in schema.fields:
+                    if field.kind == 'u16':
+                        value = rng.randrange(0, 0x10000)
+                    else:
+                        value = rng.randint(-2000000, 2000000) / 1000
+                    writes.append((schema.field_address(channel, field.name), schema.encode_field(field.name, value)))
+    rng.shuffle(writes)
+    return writes
+
+
+class TestRegisterWriteBatch:
+    def test_split_at_123(self):
+        # 不在已知块中的连续地址按123个寄存器切分
+        batch = RegisterWriteBatch().add(0x100, list(range(300)))
+        frames = batch.frames()
+        assert [(address, len(values)) for address, values in frames] == [(0x100, 123), (0x17b, 123), (0x1f6, 54)]
+        assert sum((values for _, values in frames), []) == list(range(300))
+
+    def test_split_at_field_start(self):
+        # 全部16个AI通道一次写入：123个寄存器处正好切开32位字段时回退到字段起始地址
+        batch = RegisterWriteBatch().add(AI_PARAM.base, AI_PARAM.encode_all([
+            {field.name: 0 for field in AI_PARAM.fields}] * AI_PARAM.count))
+        frames = batch.frames()
+        assert [(address, len(values)) for address, values in frames] == [(0x3000, 122), (0x307a, 123), (0x30f5, 107)]
+        for address, values in frames:
+            assert address not in FIELD_CONTINUATIONS
+            assert field_end(address + len(values)) == address + len(values)
+
+    @pytest.mark.parametrize("max_registers", [MAX_WRITE_REGISTERS, 40, 7])
+    def test_frames_never_split_fields(self, max_registers):
+        batch = RegisterWriteBatch(max_registers)
+        for address, values in field_writes(1, repeats=1):
+            batch.add(address, values)
+        for address, values in batch.frames():
+            assert len(values) <= max_registers
+            assert address not in FIELD_CONTINUATIONS
+            assert field_end(address + len(values)) == address + len(values)
+
+    def test_adjacent_writes_merge(self):
+        batch = RegisterWriteBatch().add(0x10, [1, 2]).add(0x12, [3]).add(0x20, [4])
+        assert batch.frames() == [(0x10, [1, 2, 3]), (0x20, [4])]
+
+    def test_overlapping_writes_last_wins(self):
+        batch = RegisterWriteBatch().add(0x10, [1, 2, 3, 4]).add(0x11, [20, 30])
+        assert batch.frames() == [(0x10, [1, 20, 30, 4])]
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_same_image_as_per_field_writes(self, seed):
+        # 合并后的帧写入的寄存器映像与逐字段写入完全一致
+        writes = field_writes(seed)
+        baseline = FakeModbusClient()
+        for address, values in writes:
+            baseline.write_registers(address, values, slave=1)
+        batched = FakeModbusClient()
+        batch = RegisterWriteBatch()
+        for address, values in writes:
+            batch.add(address, values)
+        results = batch.flush(batched, slave=1)
+        assert batched.registers == baseline.registers
+        # AI（352个寄存器）3帧 + AO（88个寄存器）1帧
+        assert len(batched.writes) == 4 < len(baseline.writes)
+        assert [response for _, _, response in results] == ['ok'] * 4
+        assert len(batch) == 0
+
+
+class TestVerifyFrames:
+    def test_verify_after_flush(self):
+        client = FakeModbusClient()
+        batch = RegisterWriteBatch()
+        for address, values in field_writes(7, repeats=1):
+            batch.add(address, values)
+        frames = batch.frames()
+        batch.flush(client)
+        assert verify_frames(client, frames) == []
+
+    def test_verify_reports_mismatch(self):
+        client = FakeModbusClient()
+        frames = RegisterWriteBatch().add(0x3000, [1, 2, 3]).add(0x3400, [4, 5]).frames()
+        for address, values in frames:
+            client.write_registers(address, values, slave=1)
+        client.registers[0x3401] = 9
+        assert verify_frames(client, frames) == [(0x3401, 5, 9)]
+
+    def test_verify_read_failure(self):
+        # 回读失败的块中所有寄存器都视为不一致
+        client = FakeModbusClient()
+        frames = RegisterWriteBatch().add(0x3000, [1, 2]).add(0x3400, [4]).frames()
+        for address, values in frames:
+            client.write_registers(address, values, slave=1)
+        client.fail_reads.add(0x3000)
+        assert verify_frames(client, frames) == [(0x3000, 1, None), (0x3001, 2, None)]
+
+
+def device_read(ranges, max_gap=10, failed=()):
+    """按plan_reads规划读取，模拟设备的寄存器值等于地址，failed中的块读取失败"""
+    blocks = plan_reads(ranges, max_gap=max_gap)
+    block_registers = [None if address in failed else list(range(address, address + count))
+                       for address, count in blocks]
+    return blocks, split_reads(ranges, blocks, block_registers)
+
+
+class TestPlanReads:
+    def test_exactly_125(self):
+        blocks, views = device_read([(0x100, MAX_READ_REGISTERS)])
+        assert blocks == [(0x100, 125)]
+        assert views == [list(range(0x100, 0x100 + 125))]
+
+    def test_over_125_split(self):
+        blocks, views = device_read([(0x100, 300)])
+        assert blocks == [(0x100, 125), (0x17d, 125), (0x1fa, 50)]
+        # 拆分到多个块的区间拼接回完整的寄存器列表
+        assert views == [list(range(0x100, 0x100 + 300))]
+
+    def test_gap_zero_merged(self):
+        blocks, views = device_read([(0x100, 10), (0x10a, 10)], max_gap=0)
+        assert blocks == [(0x100, 20)]
+        assert views == [list(range(0x100, 0x10a)), list(range(0x10a, 0x114))]
+
+    def test_gap_zero_max_gap_keeps_gaps(self):
+        blocks, _ = device_read([(0x100, 10), (0x10b, 10)], max_gap=0)
+        assert blocks == [(0x100, 10), (0x10b, 10)]
+
+    def test_max_gap_merge(self):
+        # 空隙等于max_gap时合并，多1个寄存器时分开读取
+        assert plan_reads([(0x100, 10), (0x114, 5)], max_gap=10) == [(0x100, 25)]
+        assert plan_reads([(0x100, 10), (0x115, 5)], max_gap=10) == [(0x100, 10), (0x115, 5)]
+
+    def test_merge_stops_at_125(self):
+        # 合并后超过单帧上限时，上一块装满，剩余部分另起一块
+        blocks, views = device_read([(0x100, 100), (0x168, 50)])
+        assert blocks == [(0x100, 125), (0x17d, 29)]
+        assert views == [list(range(0x100, 0x164)), list(range(0x168, 0x19a))]
+
+    def test_overlapping_and_unsorted(self):
+        ranges = [(0x120, 8), (0x100, 20), (0x110, 4), (0x100, 20), (0x118, 12)]
+        blocks, views = device_read(ranges)
+        assert blocks == [(0x100, 0x28)]
+        assert views == [list(range(address, address + count)) for address, count in ranges]
+
+    def test_failed_block(self):
+        # 只有涉及读取失败块的区间为None
+        ranges = [(0x100, 4), (0x200, 4), (0x1fe, 130)]
+        blocks, views = device_read(ranges, failed={0x27d})
+        assert blocks == [(0x100, 4), (0x1fe, 125), (0x27b, 5)]
+        blocks, views = device_read(ranges, failed={0x27b})
+        assert views == [list(range(0x100, 0x104)), list(range(0x200, 0x204)), None]
+
+    def test_schema_ranges(self):
+        # 16个AI通道（352个寄存器）按125切成3块
+        blocks, views = device_read(AI_PARAM.ranges())
+        assert blocks == [(0x3000, 125), (0x307d, 125), (0x30fa, 102)]
+        assert views == [list(range(address, address + count)) for address, count in AI_PARAM.ranges()]
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_random_ranges(self, seed):
+        rng = random.Random(seed)
+        ranges = [(rng.randrange(0, 600), rng.randrange(1, 200)) for _ in range(rng.randrange(1, 12))]
+        max_gap = rng.choice([0, 1, 10, 50])
+        blocks, views = device_read(ranges, max_gap=max_gap)
+        assert views == [list(range(address, address + count)) for address, count in ranges]
+        for (start, count), (next_start, _) in zip(blocks, blocks[1:]):
+            assert start + count <= next_start
+        assert all(0 < count <= MAX_READ_REGISTERS for _, count in blocks)
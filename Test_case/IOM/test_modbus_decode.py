@@ -0,0 +1,60 @@
+import math
+import random
+import struct
+import pytest
+from Config.IOM import modbus_get_attr
+from Config.IOM.modbus_get_attr import decode_float_registers, convert_energy_registers
+
+np = pytest.importorskip('numpy')
+
+
+def random_registers(seed, count=32):
+    """随机寄存器，包含全0、NaN、无穷大和非规格化数"""
+    rng = random.Random(seed)
+    registers = [rng.randrange(0x10000) for _ in range(count)]
+    specials = [(0, 0), (0x7fc0, 0), (0x7f80, 0x0001), (0xff80, 0), (0x0000, 0x0001), (0x8000, 0)]
+    for index, pair in zip(range(0, count, 2), specials):
+        registers[index:index + 2] = pair
+    return registers
+
+
+def same_floats(actual, expected):
+    return len(actual) == len(expected) and all(
+        (math.isnan(a) and math.isnan(e)) or a == e for a, e in zip(actual, expected))
+
+
+class TestDecodeFloatRegisters:
+    @pytest.mark.parametrize("dtype", ['float32', 'float64'])
+    @pytest.mark.parametrize("seed", range(5))
+    def test_numpy_and_fallback_agree(self, monkeypatch, dtype, seed):
+        registers = random_registers(seed)
+        numpy_values = decode_float_registers(registers, dtype)
+        assert numpy_values.dtype == np.dtype(dtype)
+        monkeypatch.setattr(modbus_get_attr, 'np', None)
+        fallback_values = decode_float_registers(registers, dtype)
+        # 无numpy时按dtype存放：float32为4字节，float64为8字节
+        assert fallback_values.itemsize == np.dtype(dtype).itemsize
+        assert same_floats(list(fallback_values), numpy_values.tolist())
+        assert same_floats(decode_float_registers(registers, dtype, as_list=True), numpy_values.tolist())
+
+    @pytest.mark.parametrize("dtype", ['float32', 'float64'])
+    def test_two_dimensional(self, monkeypatch, dtype):
+        rows = [random_registers(seed, 8) for seed in range(4)]
+        numpy_values = decode_float_registers(rows, dtype, as_list=True)
+        assert len(numpy_values) == 4 and len(numpy_values[0]) == 4
+        monkeypatch.setattr(modbus_get_attr, 'np', None)
+        fallback_values = decode_float_registers(rows, dtype, as_list=True)
+        assert all(same_floats(a, e) for a, e in zip(fallback_values, numpy_values))
+
+    def test_matches_convert_energy_registers(self):
+        registers = []
+        for value in [0.0, 1.5, -2.75, 3.0, 1e-3, -123456.5]:
+            registers.extend(struct.unpack('>HH', struct.pack('>f', value)))
+        expected = convert_energy_registers(registers)
+        assert decode_float_registers(registers, as_list=True) == expected
+        assert decode_float_registers(registers, 'float32').tolist() == expected
+
+    def test_fallback_rejects_unknown_dtype(self, monkeypatch):
+        monkeypatch.setattr(modbus_get_attr, 'np', None)
+        with pytest.raises(ValueError):
+            decode_float_registers([0, 0], 'float16')
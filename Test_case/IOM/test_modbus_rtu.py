@@ -0,0 +1,115 @@
+import random
+import struct
+import pytest
+from Config.IOM.modbus_connet import crc16_modbus, build_rtu_frame, rtu_transact, rtu_response_length, \
+    RtuFrameError, SerialRtu
+
+
+class FakeSerial:
+    """代替serial.Serial：按顺序返回预先准备的响应字节，数据不足时和超时一样返回已收到的部分"""
+
+    def __init__(self, response=b''):
+        self.buffer = bytearray(response)
+        self.written = []
+        self.reads = []
+        self.resets = 0
+
+    def reset_input_buffer(self):
+        self.resets += 1
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+    def read(self, size):
+        self.reads.append(size)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def with_crc(body):
+    crc = crc16_modbus(body)
+    return bytes(body) + bytes([crc & 0xFF, crc >> 8])
+
+
+def read_response(slave, values):
+    return with_crc(struct.pack(f'>BBB{len(values)}H', slave, 0x03, 2 * len(values), *values))
+
+
+class TestCrc16:
+    def test_known_frame(self):
+        # Modbus协议文档中的示例：读从站1的10个保持寄存器
+        assert build_rtu_frame(1, 0x03, 0x0000, 10).hex() == '01030000000ac5cd'
+
+    def test_against_crcmod(self):
+        crcmod_predefined = pytest.importorskip('crcmod.predefined')
+        crc_func = crcmod_predefined.mkCrcFun('modbus')
+        rng = random.Random(0)
+        for _ in range(500):
+            frame = bytes(rng.randrange(256) for _ in range(rng.randrange(0, 260)))
+            assert crc16_modbus(frame) == crc_func(frame)
+            assert crc16_modbus(memoryview(bytearray(frame))) == crc_func(frame)
+
+    def test_frame_with_crc_is_zero(self):
+        frame = build_rtu_frame(3, 0x10, 0x3000, 3, [1, 0xFFFF, 0x1234])
+        assert frame.hex().startswith('0310300000030600' + '01ffff1234')
+        assert crc16_modbus(frame) == 0
+
+
+class TestRtuTransact:
+    def test_read_response(self):
+        response = read_response(1, [0x1111, 0x2222, 0x3333])
+        ser = FakeSerial(response)
+        frame = build_rtu_frame(1, 0x03, 0x3000, 3)
+        assert rtu_transact(ser, frame, 0x03, 3) == response
+        # 先读5字节，再一次读完剩余部分
+        assert ser.reads == [5, rtu_response_length(0x03, 3) - 5]
+        assert ser.written == [bytes(frame)] and ser.resets == 1
+
+    def test_write_response(self):
+        response = with_crc(struct.pack('>BBHH', 2, 0x10, 0x3000, 3))
+        ser = FakeSerial(response)
+        assert rtu_transact(ser, build_rtu_frame(2, 0x10, 0x3000, 3, [1, 2, 3]), 0x10, 3) == response
+        assert ser.reads == [5, 3]
+
+    def test_exception_response(self):
+        # 异常响应只有5字节，不再等待剩余部分
+        ser = FakeSerial(with_crc(bytes([1, 0x83, 0x02])))
+        with pytest.raises(RtuFrameError, match='异常码2'):
+            rtu_transact(ser, build_rtu_frame(1, 0x03, 0x3000, 3), 0x03, 3)
+        assert ser.reads == [5]
+
+    def test_exception_response_bad_crc(self):
+        ser = FakeSerial(bytes([1, 0x83, 0x02, 0x00, 0x00]))
+        with pytest.raises(RtuFrameError, match='异常响应CRC错误'):
+            rtu_transact(ser, build_rtu_frame(1, 0x03, 0x3000, 3), 0x03, 3)
+
+    @pytest.mark.parametrize("received", [0, 1, 4])
+    def test_timeout(self, received):
+        ser = FakeSerial(read_response(1, [1, 2, 3])[:received])
+        with pytest.raises(RtuFrameError, match='超时'):
+            rtu_transact(ser, build_rtu_frame(1, 0x03, 0x3000, 3), 0x03, 3)
+        assert ser.reads == [5]
+
+    def test_short_read(self):
+        # 剩余部分未收全（超时）时报长度错误
+        ser = FakeSerial(read_response(1, [1, 2, 3])[:-1])
+        with pytest.raises(RtuFrameError, match='长度错误'):
+            rtu_transact(ser, build_rtu_frame(1, 0x03, 0x3000, 3), 0x03, 3)
+        assert ser.reads == [5, 6]
+
+    def test_bad_crc(self):
+        response = bytearray(read_response(1, [1, 2, 3]))
+        response[4] ^= 0x01
+        with pytest.raises(RtuFrameError, match='响应CRC错误'):
+            rtu_transact(FakeSerial(response), build_rtu_frame(1, 0x03, 0x3000, 3), 0x03, 3)
+
+    def test_wrong_slave(self):
+        with pytest.raises(RtuFrameError, match='不匹配'):
+            rtu_transact(FakeSerial(read_response(2, [1, 2, 3])), build_rtu_frame(1, 0x03, 0x3000, 3), 0x03, 3)
+
+    def test_serial_rtu_read(self):
+        rtu = SerialRtu.__new__(SerialRtu)
+        rtu.ser = FakeSerial(read_response(1, [0x1234, 0xABCD]))
+        assert rtu.read_holding_registers(0x3000, 2, slave=1) == (0x1234, 0xABCD)
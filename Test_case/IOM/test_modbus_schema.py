@@ -0,0 +1,82 @@
+import pytest
+from Config.IOM.modbus_schema import AI_PARAM, AO_PARAM, AI_UNIT, AO_UNIT, param_record
+from Config.IOM.modbus_set_attr import set_all_ai_param, set_all_ao_param, set_ai_param, set_all_unit
+
+# 改为寄存器schema之前 float_to_uint32t_4bytes / string_to_uint8t_4bytes 逐字段写入的结果
+TYPE_LINE = [2, 4]
+# 包含四舍五入（远离0）和32位有符号整数上下限的边界值
+PARAMETERS = [20.5, -20.5, 0, 0.0005, 4.0005, -0.0015, 20, 2147483.647, -2147483.648, 1234.5678]
+BASELINE_CHANNEL = [0x0002, 0x0000, 0x5014, 0xffff, 0xafec, 0x0004, 0x0000, 0x0000, 0x0000, 0x0fa0, 0x0000,
+                    0x4e20, 0x8000, 0x0000, 0x0000, 0x0001, 0xffff, 0xfffe, 0x7fff, 0xffff, 0x0012, 0xd688]
+BASELINE_UNITS = [
+    ('°C', [0xa1e3, 0x4300]),
+    ('mA', [0x6d41, 0x0000]),
+    ('V', [0x5600, 0x0000]),
+    ('℃', [0xa1e6, 0x0000]),
+    ('kPa/s', [0x6b50, 0x612f]),
+    ('', [0x0000, 0x0000]),
+    ('温度', [0xcec2, 0xb6c8]),
+    # GBK无法编码时写入0
+    ('😀', [0x0000, 0x0000]),
+]
+
+
+class FakeModbusClient:
+    """代替ModbusRtuOrTcp，寄存器保存在字典中"""
+
+    def __init__(self):
+        self.registers = {}
+
+    def write_registers(self, address, values, slave):
+        for offset, value in enumerate(values):
+            self.registers[address + offset] = value
+        return 'ok'
+
+
+def image(client, base, count):
+    return [client.registers.get(base + offset) for offset in range(count)]
+
+
+class TestSchemaBaseline:
+    def test_channel_encode(self):
+        assert AI_PARAM.stride == 22 and AO_PARAM.stride == 22
+        assert AI_PARAM.encode(param_record(TYPE_LINE, PARAMETERS)) == BASELINE_CHANNEL
+        assert AI_PARAM.decode(BASELINE_CHANNEL) == param_record(TYPE_LINE, [
+            20.5, -20.5, 0, 0.001, 4.0, -0.002, 20, 2147483.647, -2147483.648, 1234.568])
+
+    def test_all_ai_param(self):
+        # 16个AI口，地址间隔22
+        client = FakeModbusClient()
+        set_all_ai_param(TYPE_LINE, PARAMETERS, modbus_client=client)
+        assert AI_PARAM.count == 16
+        assert image(client, 0x3000, 22 * 16) == BASELINE_CHANNEL * 16
+        assert len(client.registers) == 22 * 16
+
+    def test_all_ao_param(self):
+        # 4个AO口，地址间隔22
+        client = FakeModbusClient()
+        set_all_ao_param(TYPE_LINE, PARAMETERS, modbus_client=client)
+        assert AO_PARAM.count == 4
+        assert image(client, 0x3400, 22 * 4) == BASELINE_CHANNEL * 4
+        assert len(client.registers) == 22 * 4
+
+    @pytest.mark.parametrize("ai_num", [1, 7, 16])
+    def test_single_ai_param(self, ai_num):
+        client = FakeModbusClient()
+        set_ai_param(ai_num, TYPE_LINE, PARAMETERS, modbus_client=client)
+        assert image(client, 0x3000 + 22 * (ai_num - 1), 22) == BASELINE_CHANNEL
+        assert len(client.registers) == 22
+
+    @pytest.mark.parametrize("unit, registers", BASELINE_UNITS)
+    def test_unit(self, unit, registers):
+        assert AI_UNIT.encode_field('unit', unit) == registers
+        client = FakeModbusClient()
+        set_all_unit(unit, modbus_client=client)
+        assert image(client, AI_UNIT.base, 2 * 16) == registers * 16
+        assert image(client, AO_UNIT.base, 2 * 4) == registers * 4
+
+    def test_out_of_range(self):
+        with pytest.raises(ValueError):
+            AI_PARAM.encode(param_record(TYPE_LINE, [2147483.648] + PARAMETERS[1:]))
+        with pytest.raises(ValueError):
+            AI_PARAM.encode(param_record(TYPE_LINE, [float('nan')] + PARAMETERS[1:]))
@@ -8,11 +8,19 @@ from typing import Dict, Union
 import logging
 from _pytest.fixtures import FixtureRequest
 from pymodbus.client import ModbusSerialClient
-from Config.IOM.modbus_connet import ModbusRtuOrTcp
-from Config.IOM.modbus_set_attr import set_all_ai_top_bot
-from Source.CL3021.source_control import close_dc_all
+from Common.modbus_config import modbus_config
+from Config.IOM.modbus_connet import ModbusRtuOrTcp, conn_manager
+from Config.IOM.modbus_snapshot import Snapshot, format_diff
+from Common.tolerance import compile_expected
+from Common.result_report import generate_report
+from Common.result_sink import close_default_sink
+from Source.CL3021.source_control import close_dc_all, default_source, close_default_source
+from Source.CL3021.cl3021_meter import Cl3021Meter
 
 data_file_path = r"C:\Users\ZihanGao\PycharmProjects\pythonProject\Datas\IOM"
+# iom_test默认的结果文件，以及会话结束时生成的汇总报告
+result_file_path = "ai_i_measurements.xlsx"
+report_file_path = "ai_report.xlsx"
 
 # @pytest.fixture(scope="session", autouse=True)
 # def first_step():
@@ -21,13 +29,11 @@ data_file_path = r"C:\Users\ZihanGao\PycharmProjects\pythonProject\Datas\IOM"
 
 
 # ================= Modbus Client Fixture ================= #
-@pytest.fixture(scope="function")
+@pytest.fixture(scope="session")
 def modbus_client():
     """
-    提供一个全局唯一的 Modbus 连接实例（会话级别）
+    提供一个全局唯一的 Modbus 连接实例（会话级别），由连接管理器维持长连接，断开后自动重连
     """
-    import time
-    client = None
     try:
         config_path = os.path.join(os.path.dirname(__file__), 'Test_case', 'IOM', 'config.json')
         try:
@@ -35,15 +41,15 @@ def modbus_client():
                 config_data = json.load(f)
         except FileNotFoundError:
             # 使用默认配置
-            config_data = {'conn_mode': 'rtu', 'port': 'COM1', 'baudrate': 9600}
+            config_data = {'conn_mode': modbus_config['conn_mode']}
             logging.warning(f'未找到配置文件 {config_path}，使用默认配置')
         except json.JSONDecodeError:
             logging.error(f'配置文件 {config_path} 格式错误')
             raise
-        client = ModbusRtuOrTcp(conn_mode=config_data.get("conn_mode", "rtu"))
+        client = conn_manager.get(conn_mode=config_data.get("conn_mode"))
         logging.info(f"Modbus 客户端初始化完成 - 配置: {config_data}")
 
-        if not client.client.is_connected():
+        if not client.is_healthy():
             raise ConnectionError("Modbus 客户端连接失败")
 
         yield client
@@ -51,13 +57,57 @@ def modbus_client():
         logging.error(f"Modbus 客户端初始化失败: {str(e)}")
         raise
     finally:
-        if client:
-            try:
-                client.close()
-                time.sleep(0.5)  # 延长等待时间确保Windows释放串口资源
-                logging.info("Modbus 客户端已关闭")
-            except Exception as e:
-                logging.error(f"关闭 Modbus 客户端时出错: {str(e)}")
+        try:
+            conn_manager.close_all()
+            logging.info("Modbus 客户端已关闭")
+        except Exception as e:
+            logging.error(f"关闭 Modbus 客户端时出错: {str(e)}")
+
+
+# ================= 控源会话 Fixture ================= #
+@pytest.fixture(scope="session")
+def cl3021_source():
+    """
+    整个测试会话共用一个控源UDP会话（只绑定一次本地端口），各控源命令未传入source时也使用该会话
+    """
+    source = default_source()
+    yield source
+    close_default_source()
+
+
+@pytest.fixture()
+def dc_meter(cl3021_source):
+    """
+    用例期间在后台连续读取CL3021直流表，用例可通过 snapshot()/samples() 查看源输出的稳定过程
+    """
+    with Cl3021Meter('dc', source=cl3021_source) as meter:
+        yield meter
+    logging.info(f"直流表读取{meter.buffer.written}次，速率{meter.achieved_rate:.1f}次/秒，失败{meter.errors}次")
+
+
+@pytest.fixture()
+def board_snapshot(modbus_client, request: FixtureRequest):
+    """
+    用例前后各抓取一次板子的寄存器快照，用例结束后输出两次快照的差异
+    """
+    before = Snapshot.capture(modbus_client, name=f"{request.node.name} 前")
+    yield before
+    after = Snapshot.capture(modbus_client, name=f"{request.node.name} 后")
+    diffs = before.diff(after)
+    if diffs:
+        logging.info(f"{request.node.name} 寄存器变化:\n{format_diff(diffs)}")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """会话结束时由结果文件生成汇总报告"""
+    # 先关闭默认sink，生成结果文件
+    close_default_sink()
+    if not os.path.exists(result_file_path):
+        return
+    try:
+        generate_report(result_file_path, report_file_path)
+    except Exception as e:
+        logging.error(f"生成汇总报告失败: {str(e)}")
 
 
 # ================= 数据驱动 Fixture ================= #
@@ -74,7 +124,8 @@ def yaml_data(request):
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             try:
-                return yaml.safe_load(f)
+                # expected中的范围字符串在加载时统一解析为expected_ranges
+                return compile_expected(yaml.safe_load(f))
             except yaml.YAMLError as e:
                 pytest.fail(f"YAML 格式错误: {file_path}\n{str(e)}")
     except FileNotFoundError: